@@ -1,6 +1,15 @@
+from leaf.startup import install_import_profiler, PageTimer
+install_import_profiler()
+page_timer = PageTimer("LEAF_v0.0")
+
 import streamlit as st
 from streamlit_extras.switch_page_button import switch_page
 from PIL import Image
+from leaf.startup import import_report, page_load_report
+from leaf.llm import cache_stats, coalescing_stats, latency_report
+from leaf.scheduler import get_scheduler
+from leaf.exercise_pool import get_exercise_pool
+from leaf.pipeline import stage_report
 
 # Load the page icon
 im = Image.open("LEAF.ico")
@@ -180,6 +189,53 @@ with col4:
     if st.button("🎧 Listening"):
         switch_page("Listening")
 
+# Startup report: slowest first-time imports and page load latency
+with st.expander("⏱️ 启动报告"):
+    st.write("页面加载 (ms)")
+    st.table(page_load_report())
+    st.write("最慢的模块导入 (ms)")
+    st.table(import_report())
+
+# LLM calls per call site: latency, retries and failures
+with st.expander("📡 LLM 调用"):
+    st.table(latency_report())
+
+# Exercise pipelines: time per stage and how often a rerun reused a memoized output
+with st.expander("🧩 流水线阶段"):
+    st.table(stage_report())
+
+# Response cache: hits from memory and disk versus paid-for misses, plus
+# identical requests that shared another session's in-flight call
+with st.expander("🗃️ LLM 缓存"):
+    stats = cache_stats()
+    if stats:
+        st.table([stats])
+    else:
+        st.write("缓存已关闭")
+    st.write("合并的相同请求")
+    st.table([coalescing_stats()])
+
+# Rate-limit scheduler: waiting requests per priority class and bucket headroom per model
+with st.expander("🚦 LLM 调度"):
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        scheduler_stats = scheduler.stats()
+        st.table(scheduler_stats["classes"])
+        st.table(scheduler_stats["buckets"])
+        st.write(f"超时: {scheduler_stats['timeouts']}")
+    else:
+        st.write("调度器已关闭")
+
+# Pre-generated "随机生成" exercises ready per module and language
+with st.expander("🧺 练习池"):
+    pool = get_exercise_pool()
+    if pool is not None:
+        pool_stats = pool.stats()
+        st.write({key: value for key, value in pool_stats.items() if key != "pools"})
+        st.table(pool_stats["pools"])
+    else:
+        st.write("练习池已关闭")
+
 # Footer Section
 st.markdown("---")
 st.markdown(
@@ -191,3 +247,5 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Record this run of the page for the startup report
+page_timer.finish(st.session_state)
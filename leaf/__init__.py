@@ -0,0 +1 @@
+"""Shared services for the LEAF pages (speech recognition, LLM access, caching)."""
@@ -0,0 +1,237 @@
+"""Speech recognition helpers shared by the LEAF pages."""
+import io
+import os
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Whisper models expect 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# Map language to Whisper language code
+LANGUAGE_CODES = {
+    "English": "en",
+    "Japanese": "ja",
+    "German": "de",
+    "French": "fr",
+    "Arabic": "ar",
+    "Chinese": "zh",
+    "Spanish": "es",
+    "Russian": "ru",
+    "Korean": "ko",
+    "Greek": "el",
+    "Xhosa": "xh",
+}
+
+# Loaded Whisper models, keyed by their load settings, shared by every session
+_models = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+_load_locks = {}
+
+# Single background writer so archiving never blocks a submission
+_archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leaf-archive")
+
+
+def _proc_status_mb(field):
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Return the peak resident memory of this process in MB."""
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, Linux reports kilobytes
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except (ImportError, OSError):
+        return 0.0
+
+
+def current_rss_mb():
+    """Return the resident memory of this process in MB."""
+    rss = _proc_status_mb("VmRSS")
+    # Without /proc (macOS) the peak is the best figure available
+    return rss if rss is not None else peak_rss_mb()
+
+
+def get_whisper_model(size="medium", compute_type="int8", device="cpu", cpu_threads=8, num_workers=8):
+    """Return the process-wide Whisper model for these settings, loading it on first use.
+
+    Models are shared per (size, compute_type, device, cpu_threads, num_workers):
+    callers asking for other threading settings (e.g. the benchmark, or a pool
+    with a different thread budget) get their own instance rather than one
+    loaded with someone else's settings.
+    """
+    key = (size, compute_type, device, cpu_threads, num_workers)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # Only one session loads a given model; the others wait and reuse it
+    with load_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        from faster_whisper import WhisperModel
+
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        model = WhisperModel(size, device=device, compute_type=compute_type,
+                             cpu_threads=cpu_threads, num_workers=num_workers)
+        load_seconds = time.perf_counter() - start
+        rss_after = current_rss_mb()
+
+        _model_stats[key] = {
+            "size": size,
+            "compute_type": compute_type,
+            "device": device,
+            "cpu_threads": cpu_threads,
+            "num_workers": num_workers,
+            "load_seconds": round(load_seconds, 2),
+            "rss_delta_mb": round(rss_after - rss_before, 1),
+            "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        _models[key] = model
+        print(f"Loaded Whisper {size}/{compute_type} ({cpu_threads} threads, {num_workers} workers) "
+              f"in {load_seconds:.2f}s (+{rss_after - rss_before:.0f} MB)")
+        return model
+
+
+def model_stats():
+    """Return load time and memory figures for every model loaded in this process."""
+    return [dict(stats) for stats in _model_stats.values()]
+
+
+def decode_wav_bytes(audio_bytes, sample_rate=SAMPLE_RATE):
+    """Decode WAV bytes into a mono float32 array at the Whisper sample rate, without touching disk."""
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wf:
+            channels = wf.getnchannels()
+            sampwidth = wf.getsampwidth()
+            framerate = wf.getframerate()
+            frames = wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError):
+        # Not plain PCM WAV (e.g. compressed browser audio), let PyAV decode it in memory
+        from faster_whisper.audio import decode_audio
+        return decode_audio(io.BytesIO(audio_bytes), sampling_rate=sample_rate)
+
+    if sampwidth == 1:
+        audio = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sampwidth == 2:
+        audio = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif sampwidth == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8)
+                | (raw[:, 2].astype(np.int32) << 16))
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        audio = ints.astype(np.float32) / float(1 << 23)
+    elif sampwidth == 4:
+        audio = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sampwidth}")
+
+    return to_whisper_audio(audio, framerate, channels, sample_rate)
+
+
+def to_whisper_audio(audio, framerate, channels=1, sample_rate=SAMPLE_RATE):
+    """Downmix interleaved float samples to mono and resample them to the Whisper rate."""
+    audio = np.asarray(audio, dtype=np.float32)
+
+    # Downmix to mono
+    if channels > 1:
+        audio = audio[: len(audio) - len(audio) % channels].reshape(-1, channels).mean(axis=1)
+
+    # Resample to the target rate with linear interpolation
+    if framerate != sample_rate and len(audio) > 0:
+        duration = len(audio) / framerate
+        target_len = max(1, int(round(duration * sample_rate)))
+        src_times = np.arange(len(audio), dtype=np.float64) / framerate
+        dst_times = np.arange(target_len, dtype=np.float64) / sample_rate
+        audio = np.interp(dst_times, src_times, audio)
+
+    return np.ascontiguousarray(audio, dtype=np.float32)
+
+
+def encode_wav_bytes(audio, sample_rate=SAMPLE_RATE):
+    """Encode a mono float32 array as 16-bit PCM WAV bytes."""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    wav_io = io.BytesIO()
+    with wave.open(wav_io, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+    return wav_io.getvalue()
+
+
+def archive_audio(audio_bytes, filename):
+    """Write the recorded bytes to disk in the background and return the future."""
+    def _write():
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filename, "wb") as audio_file:
+            audio_file.write(audio_bytes)
+        return filename
+    return _archive_executor.submit(_write)
+
+
+def transcribe_audio(lang1, audio, model=None, **options):
+    """Transcribe a file path or a 16 kHz float32 array and return the text.
+
+    Extra keyword options are passed through to ``WhisperModel.transcribe``.
+    """
+    if model is None:
+        model = get_whisper_model()
+    try:
+        print("Starting transcription...")
+        # Transcribe the audio, specify language
+        segments, _ = model.transcribe(audio, language=lang1, **options)
+        # Extract and return the transcription text
+        transcription_text = ''.join(segment.text for segment in segments)
+        print("Transcription complete.")
+        return transcription_text
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return ""
+
+
+def transcribe_detailed(lang1, audio, model=None, **options):
+    """Transcribe with word timestamps and return the text, words and duration.
+
+    Each word is a dict with ``word``, ``start``, ``end`` and ``probability``.
+    """
+    if model is None:
+        model = get_whisper_model()
+    try:
+        segments, info = model.transcribe(audio, language=lang1, word_timestamps=True, **options)
+        text_parts = []
+        words = []
+        for segment in segments:
+            text_parts.append(segment.text)
+            for word in segment.words or []:
+                words.append({"word": word.word, "start": word.start, "end": word.end,
+                              "probability": word.probability})
+        return {"text": ''.join(text_parts), "words": words, "duration": info.duration}
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {"text": "", "words": [], "duration": 0.0}
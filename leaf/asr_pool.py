@@ -0,0 +1,249 @@
+"""Bounded transcription service: a fixed pool of Whisper workers behind a request queue."""
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from leaf import telemetry
+from leaf.asr import SAMPLE_RATE, get_whisper_model, transcribe_audio, transcribe_detailed
+from leaf.cache import TieredCache, hash_key
+from leaf.config import get_section
+from leaf.tiers import record_rtf
+
+# Lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class ServerBusy(Exception):
+    """Raised when the transcription queue is full."""
+
+
+class TranscriptionJob:
+    """A queued transcription request and its result."""
+
+    def __init__(self, priority, seq, lang1, audio, options, call_site="speaking.transcribe"):
+        self.priority = priority
+        self.seq = seq
+        self.lang1 = lang1
+        self.audio = audio
+        self.options = options
+        self.call_site = call_site
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.cache_key = None
+        self.cached = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    @property
+    def wait_seconds(self):
+        """Seconds spent in the queue (so far, if not started yet)."""
+        end = self.started_at if self.started_at is not None else time.perf_counter()
+        return end - self.enqueued_at
+
+    @property
+    def run_seconds(self):
+        """Seconds spent transcribing, once finished."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    @property
+    def audio_seconds(self):
+        """Duration of the queued audio, if it was passed as a sample array."""
+        if isinstance(self.audio, np.ndarray):
+            return len(self.audio) / SAMPLE_RATE
+        return None
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class TranscriptionService:
+    """Runs transcriptions on a fixed number of worker threads sized to the machine."""
+
+    def __init__(self, model_size="medium", compute_type="int8", threads_per_worker=4,
+                 workers=None, max_queue=16, cache=None):
+        cpu_count = os.cpu_count() or 1
+        self.threads_per_worker = max(1, min(threads_per_worker, cpu_count))
+        self.workers = workers or max(1, cpu_count // self.threads_per_worker)
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.max_queue = max_queue
+        self.cache = cache
+        self._queue = queue.PriorityQueue(maxsize=max_queue)
+        self._seq = itertools.count()
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=100)
+        self._completed = 0
+        self._rejected = 0
+        self._threads = []
+        # Background model loads, so no page waits for one while rendering
+        self._warm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leaf-asr-warm")
+        self._warming = {}
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"leaf-asr-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def model(self, size=None, compute_type=None):
+        """Return the shared model, loaded with this pool's thread budget."""
+        return get_whisper_model(size or self.model_size, compute_type or self.compute_type,
+                                 cpu_threads=self.threads_per_worker, num_workers=self.workers)
+
+    def warm(self, size=None, compute_type=None):
+        """Start loading a model in the background (once) and return its Future.
+
+        Submissions that need the model meanwhile wait for the same load.
+        """
+        key = (size or self.model_size, compute_type or self.compute_type)
+        with self._lock:
+            future = self._warming.get(key)
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._warming[key] = self._warm_executor.submit(self.model, *key)
+        return future
+
+    def warm_status(self):
+        """Return (size, compute_type, state) for every warmed model; state is loading, ready or failed."""
+        with self._lock:
+            warming = list(self._warming.items())
+        rows = []
+        for (size, compute_type), future in warming:
+            if not future.done():
+                state = "loading"
+            else:
+                state = "failed" if future.exception() is not None else "ready"
+            rows.append((size, compute_type, state))
+        return rows
+
+    def submit(self, lang1, audio, priority=PRIORITY_INTERACTIVE, call_site="speaking.transcribe", **options):
+        """Queue a transcription and return its job, or raise ServerBusy if the queue is full.
+
+        Repeat submissions of the same audio and settings are answered from the
+        cache with an already-finished job.
+        """
+        job = TranscriptionJob(priority, next(self._seq), lang1, audio, options, call_site)
+        if self.cache is not None and isinstance(audio, np.ndarray):
+            job.cache_key = self._cache_key(lang1, audio, options)
+            cached = self.cache.get(job.cache_key)
+            if cached is not None:
+                job.started_at = job.finished_at = job.enqueued_at
+                job.cached = True
+                telemetry.record("asr", call_site, 0.0, "cached", audio_seconds=job.audio_seconds)
+                job.future.set_result(cached)
+                return job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise ServerBusy(f"Transcription queue is full ({self.max_queue} waiting)")
+        return job
+
+    def _cache_key(self, lang1, audio, options):
+        settings = {key: value for key, value in options.items() if key != "tier"}
+        settings.setdefault("model_size", self.model_size)
+        settings.setdefault("compute_type", self.compute_type)
+        return hash_key(np.ascontiguousarray(audio, dtype=np.float32).tobytes(), lang1, settings)
+
+    def position(self, job):
+        """Return how many queued jobs are ahead of this one (0 once it is running)."""
+        if job.started_at is not None:
+            return 0
+        with self._queue.mutex:
+            return sum(1 for queued in self._queue.queue if queued < job)
+
+    def stats(self):
+        """Return queue depth, worker usage and wait times."""
+        with self._lock:
+            waits = sorted(self._waits)
+            busy = self._busy
+            completed = self._completed
+            rejected = self._rejected
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "busy": busy,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "completed": completed,
+            "rejected": rejected,
+            "avg_wait_seconds": round(sum(waits) / len(waits), 2) if waits else 0.0,
+            "p95_wait_seconds": round(telemetry.percentile(waits, 95), 2) if waits else 0.0,
+        }
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.perf_counter()
+            with self._lock:
+                self._busy += 1
+                self._waits.append(job.wait_seconds)
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    options = dict(job.options)
+                    tier = options.pop("tier", None)
+                    # Detailed jobs return a dict with word timestamps instead of plain text
+                    transcribe = transcribe_detailed if options.pop("detailed", False) else transcribe_audio
+                    model_size = options.pop("model_size", None) or self.model_size
+                    model = self.model(model_size, options.pop("compute_type", None))
+                    decode_start = time.perf_counter()
+                    result = transcribe(job.lang1, job.audio, model, **options)
+                    job.finished_at = time.perf_counter()
+                    # Feed the measured speed (excluding any model load) back into tier selection
+                    if tier and job.audio_seconds:
+                        record_rtf(tier, job.audio_seconds, job.finished_at - decode_start)
+                    # Failed transcriptions come back empty and are not worth remembering
+                    text = result["text"] if isinstance(result, dict) else result
+                    if job.cache_key and text:
+                        self.cache.put(job.cache_key, result)
+                    # transcribe_* log and swallow decoder errors, returning empty text
+                    telemetry.record("asr", job.call_site, job.finished_at - job.started_at,
+                                     "ok" if text else "error",
+                                     model=f"whisper-{model_size}", audio_seconds=job.audio_seconds,
+                                     wait_seconds=round(job.wait_seconds, 3))
+                    job.future.set_result(result)
+            except Exception as e:
+                telemetry.record("asr", job.call_site, time.perf_counter() - job.started_at, "error",
+                                 audio_seconds=job.audio_seconds)
+                job.future.set_exception(e)
+            finally:
+                if job.finished_at is None:
+                    job.finished_at = time.perf_counter()
+                with self._lock:
+                    self._busy -= 1
+                    self._completed += 1
+                self._queue.task_done()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_transcription_service():
+    """Return the process-wide transcription service, starting it on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                asr = get_section("asr")
+                _service = TranscriptionService(
+                    threads_per_worker=asr["threads_per_worker"],
+                    workers=asr["workers"] or None,
+                    max_queue=asr["max_queue"],
+                    cache=TieredCache(asr["cache_dir"], asr["cache_entries"]),
+                )
+    return _service
@@ -0,0 +1,189 @@
+"""ASR benchmark: word error rate, real-time factor, peak memory and load time per configuration.
+
+Corpus layout: one directory per language code, each clip next to a ``.txt``
+file with its reference transcript::
+
+    corpus/en/clip1.wav
+    corpus/en/clip1.txt
+    corpus/zh/clip1.wav
+    corpus/zh/clip1.txt
+
+Usage::
+
+    python -m leaf.benchmark corpus --sizes base small medium --compute-types int8 float32 \
+        --threads 4 8 --beam-sizes 1 5 --output bench.csv
+
+Each configuration runs in a fresh process so load times and peak RSS are not
+polluted by earlier runs.
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".flac", ".webm")
+
+# Languages written without spaces are scored per character
+CHARACTER_LANGUAGES = {"zh", "ja"}
+
+COLUMNS = ["lang", "model_size", "compute_type", "cpu_threads", "beam_size", "clips",
+           "audio_seconds", "wer", "rtf", "peak_rss_mb", "cold_load_seconds", "warm_load_seconds"]
+
+
+def normalize_text(text):
+    """Lowercase and strip punctuation so only the words are compared."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = ''.join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def tokenize(text, lang1):
+    text = normalize_text(text)
+    if lang1 in CHARACTER_LANGUAGES:
+        return [ch for ch in text if not ch.isspace()]
+    return text.split()
+
+
+def edit_distance(reference, hypothesis):
+    """Levenshtein distance between two token lists."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_token in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_token in enumerate(hypothesis, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (ref_token != hyp_token))
+        previous = current
+    return previous[-1]
+
+
+def word_error_rate(references, hypotheses, lang1):
+    """Corpus-level WER (CER for languages without word spacing)."""
+    errors = 0
+    total = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        ref_tokens = tokenize(reference, lang1)
+        errors += edit_distance(ref_tokens, tokenize(hypothesis, lang1))
+        total += len(ref_tokens)
+    return errors / total if total else 0.0
+
+
+def load_corpus(corpus_dir, languages=None):
+    """Return {lang1: [(audio_path, reference_text), ...]} for clips that have a reference."""
+    corpus = {}
+    for lang1 in sorted(os.listdir(corpus_dir)):
+        lang_dir = os.path.join(corpus_dir, lang1)
+        if not os.path.isdir(lang_dir) or (languages and lang1 not in languages):
+            continue
+        clips = []
+        for name in sorted(os.listdir(lang_dir)):
+            stem, ext = os.path.splitext(name)
+            reference_path = os.path.join(lang_dir, stem + ".txt")
+            if ext.lower() in AUDIO_EXTENSIONS and os.path.exists(reference_path):
+                with open(reference_path, encoding="utf-8") as reference_file:
+                    clips.append((os.path.join(lang_dir, name), reference_file.read().strip()))
+        if clips:
+            corpus[lang1] = clips
+    return corpus
+
+
+def run_config(config, corpus):
+    """Benchmark one configuration; runs inside a fresh worker process."""
+    os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
+    from faster_whisper import WhisperModel, decode_audio
+    from leaf.asr import SAMPLE_RATE, peak_rss_mb, transcribe_audio
+
+    def load():
+        start = time.perf_counter()
+        model = WhisperModel(config["model_size"], device="cpu", compute_type=config["compute_type"],
+                             cpu_threads=config["cpu_threads"], num_workers=1)
+        return model, time.perf_counter() - start
+
+    model, cold_load = load()
+    del model
+    model, warm_load = load()
+
+    rows = []
+    for lang1, clips in corpus.items():
+        references, hypotheses = [], []
+        audio_seconds = 0.0
+        decode_seconds = 0.0
+        for audio_path, reference in clips:
+            audio = decode_audio(audio_path, sampling_rate=SAMPLE_RATE)
+            audio_seconds += len(audio) / SAMPLE_RATE
+            start = time.perf_counter()
+            hypotheses.append(transcribe_audio(lang1, audio, model, beam_size=config["beam_size"]))
+            decode_seconds += time.perf_counter() - start
+            references.append(reference)
+        rows.append({
+            "lang": lang1,
+            **config,
+            "clips": len(clips),
+            "audio_seconds": round(audio_seconds, 1),
+            "wer": round(word_error_rate(references, hypotheses, lang1), 4),
+            "rtf": round(decode_seconds / audio_seconds, 3) if audio_seconds else 0.0,
+            "cold_load_seconds": round(cold_load, 2),
+            "warm_load_seconds": round(warm_load, 2),
+        })
+
+    peak = round(peak_rss_mb(), 1)
+    for row in rows:
+        row["peak_rss_mb"] = peak
+    return rows
+
+
+def format_table(rows):
+    """Render result rows as a Markdown table."""
+    lines = ["| " + " | ".join(COLUMNS) + " |", "|" + "---|" * len(COLUMNS)]
+    for row in rows:
+        lines.append("| " + " | ".join(str(row[column]) for column in COLUMNS) + " |")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Whisper configurations on a labelled corpus.")
+    parser.add_argument("corpus", help="directory with one sub-directory of clips per language code")
+    parser.add_argument("--languages", nargs="*", help="language codes to include (default: all)")
+    parser.add_argument("--sizes", nargs="+", default=["base", "small", "medium"])
+    parser.add_argument("--compute-types", nargs="+", default=["int8"])
+    parser.add_argument("--threads", nargs="+", type=int, default=[4, 8])
+    parser.add_argument("--beam-sizes", nargs="+", type=int, default=[1, 5])
+    parser.add_argument("--output", default="asr_benchmark.csv", help="CSV file to write")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus, args.languages)
+    if not corpus:
+        print(f"No labelled clips found under {args.corpus}")
+        return 1
+
+    configs = [
+        {"model_size": size, "compute_type": compute_type, "cpu_threads": threads, "beam_size": beam}
+        for size, compute_type, threads, beam in itertools.product(
+            args.sizes, args.compute_types, args.threads, args.beam_sizes)
+    ]
+
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for i, config in enumerate(configs, 1):
+        print(f"[{i}/{len(configs)}] {config}", flush=True)
+        # A fresh process per configuration keeps cold-load and peak RSS figures honest
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            rows.extend(executor.submit(run_config, config, corpus).result())
+
+    with open(args.output, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(format_table(rows))
+    print(f"Results saved as {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
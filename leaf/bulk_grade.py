@@ -0,0 +1,190 @@
+"""Headless grading of a folder of speaking recordings.
+
+Usage::
+
+    python -m leaf.bulk_grade recordings/ --lang English --output graded/
+
+Every audio file is one student (the file name without extension is the
+student id). Transcription runs in batches on one shared Whisper model and
+grading calls run with bounded concurrency. Each student gets
+``<output>/<student>.json``; students that already have a successful result are
+skipped, so an interrupted run can simply be started again. ``summary.csv`` is rebuilt from
+all result files at the end.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from leaf import telemetry
+from leaf.asr import LANGUAGE_CODES, SAMPLE_RATE, get_whisper_model, transcribe_detailed
+from leaf.benchmark import AUDIO_EXTENSIONS
+from leaf.fluency import fluency_metrics
+from leaf.routing import record_quality
+from leaf.speaking import analyze_transcription
+from leaf.tiers import select_tier
+
+SUMMARY_COLUMNS = ["student", "file", "audio_seconds", "score", "speech_rate", "pause_count",
+                   "filler_ratio", "status", "transcription"]
+
+
+def extract_score(analysis):
+    """Return the last 0-100 grade mentioned in an analysis, or None."""
+    matches = re.findall(r"(\d{1,3}(?:\.\d+)?)\s*(?:/\s*100|分)", analysis or "")
+    scores = [float(match) for match in matches if float(match) <= 100]
+    return scores[-1] if scores else None
+
+
+def find_recordings(input_dir):
+    """Return (student, path) pairs for every audio file in the directory."""
+    recordings = []
+    for name in sorted(os.listdir(input_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in AUDIO_EXTENSIONS:
+            recordings.append((stem, os.path.join(input_dir, name)))
+    return recordings
+
+
+def is_graded(output_dir, student):
+    """Return True if the student already has a successful result."""
+    path = os.path.join(output_dir, f"{student}.json")
+    if not os.path.exists(path):
+        return False
+    with open(path, encoding="utf-8") as result_file:
+        return json.load(result_file).get("status") == "ok"
+
+
+def write_result(output_dir, student, result):
+    """Write one student's result atomically so an interrupted run never leaves half a file."""
+    path = os.path.join(output_dir, f"{student}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as result_file:
+        json.dump(result, result_file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def write_summary(output_dir):
+    """Rebuild summary.csv from every result file in the output directory."""
+    rows = []
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(output_dir, name), encoding="utf-8") as result_file:
+                result = json.load(result_file)
+            fluency = result.get("fluency") or {}
+            rows.append({column: result.get(column, fluency.get(column)) for column in SUMMARY_COLUMNS})
+    summary_path = os.path.join(output_dir, "summary.csv")
+    with open(summary_path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return summary_path
+
+
+def grade(lang, lang1, student, path, transcription):
+    """Grade one transcription and return the student's result record."""
+    metrics = fluency_metrics(transcription["words"], transcription["duration"], lang1)
+    result = {"student": student, "file": path, "audio_seconds": round(transcription["duration"], 1),
+              "transcription": transcription["text"], "fluency": metrics}
+    if not transcription["text"].strip():
+        result.update(analysis=None, score=None, status="error: empty transcription")
+        return result
+    try:
+        analysis = analyze_transcription(lang, transcription["text"], metrics)
+        result.update(analysis=analysis, score=extract_score(analysis), status="ok")
+        # A grade that cannot be read back is a failed grading as far as the summary is concerned
+        record_quality("grading", "speaking.analyze_transcription", 0.0 if result["score"] is None else 1.0)
+    except Exception as e:
+        result.update(analysis=None, score=None, status=f"error: {e}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe and grade a folder of speaking recordings.")
+    parser.add_argument("input_dir", help="directory of recordings, one file per student")
+    parser.add_argument("--lang", default="English", choices=sorted(LANGUAGE_CODES))
+    parser.add_argument("--output", default="speaking/bulk", help="directory for results")
+    parser.add_argument("--batch-size", type=int, default=8, help="recordings transcribed together")
+    parser.add_argument("--concurrency", type=int, default=4, help="grading calls in flight")
+    parser.add_argument("--model-size", help="Whisper size (default: the language's tier from leaf.toml)")
+    parser.add_argument("--compute-type", default=None)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args(argv)
+
+    os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
+    os.makedirs(args.output, exist_ok=True)
+
+    recordings = find_recordings(args.input_dir)
+    todo = [(student, path) for student, path in recordings if not is_graded(args.output, student)]
+    print(f"{len(recordings)} recordings, {len(recordings) - len(todo)} already graded, {len(todo)} to do")
+    if not todo:
+        print(f"Summary saved as {write_summary(args.output)}")
+        return 0
+
+    from faster_whisper import decode_audio
+
+    lang1 = LANGUAGE_CODES[args.lang]
+    tier = select_tier(args.lang, 60)
+    batch_size = max(1, args.batch_size)
+    # One shared model; num_workers lets a whole batch decode in parallel
+    model = get_whisper_model(args.model_size or tier["model_size"],
+                              args.compute_type or tier["compute_type"],
+                              cpu_threads=max(1, args.threads // batch_size), num_workers=batch_size)
+
+    def transcribe(path):
+        try:
+            audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+        except Exception as e:
+            print(f"Could not decode {path}: {e}")
+            return {"text": "", "words": [], "duration": 0.0}
+        started = time.perf_counter()
+        result = transcribe_detailed(lang1, audio, model, beam_size=tier["beam_size"])
+        telemetry.record("asr", "bulk_grade.transcribe", time.perf_counter() - started,
+                         "ok" if result["text"] else "error",
+                         model=f"whisper-{args.model_size or tier['model_size']}",
+                         audio_seconds=len(audio) / SAMPLE_RATE)
+        return result
+
+    start = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=batch_size) as asr_pool, \
+            ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as llm_pool:
+        pending = []
+        for i in range(0, len(todo), batch_size):
+            batch = todo[i:i + batch_size]
+            transcripts = list(asr_pool.map(transcribe, [path for _, path in batch]))
+
+            # Grading overlaps with the next batch's transcription
+            for (student, path), transcription in zip(batch, transcripts):
+                pending.append(llm_pool.submit(grade, args.lang, lang1, student, path, transcription))
+
+            still_pending = []
+            for future in pending:
+                if future.done():
+                    result = future.result()
+                    write_result(args.output, result["student"], result)
+                    done += 1
+                else:
+                    still_pending.append(future)
+            pending = still_pending
+            elapsed = time.perf_counter() - start
+            print(f"Transcribed {min(i + batch_size, len(todo))}/{len(todo)}, graded {done} "
+                  f"({done / elapsed * 60:.1f} clips/min)", flush=True)
+
+        for future in pending:
+            result = future.result()
+            write_result(args.output, result["student"], result)
+            done += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"Graded {done} recordings in {elapsed:.0f}s ({done / elapsed * 60:.1f} clips/min)")
+    print(f"Summary saved as {write_summary(args.output)}")
+    telemetry.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""Two-tier (in-memory LRU + on-disk) cache for expensive results."""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _digest_bytes(value):
+    # Bytes nested inside JSON parts (e.g. audio in an exercise dict) stand in as their digest
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(value).hexdigest()
+    raise TypeError(f"Cannot hash {type(value).__name__}")
+
+
+def hash_key(*parts):
+    """Return a stable SHA-256 hex key for bytes, strings and JSON-serialisable parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            digest.update(part)
+        elif isinstance(part, str):
+            digest.update(part.encode("utf-8"))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False,
+                                     default=_digest_bytes).encode("utf-8"))
+        # Separator so ("ab", "c") and ("a", "bc") differ
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class TieredCache:
+    """LRU dictionary in memory, backed by one JSON file per entry on disk.
+
+    Entries older than ``ttl_seconds`` are treated as missing in both tiers; the
+    write time is stored inside each file, so reading an entry does not extend
+    its life. When the files pass ``max_disk_mb`` the least recently used ones
+    (by file mtime, refreshed on every read) are removed.
+    """
+
+    def __init__(self, directory, max_entries=256, ttl_seconds=None, max_disk_mb=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_mb * 1024 * 1024 if max_disk_mb else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def get(self, key):
+        """Return the cached value or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[1]):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._memory[key]
+
+        value, stored_at = self._read(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value, stored_at)
+        return value
+
+    def put(self, key, value):
+        """Store a JSON-serialisable value in memory and on disk."""
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, value, stored_at)
+        self._write(key, value, stored_at)
+        if self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def clear_memory(self):
+        """Drop the in-memory tier (the disk tier is kept)."""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        """Return hit/miss counters, the hit rate and the size of both tiers."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_mb": round(self._disk_bytes / (1024 * 1024), 2),
+                "evictions": self.evictions,
+            }
+
+    def _remember(self, key, value, stored_at):
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as cache_file:
+                entry = json.load(cache_file)
+            # Files without the write time predate it and are treated as expired
+            if not isinstance(entry, dict) or set(entry) != {"stored_at", "value"}:
+                return None, None
+            stored_at = entry["stored_at"]
+            if self._expired(stored_at):
+                return None, None
+            # Mark as recently used for size-based eviction; expiry uses stored_at
+            os.utime(path)
+            return entry["value"], stored_at
+        except (OSError, ValueError, TypeError):
+            return None, None
+
+    def _write(self, key, value, stored_at):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump({"stored_at": stored_at, "value": value}, cache_file, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        try:
+            size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += size
+
+    def _disk_entries(self):
+        """Yield (path, last_used, size) for every file in the disk tier."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def _evict_disk(self):
+        # Drop expired files, then least recently used ones, down to 90% of the cap.
+        # A file unused for longer than the TTL was also written before it, so it is expired.
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_disk_bytes * 0.9
+        for path, last_used, size in entries:
+            if total <= target and not self._expired(last_used):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        with self._lock:
+            self._disk_bytes = total
@@ -0,0 +1,161 @@
+"""Settings for the shared LEAF services, read from ``leaf.toml`` with built-in defaults."""
+import copy
+import os
+import tomllib
+
+CONFIG_PATH = os.environ.get(
+    "LEAF_CONFIG", os.path.join(os.path.dirname(os.path.dirname(__file__)), "leaf.toml")
+)
+
+DEFAULTS = {
+    "provider": {
+        # "openai" for the real API, "local" for the offline deterministic stand-in
+        "name": "openai",
+        "local": {
+            # Synthetic latency: time to the first token, then generation speed
+            "first_token_seconds": 0.4,
+            "tokens_per_second": 40.0,
+            "tts_seconds_per_audio_second": 0.1,
+            # Share of calls failing with a transient error, to exercise retries
+            "error_rate": 0.0,
+        },
+    },
+    "llm": {
+        # Per-attempt HTTP timeout and overall deadline for one call, in seconds
+        "timeout_seconds": 60,
+        "deadline_seconds": 120,
+        "max_attempts": 4,
+        # Exponential backoff cap is min(backoff_max, backoff_base * 2 ** attempt), fully jittered
+        "backoff_base": 1.0,
+        "backoff_max": 20.0,
+        # Response cache keyed on model, messages and sampling parameters
+        "cache_enabled": True,
+        "cache_dir": "cache/llm",
+        "cache_entries": 512,
+        "cache_ttl_seconds": 7 * 24 * 3600,
+        "cache_max_disk_mb": 200,
+    },
+    "scheduler": {
+        # Requests wait here for rate-limit headroom instead of drawing 429s
+        "enabled": True,
+        "max_wait_seconds": 120,
+        # Requests and tokens (max_tokens + estimated prompt) per minute, per model
+        "limits": {
+            "default": {"rpm": 500, "tpm": 30000},
+            "gpt-4": {"rpm": 500, "tpm": 10000},
+            "gpt-4o": {"rpm": 500, "tpm": 30000},
+            "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+        },
+    },
+    "conversation": {
+        # Prompt tokens per chat request; older turns are summarized to stay under it
+        "budget_tokens": 3000,
+        "keep_recent_turns": 6,
+        "summary_max_tokens": 300,
+    },
+    "routing": {
+        # Model, max_tokens and temperature per task; explicit arguments to chat() win
+        "prompt": {"model": "gpt-4o-mini", "max_tokens": 150, "temperature": 0.7},
+        "passage": {"model": "gpt-4o", "max_tokens": 1500, "temperature": 0.7},
+        "mcq": {"model": "gpt-4o", "max_tokens": 2000, "temperature": 0.7},
+        "grading": {"model": "gpt-4", "max_tokens": 2000, "temperature": 0.5},
+        # Explanations of wrong MCQ answers; the score itself is computed locally
+        "explanation": {"model": "gpt-4o-mini", "max_tokens": 1000, "temperature": 0.5},
+        "chat": {"model": "gpt-4o", "max_tokens": 1500, "temperature": 0.7},
+        "summary": {"model": "gpt-4o-mini", "max_tokens": 300, "temperature": 0.3},
+    },
+    "pool": {
+        # Ready "随机生成" exercises kept per module and language
+        "enabled": True,
+        "depth": 3,
+        "workers": 2,
+    },
+    "telemetry": {
+        # One record per LLM/TTS/ASR call, appended to dir/events-YYYYMMDD.jsonl
+        "enabled": True,
+        "dir": "telemetry",
+        # Prometheus text endpoint at http://bind:metrics_port/metrics (0 = off)
+        "metrics_port": 9464,
+        "bind": "127.0.0.1",
+        # USD per 1000 tokens (TTS: per 1000 characters) for the cost estimate
+        "prices": {
+            "gpt-4": {"prompt_per_1k": 0.03, "completion_per_1k": 0.06},
+            "gpt-4o": {"prompt_per_1k": 0.0025, "completion_per_1k": 0.01},
+            "gpt-4o-mini": {"prompt_per_1k": 0.00015, "completion_per_1k": 0.0006},
+            "gpt-3.5-turbo": {"prompt_per_1k": 0.0005, "completion_per_1k": 0.0015},
+            "tts-1": {"characters_per_1k": 0.015},
+        },
+    },
+    "asr": {
+        # Transcription pool: workers = cpu_count // threads_per_worker unless set
+        "threads_per_worker": 4,
+        "workers": 0,
+        "max_queue": 16,
+        # Transcription cache keyed by decoded audio, language and model settings
+        "cache_dir": "cache/asr",
+        "cache_entries": 256,
+        # Seconds of compute allowed per second of audio before stepping down a tier
+        "rtf_budget": 0.5,
+        # Forget a tier's measured RTF after this long so it can be retried
+        "rtf_retry_seconds": 300,
+        "fallback_order": ["medium", "small", "base"],
+        "tiers": {
+            "medium": {"model_size": "medium", "compute_type": "int8", "beam_size": 5},
+            "small": {"model_size": "small", "compute_type": "int8", "beam_size": 5},
+            "base": {"model_size": "base", "compute_type": "int8", "beam_size": 1},
+        },
+        "languages": {
+            "default": [{"max_duration": 0, "tier": "medium"}],
+        },
+    },
+    "writing": {
+        # Sentences per grading request, graded in parallel
+        "batch_size": 6,
+        # Sentence grades keyed by language, model and sentence text
+        "cache_dir": "cache/writing",
+        "cache_entries": 2048,
+        "cache_ttl_seconds": 30 * 24 * 3600,
+        # Share of the total from the sentence scores; the rest is the whole-text score
+        "language_weight": 0.7,
+    },
+}
+
+_config = None
+
+
+def _merge(base, override):
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def load_config(reload=False):
+    """Return the merged configuration (defaults overridden by ``leaf.toml`` if present)."""
+    global _config
+    if _config is None or reload:
+        config = copy.deepcopy(DEFAULTS)
+        if os.path.exists(CONFIG_PATH):
+            with open(CONFIG_PATH, "rb") as config_file:
+                _merge(config, tomllib.load(config_file))
+        _config = config
+    return _config
+
+
+def get_section(name):
+    """Return one top-level section of the configuration."""
+    return load_config().get(name, {})
+
+
+def openai_api_key():
+    """Return the OpenAI key from OPENAI_API_KEY or ``.streamlit/secrets.toml`` (for command-line tools)."""
+    key = os.environ.get("OPENAI_API_KEY")
+    if key:
+        return key
+    secrets_path = os.path.join(".streamlit", "secrets.toml")
+    if os.path.exists(secrets_path):
+        with open(secrets_path, "rb") as secrets_file:
+            return tomllib.load(secrets_file).get("openai", {}).get("token")
+    return None
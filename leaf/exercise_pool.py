@@ -0,0 +1,154 @@
+"""Pre-generated exercises for "随机生成", kept topped up by background workers.
+
+Random exercises do not depend on anything the student typed, so they can be
+produced before anyone asks. Each (kind, language) pair that has been asked
+for is refilled to ``depth`` ready items; ``random_exercise`` pops one
+(instant) and only generates on the spot when the pool is still empty.
+"""
+import queue
+import threading
+from collections import defaultdict, deque
+
+from leaf.config import get_section
+from leaf.scheduler import PRIORITY_PREFETCH, bind_session, priority_context
+
+
+def _listening(lang):
+    from leaf.listening import generate_listening_text, synthesize_wav
+
+    text = generate_listening_text(lang)
+    return {"text": text, "audio": synthesize_wav(text, call_site="pool.listening.speak")}
+
+
+def _listening_mcq(lang):
+    from leaf.listening import generate_listening_text, start_audio_and_questions
+
+    text = generate_listening_text(lang)
+    audio, questions = start_audio_and_questions(lang, text)
+    return {"text": text, "audio": audio.result(), "questions": questions.result()}
+
+
+def _reading(lang):
+    from leaf.reading import generate_questions, generate_reading_text_w
+
+    # The multiple-choice questions too, so "📝 选择题" is instant as well
+    text = generate_reading_text_w(lang)
+    return {"text": text, "questions": generate_questions(lang, text)}
+
+
+def _writing(lang):
+    from leaf.writing import generate_writing_prompt
+
+    return {"text": generate_writing_prompt(lang)}
+
+
+PRODUCERS = {
+    "listening": _listening,
+    "listening_mcq": _listening_mcq,
+    "reading": _reading,
+    "writing": _writing,
+}
+
+
+class ExercisePool:
+    """Per-kind, per-language queues of ready exercises and the workers that fill them."""
+
+    def __init__(self, producers, depth=3, workers=2):
+        self.producers = producers
+        self.depth = depth
+        self._ready = defaultdict(deque)
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self.served = 0
+        self.misses = 0
+        self.produced = 0
+        self.failures = 0
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"leaf-pool-{i}", daemon=True).start()
+
+    def want(self, kind, lang):
+        """Start filling the pool for this kind and language (called when a page opens)."""
+        self._top_up(kind, lang)
+
+    def take(self, kind, lang):
+        """Pop a ready exercise, or return None if none is ready yet; refills in the background."""
+        with self._lock:
+            ready = self._ready[(kind, lang)]
+            exercise = ready.popleft() if ready else None
+            if exercise is None:
+                self.misses += 1
+            else:
+                self.served += 1
+        self._top_up(kind, lang)
+        return exercise
+
+    def stats(self):
+        """Return counters and the number of ready and in-flight exercises per pool."""
+        with self._lock:
+            pools = [
+                {"kind": kind, "lang": lang, "ready": len(self._ready[(kind, lang)]),
+                 "pending": self._pending[(kind, lang)]}
+                for kind, lang in sorted(set(self._ready) | set(self._pending))
+            ]
+            return {"served": self.served, "misses": self.misses, "produced": self.produced,
+                    "failures": self.failures, "pools": pools}
+
+    def _top_up(self, kind, lang):
+        key = (kind, lang)
+        with self._lock:
+            missing = self.depth - len(self._ready[key]) - self._pending[key]
+            self._pending[key] += max(0, missing)
+        for _ in range(missing):
+            self._jobs.put(key)
+
+    def _worker(self):
+        # Prefetching yields to every student who is waiting on a call
+        bind_session("pool")
+        while True:
+            kind, lang = self._jobs.get()
+            try:
+                with priority_context(PRIORITY_PREFETCH):
+                    exercise = self.producers[kind](lang)
+                with self._lock:
+                    self._ready[(kind, lang)].append(exercise)
+                    self.produced += 1
+            except Exception as e:
+                # The next take() schedules another attempt
+                print(f"Exercise pool: failed to produce {kind}/{lang}: {e}")
+                with self._lock:
+                    self.failures += 1
+            finally:
+                with self._lock:
+                    self._pending[(kind, lang)] -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_exercise_pool():
+    """Return the process-wide exercise pool, or None when it is disabled."""
+    global _pool
+    settings = get_section("pool")
+    if not settings["enabled"]:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ExercisePool(PRODUCERS, depth=settings["depth"], workers=settings["workers"])
+    return _pool
+
+
+def prefill(kind, lang):
+    """Ask the pool to have exercises of this kind ready for this language."""
+    pool = get_exercise_pool()
+    if pool is not None:
+        pool.want(kind, lang)
+
+
+def random_exercise(kind, lang):
+    """Return a random exercise from the pool, generating one now if the pool is empty."""
+    pool = get_exercise_pool()
+    exercise = pool.take(kind, lang) if pool is not None else None
+    return exercise if exercise is not None else PRODUCERS[kind](lang)
@@ -0,0 +1,99 @@
+"""Local fluency metrics computed from Whisper word timestamps."""
+import re
+
+import numpy as np
+
+# Languages written without spaces: rates are counted in characters
+CHARACTER_LANGUAGES = {"zh", "ja"}
+
+# Common hesitation fillers per language code
+FILLERS = {
+    "en": {"um", "uh", "er", "erm", "ah", "hmm", "mm"},
+    "de": {"äh", "ähm", "hm", "öh"},
+    "fr": {"euh", "bah", "ben", "hein"},
+    "es": {"eh", "este", "pues", "em"},
+    "ru": {"э", "ээ", "эм", "ну"},
+    "zh": {"嗯", "呃", "额", "啊", "那个", "就是"},
+    "ja": {"えーと", "えっと", "あの", "えー", "あのー", "まあ"},
+    "ko": {"음", "어", "그", "저기"},
+    "ar": {"يعني", "اه", "ام"},
+    "el": {"εε", "εμ", "ε"},
+    "xh": {"eh", "mhm"},
+}
+
+PAUSE_SECONDS = 0.3
+LONG_PAUSE_SECONDS = 1.0
+LOW_CONFIDENCE = 0.5
+
+
+def _clean(word):
+    return re.sub(r"[^\w]", "", word).lower()
+
+
+def fluency_metrics(words, duration, lang1, max_low_confidence=8):
+    """Compute speech rate, pauses, filler ratio and low-confidence words."""
+    if not words:
+        return None
+    starts = np.array([w["start"] for w in words], dtype=np.float64)
+    ends = np.array([w["end"] for w in words], dtype=np.float64)
+    probs = np.array([w["probability"] for w in words], dtype=np.float64)
+    tokens = [_clean(w["word"]) for w in words]
+
+    # Pauses are gaps between consecutive words; leading and trailing silence is ignored
+    gaps = starts[1:] - ends[:-1]
+    pauses = gaps[gaps >= PAUSE_SECONDS]
+    spoken_span = max(ends[-1] - starts[0], 1e-6)
+    articulation_time = max(spoken_span - pauses.sum(), 1e-6)
+
+    if lang1 in CHARACTER_LANGUAGES:
+        units = sum(len(token) for token in tokens)
+        rate_unit = "chars/min"
+    else:
+        units = sum(1 for token in tokens if token)
+        rate_unit = "words/min"
+
+    fillers = FILLERS.get(lang1, set())
+    filler_mask = np.array([token in fillers for token in tokens])
+    filler_words = [tokens[i] for i in np.flatnonzero(filler_mask)]
+
+    low_idx = np.flatnonzero(probs < LOW_CONFIDENCE)
+    low_idx = low_idx[np.argsort(probs[low_idx])][:max_low_confidence]
+    low_confidence = [
+        {"word": words[i]["word"].strip(), "probability": round(float(probs[i]), 2),
+         "start": round(float(starts[i]), 1)}
+        for i in sorted(low_idx)
+    ]
+
+    return {
+        "duration": round(float(duration), 1),
+        "rate_unit": rate_unit,
+        "speech_rate": round(float(units / spoken_span * 60), 1),
+        "articulation_rate": round(float(units / articulation_time * 60), 1),
+        "pause_count": int(len(pauses)),
+        "long_pause_count": int((pauses >= LONG_PAUSE_SECONDS).sum()),
+        "mean_pause": round(float(pauses.mean()), 2) if len(pauses) else 0.0,
+        "max_pause": round(float(pauses.max()), 2) if len(pauses) else 0.0,
+        "filler_ratio": round(float(filler_mask.mean()), 3),
+        "fillers": sorted(set(filler_words)),
+        "mean_confidence": round(float(probs.mean()), 2),
+        "low_confidence_words": low_confidence,
+    }
+
+
+def format_metrics(metrics):
+    """Render the metrics as a compact block for the grading prompt."""
+    if not metrics:
+        return ""
+    low = ", ".join(f"{w['word']}({w['probability']})" for w in metrics["low_confidence_words"]) or "none"
+    fillers = ", ".join(metrics["fillers"]) or "none"
+    return (
+        f"duration={metrics['duration']}s; "
+        f"rate={metrics['speech_rate']} {metrics['rate_unit']} "
+        f"(articulation {metrics['articulation_rate']}); "
+        f"pauses>={PAUSE_SECONDS}s={metrics['pause_count']} "
+        f"(>= {LONG_PAUSE_SECONDS}s: {metrics['long_pause_count']}, mean {metrics['mean_pause']}s, "
+        f"max {metrics['max_pause']}s); "
+        f"filler_ratio={metrics['filler_ratio']:.1%} [{fillers}]; "
+        f"mean_asr_confidence={metrics['mean_confidence']}; "
+        f"low_confidence_words={low}"
+    )
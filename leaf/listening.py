@@ -0,0 +1,75 @@
+"""Listening exercise generation shared by the Listening page and the exercise pool."""
+import contextvars
+import io
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from leaf.llm import chat, speech_pcm
+from leaf.mcq import generate_mcqs
+
+# OpenAI TTS returns 24 kHz 16-bit mono PCM
+TTS_SAMPLE_RATE = 24000
+
+# Shared by every session; each request only waits on the network
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="leaf-listening")
+
+
+def generate_listening_text(lang, keywords=None):
+    """Generate listening text based on the language and optional keywords."""
+    if keywords:
+        messages = [
+            {
+                "role": "system",
+                "content": f"Please generate a {lang} paragraph based on the following keywords for students to practice listening:\n\nKeywords:\n{keywords}\n\n"
+            }
+        ]
+    else:
+        messages = [
+            {
+                "role": "system",
+                "content": f"Please generate a random {lang} paragraph for students to practice listening."
+            }
+        ]
+    return chat(
+        messages,
+        call_site="listening.generate_listening_text",
+        task="passage",
+        # "随机生成" should give a new text every time
+        cache=bool(keywords),
+    ).strip()
+
+
+def generate_questions(lang, reference_text):
+    """Generate five validated multiple-choice questions based on the reference text."""
+    return generate_mcqs(
+        lang,
+        reference_text,
+        call_site="listening.generate_questions",
+    )
+
+
+def synthesize_wav(text, call_site="listening.speak"):
+    """Synthesize speech for the text and return it as WAV bytes, without leading silence."""
+    pcm_data = speech_pcm(text, call_site=call_site)
+    # Skip the silent chunks at the start of the stream
+    start = 0
+    while start < len(pcm_data) and not any(pcm_data[start:start + 1024]):
+        start += 1024
+    wav_io = io.BytesIO()
+    with wave.open(wav_io, 'wb') as wf:
+        wf.setnchannels(1)  # Mono audio
+        wf.setsampwidth(2)  # 16-bit PCM
+        wf.setframerate(TTS_SAMPLE_RATE)
+        wf.writeframes(pcm_data[start:])
+    return wav_io.getvalue()
+
+
+def start_audio_and_questions(lang, text):
+    """Start TTS and question generation for the passage side by side.
+
+    Both only need the passage, so the total wait is the slower of the two.
+    Returns ``(audio_future, questions_future)``.
+    """
+    # Each worker runs in a copy of the caller's context, so the calls keep its session and priority
+    return (_executor.submit(contextvars.copy_context().run, synthesize_wav, text),
+            _executor.submit(contextvars.copy_context().run, generate_questions, lang, text))
@@ -0,0 +1,330 @@
+"""LLM gateway: deadlines, retries and per-call-site latency in front of the configured provider.
+
+Every page goes through ``chat`` (and ``speech_pcm`` for TTS) instead of
+calling ``openai`` directly, so a 429 or a stalled socket turns into a bounded
+wait and a retry rather than a spinner that never ends. Which backend answers
+(the OpenAI API or the local stand-in) is decided in ``leaf.providers``.
+"""
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+from leaf import routing, telemetry
+from leaf.cache import TieredCache, hash_key
+from leaf.config import get_section
+from leaf.providers import get_provider
+from leaf.scheduler import current_session, get_scheduler, priority_for
+from leaf.singleflight import SingleFlight
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# Identical cacheable requests in flight at the same time share one call
+_flights = SingleFlight()
+
+_latencies = defaultdict(lambda: deque(maxlen=500))
+_first_token = defaultdict(lambda: deque(maxlen=500))
+_counters = defaultdict(lambda: {"calls": 0, "errors": 0, "retries": 0})
+_stats_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """Raised when a call still fails after all retries or runs past its deadline."""
+
+
+def get_cache():
+    """Return the process-wide response cache, or None when it is disabled."""
+    global _cache
+    settings = get_section("llm")
+    if not settings["cache_enabled"]:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TieredCache(
+                    settings["cache_dir"],
+                    settings["cache_entries"],
+                    ttl_seconds=settings["cache_ttl_seconds"],
+                    max_disk_mb=settings["cache_max_disk_mb"],
+                )
+    return _cache
+
+
+def coalescing_stats():
+    """Return how many identical in-flight requests were answered by another caller's call."""
+    return _flights.stats()
+
+
+def cache_stats():
+    """Return the response cache's hit/miss counters (empty when disabled)."""
+    cache = get_cache()
+    return cache.stats() if cache is not None else {}
+
+
+def _record(call_site, seconds, attempts, ok):
+    with _stats_lock:
+        counters = _counters[call_site]
+        counters["calls"] += 1
+        counters["retries"] += attempts - 1
+        if ok:
+            _latencies[call_site].append(seconds)
+        else:
+            counters["errors"] += 1
+
+
+def attempt_timeout(deadline):
+    """Timeout for one attempt: what is left until the deadline, capped at [llm] timeout_seconds."""
+    return max(1.0, min(deadline - time.monotonic(), get_section("llm")["timeout_seconds"]))
+
+
+def with_retries(call_site, request, timeout=None):
+    """Run ``request(deadline)`` with jittered exponential backoff on transient errors.
+
+    ``deadline`` is a ``time.monotonic()`` value covering every attempt and any
+    time spent queued in the scheduler; ``request`` turns it into its own
+    timeout with ``attempt_timeout`` once it is ready to send.
+    """
+    settings = get_section("llm")
+    deadline = time.monotonic() + (timeout or settings["deadline_seconds"])
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            result = request(deadline)
+            _record(call_site, time.perf_counter() - start, attempt, True)
+            return result
+        except Exception as e:
+            if not get_provider().is_transient(e) or attempt >= settings["max_attempts"]:
+                _record(call_site, time.perf_counter() - start, attempt, False)
+                raise LLMError(f"{call_site} failed after {attempt} attempt(s): {e}") from e
+            # Full jitter: sleep a random amount up to the exponential cap
+            backoff = random.uniform(0, min(settings["backoff_max"], settings["backoff_base"] * 2 ** (attempt - 1)))
+            if time.monotonic() + backoff >= deadline:
+                _record(call_site, time.perf_counter() - start, attempt, False)
+                raise LLMError(f"{call_site} ran out of time after {attempt} attempt(s): {e}") from e
+            time.sleep(backoff)
+
+
+def chat(messages, call_site, task=None, model=None, max_tokens=None, temperature=None, timeout=None,
+         stream=False, cache=True, **params):
+    """Send a chat completion and return the reply text.
+
+    ``task`` ("prompt", "passage", "mcq", "grading", ...) picks the model,
+    max_tokens and temperature from the [routing] table; explicit arguments
+    override it.
+
+    With ``stream=True`` a generator of text deltas is returned instead, so the
+    page can show the first words while the rest is still being generated.
+
+    Identical requests are answered from the response cache, and identical
+    non-streamed requests made while one is still running wait for its reply
+    instead of making their own call. Pass ``cache=False`` when a fresh sample
+    is wanted (e.g. "随机生成").
+    """
+    model, max_tokens, temperature = routing.resolve(task, model, max_tokens, temperature)
+    provider = get_provider()
+    label = provider.label(model)
+    response_cache = get_cache() if cache else None
+    # Local stand-in replies must never be served to real sessions
+    key = hash_key(provider.name, model, messages, max_tokens, temperature, params) if cache else None
+    if response_cache is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            telemetry.record("llm", call_site, 0.0, "cached", model=label, task=task)
+            return iter([cached]) if stream else cached
+
+    if stream:
+        # The last chunk then carries the token usage for telemetry
+        params = dict(params, stream_options={"include_usage": True})
+
+    scheduler = get_scheduler()
+    tickets = []
+
+    def settle(usage):
+        if scheduler is not None and tickets:
+            scheduler.settle(tickets[-1], usage.prompt_tokens + usage.completion_tokens if usage else None)
+
+    def request(deadline):
+        if scheduler is not None:
+            # Every attempt waits for rate-limit headroom, retries included; the wait counts against the deadline
+            tickets.append(scheduler.acquire(model, _estimate_tokens(messages, max_tokens, model, params),
+                                             priority_for(task), current_session(), call_site, deadline))
+        try:
+            response = provider.chat(
+                attempt_timeout(deadline),
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=stream,
+                **params,
+            )
+        except Exception:
+            # A failed attempt generated nothing; give its whole estimate back before the retry
+            if scheduler is not None:
+                scheduler.settle(tickets[-1], 0)
+            raise
+        if not stream:
+            settle(response.usage)
+        return response
+
+    if stream:
+        return _stream_deltas(call_site, label, task, request, timeout, response_cache, key, settle)
+    if key is None:
+        return _complete(call_site, label, task, request, timeout)[0]
+
+    def lead():
+        # The previous identical call may have finished between the cache check and now
+        cached = response_cache.get(key) if response_cache is not None else None
+        if cached is not None:
+            return cached
+        text, truncated = _complete(call_site, label, task, request, timeout)
+        # A reply cut off at max_tokens (e.g. half an MCQ JSON) is not worth replaying
+        if response_cache is not None and text and not truncated:
+            response_cache.put(key, text)
+        return text
+
+    start = time.perf_counter()
+    text, shared = _flights.do(key, lead)
+    if shared:
+        telemetry.record("llm", call_site, time.perf_counter() - start, "coalesced", model=label, task=task)
+    return text
+
+
+def _complete(call_site, label, task, request, timeout):
+    # Returns the reply text and whether it was cut off at max_tokens
+    start = time.perf_counter()
+    try:
+        response = with_retries(call_site, request, timeout)
+    except LLMError:
+        telemetry.record("llm", call_site, time.perf_counter() - start, "error", model=label, task=task)
+        raise
+    usage = response.usage
+    truncated = response.choices[0].finish_reason == "length"
+    telemetry.record("llm", call_site, time.perf_counter() - start, "ok", model=label,
+                     prompt_tokens=usage.prompt_tokens if usage else None,
+                     completion_tokens=usage.completion_tokens if usage else None,
+                     task=task, truncated=truncated)
+    return _reply_text(response.choices[0].message), truncated
+
+
+def _estimate_tokens(messages, max_tokens, model, params):
+    # What the API counts against the tokens-per-minute limit before the reply is known
+    from leaf.memory import count_message_tokens, count_tokens
+
+    tokens = count_message_tokens(messages, model) + max_tokens
+    if "tools" in params:
+        tokens += count_tokens(json.dumps(params["tools"]), model)
+    return tokens
+
+
+def _reply_text(message):
+    # A forced function call carries its reply in the call's JSON arguments
+    if not message.content and message.tool_calls:
+        return message.tool_calls[0].function.arguments
+    return message.content
+
+
+def chat_json(messages, call_site, schema, name, description="", **kwargs):
+    """Ask for a reply matching a JSON schema via a forced function call and return it parsed.
+
+    Raises ValueError when the model returns arguments that are not valid JSON;
+    checking the content against the schema is up to the caller.
+    """
+    tool = {"type": "function", "function": {"name": name, "description": description, "parameters": schema}}
+    arguments = chat(
+        messages,
+        call_site,
+        tools=[tool],
+        tool_choice={"type": "function", "function": {"name": name}},
+        **kwargs,
+    )
+    return json.loads(arguments or "null")
+
+
+def _stream_deltas(call_site, model, task, request, timeout, response_cache=None, key=None, settle=None):
+    # Only opening the stream is retried; once text has been shown it cannot be taken back
+    start = time.perf_counter()
+    try:
+        response = with_retries(call_site, request, timeout)
+    except LLMError:
+        telemetry.record("llm", call_site, time.perf_counter() - start, "error", model=model, task=task)
+        raise
+    first = True
+    parts = []
+    usage = None
+    finish_reason = None
+    # "aborted" unless the page read the stream to the end
+    outcome = "aborted"
+    try:
+        for chunk in response:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first:
+                    with _stats_lock:
+                        _first_token[call_site].append(time.perf_counter() - start)
+                    first = False
+                parts.append(delta)
+                yield delta
+        outcome = "ok"
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        if settle is not None:
+            settle(usage)
+        telemetry.record("llm", call_site, time.perf_counter() - start, outcome, model=model,
+                         prompt_tokens=usage.prompt_tokens if usage else None,
+                         completion_tokens=usage.completion_tokens if usage else None,
+                         task=task, truncated=finish_reason == "length")
+    # Only a stream that ran to the end, and was not cut off at max_tokens, is worth replaying
+    if response_cache is not None and parts and finish_reason != "length":
+        response_cache.put(key, ''.join(parts))
+
+
+def speech_pcm(text, call_site, model="tts-1", voice="alloy", timeout=None):
+    """Synthesize speech and return raw 24 kHz 16-bit mono PCM bytes."""
+    provider = get_provider()
+    label = provider.label(model)
+
+    def request(deadline):
+        return provider.speech_pcm(text, model, voice, attempt_timeout(deadline))
+
+    start = time.perf_counter()
+    try:
+        pcm = with_retries(call_site, request, timeout)
+    except LLMError:
+        telemetry.record("tts", call_site, time.perf_counter() - start, "error", model=label,
+                         characters=len(text))
+        raise
+    telemetry.record("tts", call_site, time.perf_counter() - start, "ok", model=label, characters=len(text))
+    return pcm
+
+
+def latency_report():
+    """Return call count, errors, retries, latency and time-to-first-token per call site.
+
+    For streamed calls the latency covers opening the stream; the time until the
+    first word reached the page is reported separately.
+    """
+    rows = []
+    with _stats_lock:
+        for call_site, counters in sorted(_counters.items()):
+            latencies = sorted(_latencies[call_site])
+            first_token = sorted(_first_token[call_site])
+            rows.append({
+                "call_site": call_site,
+                **counters,
+                "p50_seconds": round(telemetry.percentile(latencies, 50), 2) if latencies else None,
+                "p95_seconds": round(telemetry.percentile(latencies, 95), 2) if latencies else None,
+                "first_token_p50_seconds": round(telemetry.percentile(first_token, 50), 2) if first_token else None,
+            })
+    return rows
@@ -0,0 +1,156 @@
+"""Load test of the exercise flows, offline by default.
+
+Usage::
+
+    python -m leaf.loadtest --sessions 30 --rounds 3 --flows listening reading writing speaking
+
+Each simulated session runs every chosen flow ``--rounds`` times, in its own
+thread, through the same ``leaf`` functions the pages use (generation, speech,
+MCQs, local scoring, grading). With ``--provider local`` (the default) every
+call is answered by the deterministic stand-in in ``leaf.providers``, so no key
+or network is needed; tune its synthetic latency in [provider.local].
+``--shared-keywords`` makes all sessions type the same keywords, as a class
+following a projected word list would.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+
+LANG = "English"
+
+SPEAKING_TRANSCRIPT = (
+    "Last weekend I visited my grandmother in the village. We cooked dinner together "
+    "and she told me stories about her childhood. I think it was the best day of the month."
+)
+
+
+def listening_flow(session, keywords):
+    from leaf.listening import generate_listening_text, start_audio_and_questions
+    from leaf.mcq import explain_mistakes, score_answers
+
+    text = generate_listening_text(LANG, keywords)
+    audio, questions = start_audio_and_questions(LANG, text)
+    audio.result()
+    questions = questions.result()
+    # Every student answers "A", so most explanations are needed
+    scoring = score_answers(questions, ["A"] * len(questions))
+    explain_mistakes(LANG, questions, scoring, call_site="listening.analyze_answers", task="explanation")
+
+
+def reading_flow(session, keywords):
+    from leaf.mcq import explain_mistakes, generate_mcqs, score_answers
+    from leaf.reading import generate_reading_text_w
+
+    text = generate_reading_text_w(LANG, keywords)
+    questions = generate_mcqs(LANG, text, call_site="reading.generate_questions")
+    scoring = score_answers(questions, ["B"] * len(questions))
+    explain_mistakes(LANG, questions, scoring, call_site="reading.analyze_user_answers", task="explanation")
+
+
+def writing_flow(session, keywords):
+    from leaf.writing import generate_writing_prompt, grade_writing
+
+    prompt = generate_writing_prompt(LANG, keywords)
+    # Only the last sentence changes between rounds, as in a revised essay
+    grade_writing(LANG, f"{SPEAKING_TRANSCRIPT} I wrote about {keywords}.", prompt)
+
+
+def speaking_flow(session, keywords):
+    from leaf.speaking import analyze_transcription
+
+    # Transcription is benchmarked separately (leaf.benchmark); this covers grading
+    ''.join(analyze_transcription(LANG, f"{SPEAKING_TRANSCRIPT} ({session})", stream=True))
+
+
+FLOWS = {
+    "listening": listening_flow,
+    "reading": reading_flow,
+    "writing": writing_flow,
+    "speaking": speaking_flow,
+}
+
+
+def run_session(session, flows, rounds, shared_keywords):
+    from leaf.scheduler import bind_session
+
+    # Each simulated student is its own session for fair queuing
+    bind_session(f"loadtest-{session}")
+    timings = []
+    for round_number in range(rounds):
+        keywords = "river, market, summer" if shared_keywords else f"session {session}, round {round_number}"
+        for name in flows:
+            start = time.perf_counter()
+            try:
+                FLOWS[name](session, keywords)
+                ok = True
+            except Exception as e:
+                print(f"session {session} {name}: {e}")
+                ok = False
+            timings.append((name, time.perf_counter() - start, ok))
+    return timings
+
+
+def format_report(timings, elapsed):
+    from leaf.telemetry import percentile
+
+    by_flow = defaultdict(list)
+    errors = defaultdict(int)
+    for name, seconds, ok in timings:
+        if ok:
+            by_flow[name].append(seconds)
+        else:
+            errors[name] += 1
+    lines = [f"{'flow':<12}{'runs':>6}{'errors':>8}{'p50 s':>8}{'p95 s':>8}{'max s':>8}"]
+    for name in sorted(set(by_flow) | set(errors)):
+        times = sorted(by_flow[name])
+        if times:
+            p50, p95, worst = percentile(times, 50), percentile(times, 95), times[-1]
+            lines.append(f"{name:<12}{len(times):>6}{errors[name]:>8}{p50:>8.2f}{p95:>8.2f}{worst:>8.2f}")
+        else:
+            lines.append(f"{name:<12}{0:>6}{errors[name]:>8}{'-':>8}{'-':>8}{'-':>8}")
+    lines.append(f"{len(timings)} flow runs in {elapsed:.1f} s ({len(timings) / elapsed * 60:.1f} per minute)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run concurrent simulated sessions through the exercise flows.")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated students")
+    parser.add_argument("--rounds", type=int, default=2, help="times each session runs each flow")
+    parser.add_argument("--flows", nargs="+", choices=sorted(FLOWS), default=sorted(FLOWS))
+    parser.add_argument("--provider", default="local", choices=["local", "openai"])
+    parser.add_argument("--shared-keywords", action="store_true",
+                        help="every session uses the same keywords (identical requests)")
+    args = parser.parse_args(argv)
+
+    # Must be set before the first call picks a provider
+    os.environ["LEAF_PROVIDER"] = args.provider
+    from leaf import telemetry
+    from leaf.llm import latency_report
+    from leaf.scheduler import get_scheduler
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        results = executor.map(run_session, range(args.sessions), [args.flows] * args.sessions,
+                               [args.rounds] * args.sessions, [args.shared_keywords] * args.sessions)
+        timings = [timing for result in results for timing in result]
+    elapsed = time.perf_counter() - start
+
+    print(format_report(timings, elapsed))
+    print()
+    for row in latency_report():
+        print(f"    {row['call_site']:<45} {row['calls']:>5} calls  p50 {row['p50_seconds']} s  "
+              f"p95 {row['p95_seconds']} s  errors {row['errors']}")
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        print()
+        for row in scheduler.stats()["classes"]:
+            print(f"    {row['class']:<12} {row['granted']:>5} granted  avg wait {row['avg_wait_seconds']} s")
+    telemetry.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
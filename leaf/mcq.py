@@ -0,0 +1,189 @@
+"""Multiple-choice question generation against one shared JSON schema.
+
+Questions come back as forced function-call arguments instead of free text,
+are checked locally, and only the items that fail the check are asked for
+again. Every question is ``{"question": str, "options": {"A".."D": str}, "answer": "A".."D"}``.
+"""
+import re
+
+from leaf.llm import chat, chat_json
+from leaf.routing import record_quality
+
+OPTION_KEYS = ("A", "B", "C", "D")
+
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "options": {
+            "type": "object",
+            "properties": {key: {"type": "string"} for key in OPTION_KEYS},
+            "required": list(OPTION_KEYS),
+        },
+        "answer": {"type": "string", "enum": list(OPTION_KEYS)},
+    },
+    "required": ["question", "options", "answer"],
+}
+
+MCQ_SCHEMA = {
+    "type": "object",
+    "properties": {"questions": {"type": "array", "items": QUESTION_SCHEMA}},
+    "required": ["questions"],
+}
+
+# Extra requests for missing or invalid questions before giving up
+REPAIR_ROUNDS = 2
+
+
+def validate_question(item):
+    """Return the question in canonical form, or None if it does not fit the schema.
+
+    Small drifts are repaired locally: options given as a list, lower-case or
+    decorated answer letters ("b)", "Answer: C") and stray whitespace.
+    """
+    if not isinstance(item, dict):
+        return None
+    question = item.get("question")
+    options = item.get("options")
+    answer = item.get("answer")
+    if isinstance(options, list) and len(options) == len(OPTION_KEYS):
+        options = dict(zip(OPTION_KEYS, options))
+    if not isinstance(question, str) or not question.strip() or not isinstance(options, dict):
+        return None
+    options = {str(key).strip().upper()[:1]: value for key, value in options.items()}
+    if set(options) != set(OPTION_KEYS):
+        return None
+    if not all(isinstance(options[key], str) and options[key].strip() for key in OPTION_KEYS):
+        return None
+    if not isinstance(answer, str):
+        return None
+    letter = _answer_letter(answer)
+    if letter is None:
+        return None
+    return {
+        "question": question.strip(),
+        "options": {key: options[key].strip() for key in OPTION_KEYS},
+        "answer": letter,
+    }
+
+
+def _answer_letter(answer):
+    # The letter the answer starts with ("b) because", "C) A dog"), else the one
+    # after "Answer"/"answer is", else the first upper-case standalone letter;
+    # later letters may belong to the option text (the "A" in "C) A dog")
+    match = (re.match(r"\W*([A-D])\b", answer, re.IGNORECASE)
+             or re.search(r"\banswer(?:\s+is)?\W*([A-D])\b", answer, re.IGNORECASE)
+             or re.search(r"\b([A-D])\b", answer))
+    return match.group(1).upper() if match else None
+
+
+def _request(lang, reference_text, count, call_site, existing, **kwargs):
+    content = (
+        f"Write {count} multiple-choice questions in {lang} about the text below. "
+        f"Each question has four options A-D and exactly one correct answer.\n\n"
+        f"Text:\n{reference_text}"
+    )
+    if existing:
+        # Repair round: ask only for the missing questions, and not the same ones again
+        content += "\n\nDo not repeat these questions:\n" + "\n".join(q["question"] for q in existing)
+    reply = chat_json(
+        [{"role": "user", "content": content}],
+        call_site,
+        MCQ_SCHEMA,
+        name="submit_questions",
+        description="Submit the multiple-choice questions.",
+        **kwargs,
+    )
+    return reply.get("questions", []) if isinstance(reply, dict) else []
+
+
+def generate_mcqs(lang, reference_text, call_site, count=5, task="mcq", **kwargs):
+    """Return up to ``count`` validated questions about the text.
+
+    Extra keyword arguments (model, max_tokens, temperature, ...) go to the chat call.
+    The share of valid questions in the first reply is recorded as the task's quality.
+    """
+    kwargs["task"] = task
+    questions = []
+    for round_number in range(REPAIR_ROUNDS + 1):
+        # Repair rounds must not be answered from the response cache
+        options = kwargs if round_number == 0 else dict(kwargs, cache=False)
+        try:
+            items = _request(lang, reference_text, count - len(questions),
+                             call_site if round_number == 0 else f"{call_site}.repair",
+                             questions, **options)
+        except ValueError as e:
+            # Arguments that are not even JSON count as all items invalid
+            print(f"{call_site}: unreadable questions: {e}")
+            items = []
+        seen = {q["question"] for q in questions}
+        for item in items:
+            question = validate_question(item)
+            if question and question["question"] not in seen:
+                questions.append(question)
+                seen.add(question["question"])
+        if round_number == 0:
+            record_quality(task, call_site, min(1.0, len(questions) / count), model=kwargs.get("model"))
+        if len(questions) >= count:
+            break
+    return questions[:count]
+
+
+def score_answers(questions, answers):
+    """Score answers (letters, in question order) locally; returns the score out of 100 and per-question results."""
+    results = []
+    for question, answer in zip(questions, answers):
+        answer = (answer or "").strip().upper()[:1]
+        results.append({
+            "question": question["question"],
+            "answer": answer,
+            "correct_answer": question["answer"],
+            "correct": answer == question["answer"],
+        })
+    correct = sum(result["correct"] for result in results)
+    return {
+        "score": round(100 * correct / len(questions)) if questions else 0,
+        "correct": correct,
+        "total": len(questions),
+        "results": results,
+    }
+
+
+def format_score(scoring):
+    """One line per question plus the total, for the page and the saved analysis."""
+    lines = [
+        f"{i}. {'✅' if result['correct'] else '❌'} {result['answer'] or '-'} ({result['correct_answer']})"
+        for i, result in enumerate(scoring["results"], 1)
+    ]
+    lines.append(f"Total Score: {scoring['score']}/100")
+    return "\n".join(lines)
+
+
+def explain_mistakes(lang, questions, scoring, call_site, stream=False, **kwargs):
+    """Ask the LLM to explain only the questions answered wrongly; returns None when all are correct."""
+    wrong = [
+        (i, question, result)
+        for i, (question, result) in enumerate(zip(questions, scoring["results"]), 1)
+        if not result["correct"]
+    ]
+    if not wrong:
+        return None
+    items = []
+    for i, question, result in wrong:
+        chosen = question["options"].get(result["answer"], "No Answer")
+        items.append(
+            f"{i}. {question['question']}\n"
+            f"Student: {result['answer'] or '-'}. {chosen}\n"
+            f"Correct: {result['correct_answer']}. {question['options'][result['correct_answer']]}"
+        )
+    content = (
+        f"A student answered these {lang} multiple-choice questions wrongly. "
+        "For each one, explain briefly in Chinese why the correct answer is right and the student's is not.\n\n"
+        + "\n\n".join(items)
+    )
+    return chat(
+        [{"role": "user", "content": content}],
+        call_site,
+        stream=stream,
+        **kwargs,
+    )
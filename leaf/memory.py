@@ -0,0 +1,117 @@
+"""Token-budgeted conversation memory for the chat practice mode.
+
+Recent turns are sent verbatim; once the request would exceed the budget the
+oldest turns are folded into a rolling summary, so each request stays roughly
+the same size however long the session runs. Tokens are counted locally with
+tiktoken when it is installed, otherwise estimated from the text.
+"""
+import unicodedata
+from functools import lru_cache
+
+from leaf.config import get_section
+from leaf.llm import chat
+from leaf.routing import route
+
+# Per-message overhead of the chat format (role and separators), in tokens
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model="gpt-4"):
+    """Count the tokens of a text for the model (an estimate if tiktoken is not installed)."""
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Roughly one token per CJK character and per four other characters
+    wide = sum(1 for ch in text if unicodedata.east_asian_width(ch) in ("W", "F"))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def count_message_tokens(messages, model="gpt-4"):
+    """Count the tokens a list of chat messages takes in a request."""
+    return sum(MESSAGE_OVERHEAD + count_tokens(m["content"], model) for m in messages) + 2
+
+
+class ConversationMemory:
+    """Full chat history for display, and a budgeted view of it for the model."""
+
+    def __init__(self, budget_tokens=3000, keep_recent=6, summary_tokens=300, model="gpt-4",
+                 call_site="listening.chat.summary"):
+        self.budget_tokens = budget_tokens
+        self.keep_recent = keep_recent
+        self.summary_tokens = summary_tokens
+        self.model = model
+        self.call_site = call_site
+        self.turns = []
+        self.summary = ""
+        # Turns before this index are covered by the summary
+        self.summarized = 0
+
+    def add(self, role, content):
+        self.turns.append({"role": role, "content": content})
+
+    def messages(self):
+        """Return the messages to send: the summary (if any) followed by the unsummarized turns."""
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}",
+            })
+        messages.extend({"role": t["role"], "content": t["content"]} for t in self.turns[self.summarized:])
+        return messages
+
+    def tokens(self):
+        return count_message_tokens(self.messages(), self.model)
+
+    def compact(self):
+        """Fold the oldest turns into the summary until the request fits the budget.
+
+        Keeps ``keep_recent`` turns verbatim, and at least the latest exchange
+        when single turns are very long.
+        """
+        for keep in (self.keep_recent, 2):
+            if self.tokens() <= self.budget_tokens:
+                break
+            end = len(self.turns) - keep
+            if end > self.summarized:
+                self._fold(self.turns[self.summarized:end])
+                self.summarized = end
+        return self.messages()
+
+    def _fold(self, turns):
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+        content = (
+            "Update the summary of this language practice conversation with the new turns. "
+            "Keep names, topics, facts the user shared and mistakes they made. Be brief.\n\n"
+            f"Current summary:\n{self.summary or '(none)'}\n\nNew turns:\n{transcript}"
+        )
+        self.summary = chat(
+            [{"role": "user", "content": content}],
+            call_site=self.call_site,
+            task="summary",
+            max_tokens=self.summary_tokens,
+        ).strip()
+
+
+def new_conversation_memory(call_site="listening.chat.summary"):
+    """Return an empty memory sized from the [conversation] settings, counting tokens for the chat model."""
+    settings = get_section("conversation")
+    return ConversationMemory(
+        budget_tokens=settings["budget_tokens"],
+        keep_recent=settings["keep_recent_turns"],
+        summary_tokens=settings["summary_max_tokens"],
+        model=route("chat")["model"],
+        call_site=call_site,
+    )
@@ -0,0 +1,157 @@
+"""Small asyncio engine for exercise flows (generate → save → questions → parse).
+
+A page declares its stages and what each one needs; ``Pipeline.run`` starts
+every stage as soon as its inputs are ready, so independent stages (TTS and
+question generation, for example) overlap. Outputs are memoized in a dict the
+caller keeps per session: a stage whose inputs have not changed since the last
+run is not executed again. Every stage is timed for ``stage_report``.
+"""
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+
+from leaf.cache import hash_key
+from leaf.telemetry import percentile
+
+# Interval between on_tick calls while a run is in progress
+TICK_SECONDS = 0.25
+
+_stage_times = defaultdict(lambda: deque(maxlen=500))
+_stage_counters = defaultdict(lambda: {"runs": 0, "memo_hits": 0, "errors": 0})
+_stats_lock = threading.Lock()
+
+
+class Stage:
+    """One step of a pipeline.
+
+    ``func`` is called with the values named in ``deps`` (pipeline inputs or
+    other stages), in order. Blocking stages run on a worker thread; ``inline``
+    stages run on the calling thread, which is where Streamlit calls are allowed.
+    """
+
+    def __init__(self, name, func, deps=(), inline=False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.inline = inline
+
+
+class PipelineRun:
+    """Outputs of one run, and how long each stage took (0 when memoized)."""
+
+    def __init__(self):
+        self.outputs = {}
+        self.timings = {}
+
+    def __getitem__(self, name):
+        return self.outputs[name]
+
+    def get(self, name, default=None):
+        return self.outputs.get(name, default)
+
+
+class Pipeline:
+    """A named set of stages forming a DAG."""
+
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+
+    def run(self, inputs, memo=None, targets=None, on_stage=None, on_tick=None):
+        """Run the stages needed for ``targets`` (default: all) and return a PipelineRun.
+
+        ``memo`` maps stage name to ``(key, output)`` from earlier runs and is
+        updated in place. ``on_stage(name, output)`` is called on the calling
+        thread as each stage finishes, so a page can render partial results.
+        ``on_tick()`` is called on the calling thread a few times a second
+        while stages are running (e.g. to show the queue position).
+        """
+        return asyncio.run(self._run(inputs, {} if memo is None else memo, targets, on_stage, on_tick))
+
+    def _needed(self, targets):
+        needed = set()
+        pending = list(targets or self.stages)
+        while pending:
+            name = pending.pop()
+            if name in needed or name not in self.stages:
+                continue
+            needed.add(name)
+            pending.extend(self.stages[name].deps)
+        return needed
+
+    async def _run(self, inputs, memo, targets, on_stage, on_tick):
+        result = PipelineRun()
+        tasks = {}
+
+        async def resolve(name):
+            if name in inputs:
+                return inputs[name]
+            if name not in tasks:
+                raise KeyError(f"Pipeline {self.name}: unknown input or stage {name!r}")
+            return await tasks[name]
+
+        async def run_stage(stage):
+            values = await asyncio.gather(*(resolve(dep) for dep in stage.deps))
+            key = hash_key(stage.name, *values)
+            memoized = memo.get(stage.name)
+            hit = memoized is not None and memoized[0] == key
+            if hit:
+                output, seconds = memoized[1], 0.0
+                _record(self.name, stage.name, None)
+            else:
+                start = time.perf_counter()
+                try:
+                    if stage.inline:
+                        output = stage.func(*values)
+                    else:
+                        output = await asyncio.to_thread(stage.func, *values)
+                except Exception:
+                    _record(self.name, stage.name, None, error=True)
+                    raise
+                seconds = time.perf_counter() - start
+                _record(self.name, stage.name, seconds)
+                memo[stage.name] = (key, output)
+            result.outputs[stage.name] = output
+            result.timings[stage.name] = {"seconds": round(seconds, 3), "memoized": hit}
+            if on_stage is not None:
+                on_stage(stage.name, output)
+            return output
+
+        for name in self._needed(targets):
+            tasks[name] = asyncio.ensure_future(run_stage(self.stages[name]))
+        stages = asyncio.gather(*tasks.values())
+        if on_tick is not None:
+            while not stages.done():
+                on_tick()
+                await asyncio.wait([stages], timeout=TICK_SECONDS)
+        await stages
+        return result
+
+
+def _record(pipeline, stage, seconds, error=False):
+    key = f"{pipeline}.{stage}"
+    with _stats_lock:
+        counters = _stage_counters[key]
+        if error:
+            counters["errors"] += 1
+        elif seconds is None:
+            counters["memo_hits"] += 1
+        else:
+            counters["runs"] += 1
+            _stage_times[key].append(seconds)
+
+
+def stage_report():
+    """Return runs, memo hits, errors and latency per pipeline stage."""
+    rows = []
+    with _stats_lock:
+        for key, counters in sorted(_stage_counters.items()):
+            times = sorted(_stage_times[key])
+            rows.append({
+                "stage": key,
+                **counters,
+                "p50_seconds": round(percentile(times, 50), 2) if times else None,
+                "p95_seconds": round(percentile(times, 95), 2) if times else None,
+            })
+    return rows
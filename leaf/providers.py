@@ -0,0 +1,249 @@
+"""Backends for chat completions and speech synthesis.
+
+``leaf.llm`` talks to a provider instead of to ``openai`` directly. The
+``openai`` provider is the real API; the ``local`` provider answers every
+request on the machine with deterministic, well-formed output (passages,
+function-call JSON that matches the requested schema, graded feedback with a
+score, PCM speech) after a configurable synthetic delay, so the whole app can
+run and be load-tested without a key or a network. Choose one with
+``[provider] name`` in ``leaf.toml`` or the ``LEAF_PROVIDER`` environment variable.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from leaf.cache import hash_key
+from leaf.config import get_section, openai_api_key
+
+# Sample rate of the PCM returned by speech synthesis (OpenAI's "pcm" format)
+PCM_SAMPLE_RATE = 24000
+
+
+class OpenAIProvider:
+    """The OpenAI API, through one pooled client shared by every session."""
+
+    name = "openai"
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import openai
+
+                    # Retries are handled by leaf.llm so the backoff and deadline apply to every call
+                    self._client = openai.OpenAI(
+                        api_key=openai_api_key(),
+                        timeout=get_section("llm")["timeout_seconds"],
+                        max_retries=0,
+                    )
+        return self._client
+
+    def chat(self, timeout, **request):
+        return self.client().chat.completions.create(timeout=timeout, **request)
+
+    def speech_pcm(self, text, model, voice, timeout):
+        with self.client().audio.speech.with_streaming_response.create(
+            model=model,
+            voice=voice,
+            response_format="pcm",
+            input=text,
+            timeout=timeout,
+        ) as response:
+            return b''.join(response.iter_bytes(chunk_size=4096))
+
+    def is_transient(self, error):
+        import openai
+
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError,
+                              openai.RateLimitError, openai.InternalServerError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code in (408, 409, 429)
+
+    def label(self, model):
+        """Model name as recorded in telemetry (and priced)."""
+        return model
+
+
+class LocalProviderError(Exception):
+    """A synthetic transient failure, injected at [provider.local] error_rate."""
+
+
+WORDS = (
+    "morning market river teacher garden window library station friend summer city music "
+    "story letter bridge island village kitchen mountain museum weekend family journey "
+    "walks reads visits finds opens remembers explains prepares watches discovers "
+    "quietly early together slowly often carefully near before after with"
+).split()
+
+
+class LocalProvider:
+    """Deterministic stand-in for the API: the same request always gets the same reply."""
+
+    name = "local"
+
+    def __init__(self, first_token_seconds=0.4, tokens_per_second=40.0,
+                 tts_seconds_per_audio_second=0.1, error_rate=0.0):
+        self.first_token_seconds = first_token_seconds
+        self.tokens_per_second = tokens_per_second
+        self.tts_seconds_per_audio_second = tts_seconds_per_audio_second
+        self.error_rate = error_rate
+
+    def chat(self, timeout, model, messages, max_tokens, temperature, stream=False, tools=None,
+             tool_choice=None, **params):
+        self._maybe_fail()
+        rng = random.Random(hash_key(model, messages, temperature, tools))
+        prompt = "\n".join(m["content"] for m in messages)
+        if tools:
+            function = tools[0]["function"]
+            text = json.dumps(_instance(function["parameters"], rng, _requested_count(prompt)),
+                              ensure_ascii=False)
+        elif "100-point" in prompt:
+            text = _feedback(rng)
+        else:
+            text = _passage(rng, max_tokens)
+        completion_tokens = _count(text)
+        finish_reason = "stop"
+        if completion_tokens > max_tokens:
+            # Cut like the API would, so truncation shows up in telemetry
+            text = " ".join(text.split()[:max_tokens * 3 // 4])
+            completion_tokens, finish_reason = _count(text), "length"
+        usage = SimpleNamespace(prompt_tokens=_count(prompt), completion_tokens=completion_tokens)
+        if stream:
+            return self._stream(text, finish_reason, usage)
+        time.sleep(self.first_token_seconds + completion_tokens / self.tokens_per_second)
+        tool_calls = None
+        if tools:
+            tool_calls = [SimpleNamespace(function=SimpleNamespace(name=tools[0]["function"]["name"],
+                                                                    arguments=text))]
+        message = SimpleNamespace(content=None if tools else text, tool_calls=tool_calls)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)],
+                               usage=usage)
+
+    def _stream(self, text, finish_reason, usage):
+        time.sleep(self.first_token_seconds)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(_count(word) / self.tokens_per_second)
+            last = i == len(words) - 1
+            choice = SimpleNamespace(delta=SimpleNamespace(content=word if last else word + " "),
+                                     finish_reason=finish_reason if last else None)
+            yield SimpleNamespace(choices=[choice], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    def speech_pcm(self, text, model, voice, timeout):
+        """One short tone per word (pitch from the word), after a little leading silence."""
+        # Imported here so the pages do not load NumPy at startup
+        import numpy as np
+
+        self._maybe_fail()
+        rate = PCM_SAMPLE_RATE
+        word_samples = int(0.3 * rate)
+        fade = np.minimum(1.0, np.minimum(np.arange(word_samples), np.arange(word_samples)[::-1]) / (0.02 * rate))
+        t = np.arange(word_samples) / rate
+        parts = [np.zeros(int(0.1 * rate))]
+        for word in text.split():
+            pitch = 180 + int(hash_key(word)[:4], 16) % 220
+            parts.append(0.3 * np.sin(2 * np.pi * pitch * t) * fade)
+            parts.append(np.zeros(int(0.08 * rate)))
+        samples = np.concatenate(parts)
+        time.sleep(self.first_token_seconds + len(samples) / rate * self.tts_seconds_per_audio_second)
+        return (samples * 32767).astype("<i2").tobytes()
+
+    def is_transient(self, error):
+        return isinstance(error, LocalProviderError)
+
+    def label(self, model):
+        # Kept apart from real calls in telemetry, and never priced
+        return f"local/{model}"
+
+    def _maybe_fail(self):
+        if self.error_rate and random.random() < self.error_rate:
+            time.sleep(self.first_token_seconds)
+            raise LocalProviderError("synthetic 429 from the local provider")
+
+
+def _count(text):
+    # Same rough estimate as leaf.memory without tiktoken: a CJK character or four other characters
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _requested_count(prompt):
+    match = re.search(r"\b(?:Write|Grade the) (\d+)\b", prompt)
+    return int(match.group(1)) if match else 3
+
+
+def _sentence(rng, words=8):
+    sentence = " ".join(rng.choice(WORDS) for _ in range(words))
+    return sentence[0].upper() + sentence[1:] + "."
+
+
+def _passage(rng, max_tokens):
+    # About 60% of the limit, so ordinary calls are not cut off
+    sentences = max(1, min(12, int(max_tokens * 0.6) // 12))
+    return " ".join(_sentence(rng, rng.randint(6, 10)) for _ in range(sentences))
+
+
+def _feedback(rng):
+    score = rng.randint(60, 95)
+    lines = [f"{i}. {_sentence(rng)} 建议: {_sentence(rng, 5)}" for i in range(1, 4)]
+    return "\n".join(lines) + f"\n\n总分: {score}/100"
+
+
+def _instance(schema, rng, count, index=0, name=None):
+    """A value matching a JSON schema: objects, arrays of ``count`` items, strings, enums, numbers."""
+    kind = schema.get("type")
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if kind == "object":
+        return {key: _instance(value, rng, count, index, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_instance(schema["items"], rng, count, i + 1) for i in range(count)]
+    if kind in ("integer", "number"):
+        # Items that refer back to numbered input (e.g. sentences) echo their position
+        if name == "index" and index:
+            return index
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 100))
+    if kind == "boolean":
+        return rng.random() < 0.5
+    # Numbered so that generated items (e.g. questions) are distinct
+    return f"{index}. {_sentence(rng, 6)}" if index else _sentence(rng, 6)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def provider_name():
+    """The configured provider: LEAF_PROVIDER, else [provider] name."""
+    return os.environ.get("LEAF_PROVIDER") or get_section("provider")["name"]
+
+
+def get_provider():
+    """Return the process-wide provider."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                name = provider_name()
+                if name == "local":
+                    local = get_section("provider")["local"]
+                    _provider = LocalProvider(
+                        first_token_seconds=local["first_token_seconds"],
+                        tokens_per_second=local["tokens_per_second"],
+                        tts_seconds_per_audio_second=local["tts_seconds_per_audio_second"],
+                        error_rate=local["error_rate"],
+                    )
+                elif name == "openai":
+                    _provider = OpenAIProvider()
+                else:
+                    raise ValueError(f"Unknown provider {name!r} (expected 'openai' or 'local')")
+    return _provider
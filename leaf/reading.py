@@ -0,0 +1,31 @@
+"""Reading exercise generation shared by the Reading page and the exercise pool."""
+from leaf.llm import chat
+from leaf.mcq import generate_mcqs
+
+
+def generate_reading_text_w(lang, keywords=None):
+    """Generate a reading passage followed by several questions on it."""
+    if keywords:
+        messages = [
+            {"role": "system", "content": f"Please generate an {lang} paragraph based on the following keywords for students to practice reading:\n\nKeywords:\n{keywords}\n\nPlease also generate several questions based on the {lang} paragraph in {lang}."}
+        ]
+    else:
+        messages = [
+            {"role": "system", "content": f"Please generate a random {lang} paragraph for students to practice reading. Please also generate several questions based on the {lang} paragraph in {lang}."}
+        ]
+    return chat(
+        messages,
+        call_site="reading.generate_reading_text_w",
+        task="passage",
+        # "随机生成" should give a new text every time
+        cache=bool(keywords),
+    )
+
+
+def generate_questions(lang, reference_text):
+    """Generate five validated multiple-choice questions based on the text."""
+    return generate_mcqs(
+        lang,
+        reference_text,
+        call_site="reading.generate_questions",
+    )
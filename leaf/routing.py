@@ -0,0 +1,42 @@
+"""Model routing: which model, token limit and temperature each kind of task uses.
+
+Call sites name their task (``chat(..., task="passage")``) instead of hard-coding
+a model, and the [routing] table in ``leaf.toml`` decides. Short, cheap tasks
+such as writing prompts can go to a fast model while grading keeps the
+strongest one. Telemetry records the task with every call, and ``record_quality``
+adds task-specific quality signals, so the table can be tuned from the
+Telemetry page.
+"""
+from leaf import telemetry
+from leaf.config import get_section
+from leaf.providers import get_provider
+
+# Used for calls that name no task
+DEFAULT_ROUTE = {"model": "gpt-4", "max_tokens": 1000, "temperature": 0.7}
+
+
+def route(task):
+    """Return the model, max_tokens and temperature configured for a task."""
+    if task is None:
+        return dict(DEFAULT_ROUTE)
+    routes = get_section("routing")
+    if task not in routes:
+        raise KeyError(f"No [routing.{task}] entry in the configuration")
+    return {**DEFAULT_ROUTE, **routes[task]}
+
+
+def resolve(task, model=None, max_tokens=None, temperature=None):
+    """Fill in whatever the caller did not set explicitly from the task's route."""
+    settings = route(task)
+    return (
+        model if model is not None else settings["model"],
+        max_tokens if max_tokens is not None else settings["max_tokens"],
+        temperature if temperature is not None else settings["temperature"],
+    )
+
+
+def record_quality(task, call_site, value, model=None):
+    """Record a quality signal between 0 and 1 for one result of a task (e.g. share of valid MCQs)."""
+    if model is None:
+        model = route(task)["model"]
+    telemetry.record_quality(task, call_site, get_provider().label(model), value)
@@ -0,0 +1,258 @@
+"""Process-wide LLM request scheduler: rate limits, priorities and fairness across sessions.
+
+Every chat request takes a ticket before it is sent. A ticket is granted when
+the model's token buckets have room for one more request and for
+``max_tokens`` plus the estimated prompt tokens (requests per minute and
+tokens per minute, as OpenAI counts them), so bursts queue here instead of
+coming back as 429s. Waiting tickets are served by priority class
+(interactive grading, then interactive generation, then background prefetch)
+and, within a class, from the session served least recently, so one busy
+session cannot starve the others. Once the reply is in, the unused part of
+the token estimate is given back.
+
+The session and priority of a request come from context variables, set by
+the pages (``bind_session``) and the exercise pool (``priority_context``).
+"""
+import itertools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from leaf.config import get_section
+
+PRIORITY_GRADING = 0
+PRIORITY_GENERATION = 1
+PRIORITY_PREFETCH = 2
+PRIORITY_NAMES = {PRIORITY_GRADING: "grading", PRIORITY_GENERATION: "generation", PRIORITY_PREFETCH: "prefetch"}
+
+# Routed tasks whose result a student is waiting to see graded
+GRADING_TASKS = {"grading", "explanation"}
+
+_session = ContextVar("leaf_session", default=None)
+_priority = ContextVar("leaf_priority", default=None)
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a request waited longer than [scheduler] max_wait_seconds, or past its deadline, for a slot."""
+
+
+def bind_session(session_id):
+    """Attribute the requests made from the current context to this session."""
+    _session.set(session_id)
+
+
+def current_session():
+    return _session.get()
+
+
+@contextmanager
+def priority_context(priority):
+    """Send the requests made inside the block with this priority (e.g. prefetch from a background worker)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def priority_for(task):
+    """Priority of a request: the context's if set, else from its routed task."""
+    priority = _priority.get()
+    if priority is not None:
+        return priority
+    return PRIORITY_GRADING if task in GRADING_TASKS else PRIORITY_GENERATION
+
+
+class TokenBucket:
+    """Refills continuously up to ``per_minute``."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_seconds(self, amount):
+        """Seconds until ``amount`` is available (at most a full bucket is ever asked for)."""
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+
+class Ticket:
+    def __init__(self, seq, model, tokens, priority, session, call_site):
+        self.seq = seq
+        self.model = model
+        self.tokens = tokens
+        self.priority = priority
+        self.session = session
+        self.call_site = call_site
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class Scheduler:
+    """Grants request tickets within per-model RPM/TPM limits, by priority and session fairness."""
+
+    def __init__(self, limits, max_wait_seconds=120):
+        self.limits = limits
+        self.max_wait_seconds = max_wait_seconds
+        self._buckets = {}
+        self._waiting = []
+        self._seq = itertools.count()
+        self._grants = itertools.count(1)
+        # Grant number of each session's last request, for least-recently-served ordering
+        self._last_served = {}
+        self._cond = threading.Condition()
+        self._next_wake = 1.0
+        self._granted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._waited = {name: 0.0 for name in PRIORITY_NAMES.values()}
+        self._timeouts = 0
+
+    def acquire(self, model, tokens, priority=PRIORITY_GENERATION, session=None, call_site="", deadline=None):
+        """Block until the request may be sent; returns its ticket for ``settle``.
+
+        Gives up with SchedulerTimeout after max_wait_seconds, or earlier at the
+        caller's ``deadline`` (a ``time.monotonic()`` value).
+        """
+        ticket = Ticket(next(self._seq), model, tokens, priority, session, call_site)
+        with self._cond:
+            self._waiting.append(ticket)
+            limit = ticket.enqueued_at + self.max_wait_seconds
+            deadline = limit if deadline is None else min(limit, deadline)
+            while True:
+                self._dispatch()
+                if ticket.granted:
+                    return ticket
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._timeouts += 1
+                    # Others may fit now that this one has left the queue
+                    self._cond.notify_all()
+                    raise SchedulerTimeout(f"{call_site}: no {model} capacity before the deadline "
+                                           f"(waited {time.monotonic() - ticket.enqueued_at:.1f} s)")
+                self._cond.wait(min(remaining, self._next_wake))
+
+    def settle(self, ticket, actual_tokens):
+        """Give back the part of the ticket's token estimate the request did not use."""
+        if actual_tokens is None:
+            return
+        with self._cond:
+            _, tpm = self._model_buckets(ticket.model)
+            tpm.refill(time.monotonic())
+            tpm.tokens = min(tpm.capacity, tpm.tokens + max(0, min(ticket.tokens, tpm.capacity) - actual_tokens))
+            self._cond.notify_all()
+
+    def position(self, session):
+        """Number of waiting requests ahead of this session's first one, or None if it has none waiting."""
+        with self._cond:
+            for i, ticket in enumerate(self._order()):
+                if ticket.session == session:
+                    return i
+        return None
+
+    def stats(self):
+        """Waiting requests and grants per priority class, average wait, timeouts and bucket levels."""
+        with self._cond:
+            now = time.monotonic()
+            classes = []
+            for priority, name in PRIORITY_NAMES.items():
+                granted = self._granted[name]
+                classes.append({
+                    "class": name,
+                    "waiting": sum(1 for t in self._waiting if t.priority == priority),
+                    "granted": granted,
+                    "avg_wait_seconds": round(self._waited[name] / granted, 2) if granted else 0.0,
+                })
+            buckets = []
+            for model, (rpm, tpm) in sorted(self._buckets.items()):
+                rpm.refill(now)
+                tpm.refill(now)
+                buckets.append({"model": model, "requests_left": int(rpm.tokens), "rpm": rpm.capacity,
+                                "tokens_left": int(tpm.tokens), "tpm": tpm.capacity})
+            return {"classes": classes, "buckets": buckets, "timeouts": self._timeouts}
+
+    def _model_buckets(self, model):
+        if model not in self._buckets:
+            limits = self.limits.get(model, self.limits["default"])
+            self._buckets[model] = (TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]))
+        return self._buckets[model]
+
+    def _order(self):
+        # Within a class, sessions take turns: each session's n-th waiting request
+        # comes after every session's (n-1)-th, least recently served session first
+        nth = defaultdict(int)
+        ranked = []
+        for ticket in sorted(self._waiting, key=lambda t: t.seq):
+            rank = nth[(ticket.priority, ticket.session)]
+            nth[(ticket.priority, ticket.session)] += 1
+            ranked.append(((ticket.priority, rank, self._last_served.get(ticket.session, 0), ticket.seq), ticket))
+        return [ticket for _, ticket in sorted(ranked, key=lambda item: item[0])]
+
+    def _dispatch(self):
+        # Grant one ticket at a time so the session order is updated between grants
+        now = time.monotonic()
+        granted = False
+        while True:
+            wake = None
+            blocked = set()
+            for ticket in self._order():
+                # A waiting request may not be overtaken by later ones for the same model
+                if ticket.model in blocked:
+                    continue
+                rpm, tpm = self._model_buckets(ticket.model)
+                rpm.refill(now)
+                tpm.refill(now)
+                need = min(ticket.tokens, tpm.capacity)
+                if rpm.tokens >= 1 and tpm.tokens >= need:
+                    rpm.tokens -= 1
+                    tpm.tokens -= need
+                    self._grant(ticket, now)
+                    granted = True
+                    break
+                blocked.add(ticket.model)
+                seconds = max(rpm.wait_seconds(1), tpm.wait_seconds(need))
+                wake = seconds if wake is None else min(wake, seconds)
+            else:
+                self._next_wake = max(0.05, wake) if wake is not None else 1.0
+                break
+        if granted:
+            self._cond.notify_all()
+
+    def _grant(self, ticket, now):
+        ticket.granted = True
+        self._waiting.remove(ticket)
+        self._last_served[ticket.session] = next(self._grants)
+        name = PRIORITY_NAMES[ticket.priority]
+        self._granted[name] += 1
+        self._waited[name] += now - ticket.enqueued_at
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, or None when it is disabled."""
+    global _scheduler
+    settings = get_section("scheduler")
+    if not settings["enabled"]:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler(settings["limits"], settings["max_wait_seconds"])
+    return _scheduler
+
+
+def queue_position(session=None):
+    """Requests ahead of the session's first waiting one (None when nothing of it is queued)."""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return None
+    return scheduler.position(session if session is not None else current_session())
@@ -0,0 +1,75 @@
+"""Sentence segmentation for the languages LEAF teaches.
+
+Rule-based and local: a sentence ends at terminal punctuation (plus any
+closing quotes or brackets). Latin, Cyrillic, Greek, Korean and Arabic
+punctuation must be followed by a space or the end of the line, and a
+following lower-case word means an abbreviation ("e.g. the"), not a new
+sentence. Known abbreviations that are followed by a capitalised word
+("Dr. Smith", "Mrs. Brown") never end a sentence either. CJK full-width
+punctuation ends a sentence on its own, since Chinese and Japanese are written
+without spaces. Line breaks always end a sentence.
+"""
+
+# Terminal punctuation that needs a following space; Greek uses ";" as its question mark
+TERMINATORS = {
+    "default": ".!?…",
+    "Greek": ".!;\u037e…",
+    "Arabic": ".!?؟۔…",
+}
+
+# Full-width terminators, a sentence end wherever they appear
+WIDE_TERMINATORS = "。！？．｡"
+
+CLOSERS = "\"'”’)]}»」』）】〉》"
+
+# Lower-case abbreviations (including their final ".") that never end a sentence.
+# Ones that often do end one ("etc.", "usw.") are left out: before a lower-case
+# word they are recognised anyway.
+ABBREVIATIONS = {
+    "default": {"mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "jr.", "sr.", "vs.", "e.g.", "i.e.", "fig.", "approx."},
+    "French": {"m.", "mme.", "mlle.", "pr.", "ste.", "cf."},
+    "Spanish": {"sra.", "srta.", "dra.", "ud.", "uds.", "pág."},
+    "German": {"hr.", "fr.", "nr.", "str.", "bzw.", "ca.", "z.b.", "d.h."},
+    "Italian": {"sig.", "sig.ra", "dott."},
+    "Portuguese": {"sra.", "dra."},
+    "Russian": {"г.", "т.е.", "стр.", "ул."},
+}
+
+
+def _continues(line, start, i, j, abbreviations):
+    # After an abbreviation the text goes on in lower case, or it is a known one ("Dr. Smith")
+    rest = line[j:].lstrip()
+    if rest and rest[0].islower():
+        return True
+    words = line[start:i + 1].split()
+    return bool(words) and words[-1].lower().lstrip("\"'(“‘«") in abbreviations
+
+
+def split_sentences(text, lang=None):
+    """Split text into sentences, in order, without surrounding whitespace."""
+    terminators = TERMINATORS.get(lang, TERMINATORS["default"])
+    abbreviations = ABBREVIATIONS.get(lang, set()) | ABBREVIATIONS["default"]
+    sentences = []
+    for line in text.splitlines():
+        start = 0
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if ch not in terminators and ch not in WIDE_TERMINATORS:
+                i += 1
+                continue
+            # Take "?!", "..." and closing quotes along with the terminator
+            j = i + 1
+            while j < len(line) and (line[j] in terminators or line[j] in WIDE_TERMINATORS or line[j] in CLOSERS):
+                j += 1
+            wide = ch in WIDE_TERMINATORS
+            if wide or j == len(line) or (line[j].isspace() and not _continues(line, start, i, j, abbreviations)):
+                sentence = line[start:j].strip()
+                if sentence:
+                    sentences.append(sentence)
+                start = j
+            i = j
+        rest = line[start:].strip()
+        if rest:
+            sentences.append(rest)
+    return sentences
@@ -0,0 +1,49 @@
+"""Single-flight: concurrent identical requests share one in-flight call.
+
+When a class types the same keywords at the same moment, the first request
+runs and every identical request that arrives while it is still running waits
+for that result instead of paying for its own call.
+"""
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; later callers with the same key wait for it."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """Return ``(func(), shared)``; ``shared`` is True when another caller's result was reused.
+
+        An exception raised by the running call is raised in every waiting caller too.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(), True
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,36 @@
+"""Speaking exercise grading shared by the Speaking page and the bulk grading command."""
+from leaf.fluency import format_metrics
+from leaf.llm import chat
+
+
+def analyze_transcription(lang, transcription, metrics=None, stream=False):
+    """Grade a transcribed speaking exercise, using local fluency metrics when available."""
+    # The model cannot hear the audio; measured timing and ASR confidence stand in for it
+    measurements = ""
+    if metrics:
+        measurements = (
+            f"Measured from the audio (use these for fluency and pronunciation; low ASR confidence "
+            f"often means unclear pronunciation):\n{format_metrics(metrics)}\n\n"
+        )
+    messages = [
+        {
+            "role": "system",
+            "content": f"You are a helpful assistant who analyzes the quality of {lang} speech and gives grades to students. Make sure to reply directly without saying sure or yes."
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Please analyze the following {lang} speech of a student for pronunciation, fluency, and grammatical aspects. "
+                f"Please do this one sentence at a time in Chinese:\n\n"
+                f"{transcription}\n\n"
+                f"{measurements}"
+                "Note: please use a 100-point grading scale and show the grade at the end. Provide detailed feedback in Chinese and also list the original transcription, the potential improved transcription, and where you deducted points."
+            )
+        }
+    ]
+    return chat(
+        messages,
+        call_site="speaking.analyze_transcription",
+        task="grading",
+        stream=stream,
+    )
@@ -0,0 +1,143 @@
+"""Cold-start measurement: per-module import times and page load times.
+
+``install_import_profiler()`` must run before the heavy imports of a script,
+so pages call it (and start their ``PageTimer``) on their first lines. Only the first import of a module in the
+process is timed, which is exactly the cost a new server process pays.
+
+``python -m leaf.startup`` imports each page's dependencies in a fresh
+interpreter and prints the slowest modules.
+"""
+import builtins
+import json
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+_original_import = builtins.__import__
+_import_times = {}
+_stack = threading.local()
+_installed = False
+
+_page_loads = defaultdict(list)
+_page_lock = threading.Lock()
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Relative and already-loaded imports cost nothing worth reporting
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    frames = getattr(_stack, "frames", None)
+    if frames is None:
+        frames = _stack.frames = []
+    frames.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = frames.pop()
+        if frames:
+            frames[-1] += elapsed
+        if name not in _import_times:
+            _import_times[name] = {"total_ms": elapsed * 1000, "self_ms": (elapsed - children) * 1000}
+
+
+def install_import_profiler():
+    """Start timing first-time imports in this process (idempotent)."""
+    global _installed
+    if not _installed:
+        builtins.__import__ = _timed_import
+        _installed = True
+
+
+def import_report(limit=15):
+    """Return the slowest imports as dicts sorted by inclusive time."""
+    rows = [{"module": name, "total_ms": round(t["total_ms"], 1), "self_ms": round(t["self_ms"], 1)}
+            for name, t in _import_times.items()]
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows[:limit]
+
+
+def record_page_load(page, seconds, first_in_session):
+    """Record how long one run of a page script took."""
+    with _page_lock:
+        _page_loads[page].append({"seconds": seconds, "first_in_session": first_in_session,
+                                  "at": time.time()})
+        del _page_loads[page][:-200]
+
+
+def page_load_report():
+    """Return first-load and rerun latency per page, in milliseconds."""
+    rows = []
+    with _page_lock:
+        for page, loads in sorted(_page_loads.items()):
+            first = sorted(load["seconds"] for load in loads if load["first_in_session"])
+            reruns = sorted(load["seconds"] for load in loads if not load["first_in_session"])
+            rows.append({
+                "page": page,
+                "first_loads": len(first),
+                "first_load_p50_ms": round(first[len(first) // 2] * 1000) if first else None,
+                "first_load_max_ms": round(first[-1] * 1000) if first else None,
+                "rerun_p50_ms": round(reruns[len(reruns) // 2] * 1000) if reruns else None,
+            })
+    return rows
+
+
+class PageTimer:
+    """Times one run of a page script, from before its imports to ``finish``."""
+
+    def __init__(self, page):
+        self.page = page
+        self.start = time.perf_counter()
+
+    def finish(self, session_state):
+        flag = f"_leaf_loaded_{self.page}"
+        first_in_session = flag not in session_state
+        session_state[flag] = True
+        record_page_load(self.page, time.perf_counter() - self.start, first_in_session)
+
+
+# Modules each page needs before it can render, for the cold-start command
+PAGE_IMPORTS = {
+    "LEAF_v0.0": ["streamlit", "streamlit_extras.switch_page_button", "PIL.Image"],
+    "Speaking": ["streamlit", "leaf.ui", "audio_recorder_streamlit",
+                 "leaf.asr_pool", "leaf.streaming", "leaf.fluency", "leaf.speaking"],
+    "Listening": ["streamlit", "leaf.ui", "leaf.llm", "leaf.listening", "leaf.exercise_pool",
+                  "leaf.pipeline", "leaf.memory"],
+    "Reading": ["streamlit", "leaf.ui", "leaf.llm", "leaf.reading", "leaf.exercise_pool", "leaf.pipeline"],
+    "Writing": ["streamlit", "leaf.ui", "leaf.llm", "leaf.writing", "leaf.sentences", "leaf.exercise_pool", "leaf.pipeline"],
+    "Telemetry": ["streamlit", "leaf.telemetry"],
+}
+
+
+def measure_cold_imports(modules):
+    """Import modules in a fresh interpreter and return (total_ms, per-module report)."""
+    code = (
+        "import time, json; from leaf.startup import install_import_profiler, import_report\n"
+        "install_import_profiler(); start = time.perf_counter()\n"
+        f"for m in {modules!r}: __import__(m)\n"
+        "print(json.dumps([(time.perf_counter() - start) * 1000, import_report(10)]))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    total_ms, report = json.loads(output.stdout.strip().splitlines()[-1])
+    return total_ms, report
+
+
+def main():
+    for page, modules in PAGE_IMPORTS.items():
+        try:
+            total_ms, report = measure_cold_imports(modules)
+        except subprocess.CalledProcessError as e:
+            print(f"{page}: import failed\n{e.stderr}")
+            continue
+        print(f"{page}: {total_ms:.0f} ms cold import")
+        for row in report:
+            print(f"    {row['module']:<40} {row['total_ms']:>8.1f} ms (self {row['self_ms']:.1f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Incremental transcription: cut live audio into utterances and transcribe each as it completes."""
+import threading
+
+import numpy as np
+
+from leaf.asr import SAMPLE_RATE, to_whisper_audio
+from leaf.asr_pool import get_transcription_service, PRIORITY_INTERACTIVE
+from leaf.tiers import select_tier, transcribe_options
+
+
+def frame_to_array(frame):
+    """Convert a WebRTC ``av.AudioFrame`` into 16 kHz mono float32 samples."""
+    samples = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+    if np.issubdtype(samples.dtype, np.integer):
+        samples = samples.astype(np.float32) / float(np.iinfo(samples.dtype).max + 1)
+    if frame.format.is_planar:
+        # Planar frames are (channels, samples); average the planes
+        samples = samples.reshape(channels, -1).mean(axis=0)
+        channels = 1
+    return to_whisper_audio(samples.reshape(-1), frame.sample_rate, channels)
+
+
+class UtteranceSegmenter:
+    """Energy-based voice activity detection that splits a 16 kHz stream into utterances."""
+
+    def __init__(self, frame_ms=30, min_silence_ms=700, min_speech_ms=300,
+                 max_utterance_s=15.0, min_threshold=0.01, noise_ratio=3.0):
+        self.frame_len = SAMPLE_RATE * frame_ms // 1000
+        self.silence_frames = max(1, min_silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_frames = int(max_utterance_s * 1000 / frame_ms)
+        self.min_threshold = min_threshold
+        self.noise_ratio = noise_ratio
+        self.noise_floor = min_threshold / noise_ratio
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._frames = []
+        self._speech_frames = 0
+        self._trailing_silence = 0
+        self._frames_seen = 0
+        self._utterance_start = 0
+
+    def feed(self, audio):
+        """Add 16 kHz mono samples and return the (start_seconds, samples) utterances they completed."""
+        self._pending = np.concatenate([self._pending, np.asarray(audio, dtype=np.float32)])
+        n_frames = len(self._pending) // self.frame_len
+        if n_frames == 0:
+            return []
+        frames = self._pending[: n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        self._pending = self._pending[n_frames * self.frame_len:]
+
+        # Frame energies for the whole chunk at once
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        utterances = []
+        for frame, energy in zip(frames, rms):
+            self._frames_seen += 1
+            is_speech = energy > max(self.min_threshold, self.noise_floor * self.noise_ratio)
+            if not is_speech:
+                # Track the background level so the threshold adapts to the room
+                self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+
+            if is_speech:
+                if not self._frames:
+                    self._utterance_start = self._frames_seen - 1
+                self._frames.append(frame)
+                self._speech_frames += 1
+                self._trailing_silence = 0
+            elif self._frames:
+                self._frames.append(frame)
+                self._trailing_silence += 1
+
+            if self._frames and (self._trailing_silence >= self.silence_frames
+                                 or len(self._frames) >= self.max_frames):
+                utterance = self._cut()
+                if utterance is not None:
+                    utterances.append(utterance)
+        return utterances
+
+    def flush(self):
+        """Return whatever is buffered as a final (start_seconds, samples) utterance, or None."""
+        if len(self._pending):
+            self._frames.append(self._pending)
+            self._pending = np.zeros(0, dtype=np.float32)
+        return self._cut()
+
+    def _cut(self):
+        frames, speech = self._frames, self._speech_frames
+        self._frames = []
+        self._speech_frames = 0
+        self._trailing_silence = 0
+        if not frames or speech < self.min_speech_frames:
+            return None
+        return self._utterance_start * self.frame_len / SAMPLE_RATE, np.concatenate(frames)
+
+
+class StreamingTranscriber:
+    """Feeds live audio through the segmenter and transcribes utterances on the shared pool."""
+
+    def __init__(self, lang1, service=None, segmenter=None, lang=None, **options):
+        self.lang1 = lang1
+        self.lang = lang
+        self.service = service or get_transcription_service()
+        self.segmenter = segmenter or UtteranceSegmenter()
+        self.options = options
+        self._jobs = []
+        self._offsets = []
+        self._chunks = []
+        self._lock = threading.Lock()
+
+    def feed(self, audio):
+        """Add 16 kHz mono samples, queueing any utterance they complete."""
+        with self._lock:
+            self._chunks.append(np.asarray(audio, dtype=np.float32))
+            for utterance in self.segmenter.feed(audio):
+                self._submit(utterance)
+
+    def partial_text(self):
+        """Return the text of the leading utterances that have finished transcribing."""
+        with self._lock:
+            jobs = list(self._jobs)
+        texts = []
+        for job in jobs:
+            if not job.done() or job.future.exception():
+                break
+            texts.append(job.result()["text"])
+        return ''.join(texts)
+
+    def pending(self):
+        """Return the number of utterances still being transcribed."""
+        with self._lock:
+            return sum(1 for job in self._jobs if not job.done())
+
+    def finish(self, timeout=None):
+        """Transcribe the trailing utterance and return the full result in order.
+
+        The result has the same shape as ``transcribe_detailed``, with word
+        timestamps shifted to the position of each utterance in the recording.
+        """
+        with self._lock:
+            utterance = self.segmenter.flush()
+            if utterance is not None:
+                self._submit(utterance)
+            jobs = list(zip(self._offsets, self._jobs))
+        texts = []
+        words = []
+        for offset, job in jobs:
+            result = job.result(timeout)
+            texts.append(result["text"])
+            words.extend({**word, "start": word["start"] + offset, "end": word["end"] + offset}
+                         for word in result["words"])
+        return {"text": ''.join(texts), "words": words, "duration": len(self.audio()) / SAMPLE_RATE}
+
+    def audio(self):
+        """Return all audio received so far as one array."""
+        with self._lock:
+            if not self._chunks:
+                return np.zeros(0, dtype=np.float32)
+            return np.concatenate(self._chunks)
+
+    def _submit(self, utterance):
+        offset, utterance = utterance
+        options = {**self.options, "detailed": True}
+        if self.lang:
+            # Short utterances usually qualify for a faster tier
+            options = {**transcribe_options(select_tier(self.lang, len(utterance) / SAMPLE_RATE)), **options}
+        self._jobs.append(self.service.submit(self.lang1, utterance, PRIORITY_INTERACTIVE,
+                                               call_site="speaking.transcribe_live", **options))
+        self._offsets.append(offset)
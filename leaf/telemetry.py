@@ -0,0 +1,299 @@
+"""Per-call telemetry for LLM, TTS and ASR calls.
+
+Every call is recorded with its page and function (from the call site,
+e.g. ``listening.generate_questions``), token counts, wall time, outcome and
+estimated cost. Records are appended to one JSON-lines file per day under the
+[telemetry] directory by a background writer, and aggregated in memory for the
+Prometheus-style text endpoint (``http://<bind>:<metrics_port>/metrics``).
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from leaf.config import get_section
+
+# Latency histogram buckets in seconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+_queue = queue.Queue()
+_writer = None
+_server = None
+_start_lock = threading.Lock()
+
+_totals = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                               "cost_usd": 0.0, "buckets": [0] * len(BUCKETS)})
+_quality = defaultdict(lambda: {"count": 0, "sum": 0.0})
+_totals_lock = threading.Lock()
+
+
+def percentile(values, q):
+    """Nearest-rank percentile ``q`` (0-100) of the values, or None when there are none.
+
+    The same definition for every p50/p95 in the app, so p95 is never below p50.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(0, min(len(values), -(-len(values) * q // 100)) - 1)]
+
+
+def split_call_site(call_site):
+    """Return (page, function) for a call site such as ``reading.generate_questions``."""
+    page, _, function = call_site.partition(".")
+    return page, function or page
+
+
+def estimate_cost(model, prompt_tokens=None, completion_tokens=None, characters=None):
+    """Estimated cost in USD from the [telemetry.prices] table (0 for unknown models)."""
+    price = get_section("telemetry")["prices"].get(model)
+    if not price:
+        return 0.0
+    cost = (prompt_tokens or 0) / 1000 * price.get("prompt_per_1k", 0.0)
+    cost += (completion_tokens or 0) / 1000 * price.get("completion_per_1k", 0.0)
+    cost += (characters or 0) / 1000 * price.get("characters_per_1k", 0.0)
+    return round(cost, 6)
+
+
+def record(kind, call_site, seconds, outcome, model=None, prompt_tokens=None, completion_tokens=None,
+           characters=None, **extra):
+    """Record one call. ``kind`` is "llm", "tts" or "asr"; ``outcome`` "ok", "error", "cached", ...."""
+    settings = get_section("telemetry")
+    if not settings["enabled"]:
+        return
+    page, function = split_call_site(call_site)
+    cost = estimate_cost(model, prompt_tokens, completion_tokens, characters) if outcome == "ok" else 0.0
+    event = {
+        "ts": round(time.time(), 3),
+        "kind": kind,
+        "page": page,
+        "function": function,
+        "model": model,
+        "outcome": outcome,
+        "seconds": round(seconds, 4),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": cost,
+        **({"characters": characters} if characters is not None else {}),
+        **extra,
+    }
+    with _totals_lock:
+        totals = _totals[(kind, page, function, outcome)]
+        totals["calls"] += 1
+        totals["seconds"] += seconds
+        totals["prompt_tokens"] += prompt_tokens or 0
+        totals["completion_tokens"] += completion_tokens or 0
+        totals["cost_usd"] += cost
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                totals["buckets"][i] += 1
+    _ensure_started(settings)
+    _queue.put(event)
+
+
+def record_quality(task, call_site, model, value):
+    """Record a 0-1 quality signal for one result of a routed task (see leaf.routing)."""
+    settings = get_section("telemetry")
+    if not settings["enabled"]:
+        return
+    page, function = split_call_site(call_site)
+    with _totals_lock:
+        quality = _quality[(task, model)]
+        quality["count"] += 1
+        quality["sum"] += value
+    _ensure_started(settings)
+    _queue.put({"ts": round(time.time(), 3), "kind": "quality", "page": page, "function": function,
+                "task": task, "model": model, "quality": round(value, 4)})
+
+
+def _ensure_started(settings):
+    global _writer, _server
+    if _writer is not None:
+        return
+    with _start_lock:
+        if _writer is not None:
+            return
+        _writer = threading.Thread(target=_write_events, args=(settings["dir"],),
+                                   name="leaf-telemetry", daemon=True)
+        _writer.start()
+        if settings["metrics_port"]:
+            try:
+                _server = ThreadingHTTPServer((settings["bind"], settings["metrics_port"]), _MetricsHandler)
+            except OSError as e:
+                # Another process (e.g. a second server) already serves the endpoint
+                print(f"Telemetry: metrics endpoint not started: {e}")
+            else:
+                threading.Thread(target=_server.serve_forever, name="leaf-metrics", daemon=True).start()
+
+
+def _events_path(directory, day):
+    return os.path.join(directory, f"events-{day:%Y%m%d}.jsonl")
+
+
+def _write_events(directory):
+    os.makedirs(directory, exist_ok=True)
+    while True:
+        events = [_queue.get()]
+        # Write whatever else is already waiting in one go
+        while not _queue.empty() and len(events) < 500:
+            events.append(_queue.get_nowait())
+        try:
+            with open(_events_path(directory, datetime.now()), "a", encoding="utf-8") as events_file:
+                events_file.writelines(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+        except OSError as e:
+            print(f"Telemetry: could not write events: {e}")
+        for _ in events:
+            _queue.task_done()
+
+
+def flush():
+    """Wait until every recorded event has been written (for command-line tools about to exit)."""
+    if _writer is not None:
+        _queue.join()
+
+
+def read_events(hours=24):
+    """Return the recorded events of the last ``hours`` hours, oldest first."""
+    directory = get_section("telemetry")["dir"]
+    since = time.time() - hours * 3600
+    day = datetime.fromtimestamp(since).date()
+    events = []
+    while day <= datetime.now().date():
+        path = _events_path(directory, day)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as events_file:
+                for line in events_file:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash
+                        continue
+                    if event["ts"] >= since:
+                        events.append(event)
+        day += timedelta(days=1)
+    return events
+
+
+def summarize(events):
+    """Aggregate events per kind, page and function: calls, errors, latency, tokens and cost."""
+    groups = defaultdict(list)
+    for event in events:
+        if event["kind"] != "quality":
+            groups[(event["kind"], event["page"], event["function"])].append(event)
+    rows = []
+    for (kind, page, function), group in sorted(groups.items()):
+        times = sorted(e["seconds"] for e in group if e["outcome"] == "ok")
+        rows.append({
+            "kind": kind,
+            "page": page,
+            "function": function,
+            "calls": len(group),
+            "errors": sum(e["outcome"] == "error" for e in group),
+            "cached": sum(e["outcome"] == "cached" for e in group),
+            # Identical concurrent requests answered by another caller's in-flight call
+            "coalesced": sum(e["outcome"] == "coalesced" for e in group),
+            "p50_seconds": round(percentile(times, 50), 2) if times else None,
+            "p95_seconds": round(percentile(times, 95), 2) if times else None,
+            "prompt_tokens": sum(e["prompt_tokens"] or 0 for e in group),
+            "completion_tokens": sum(e["completion_tokens"] or 0 for e in group),
+            "cost_usd": round(sum(e["cost_usd"] for e in group), 4),
+        })
+    return rows
+
+
+def summarize_tasks(events):
+    """Aggregate LLM calls per routed task and model: latency, tokens, cost, truncations and quality."""
+    calls = defaultdict(list)
+    quality = defaultdict(list)
+    for event in events:
+        if event.get("task") is None:
+            continue
+        if event["kind"] == "quality":
+            quality[(event["task"], event["model"])].append(event["quality"])
+        elif event["kind"] == "llm":
+            calls[(event["task"], event["model"])].append(event)
+    rows = []
+    for task, model in sorted(set(calls) | set(quality)):
+        group = calls[(task, model)]
+        ok = [e for e in group if e["outcome"] == "ok"]
+        times = sorted(e["seconds"] for e in ok)
+        scores = quality[(task, model)]
+        rows.append({
+            "task": task,
+            "model": model,
+            "calls": len(group),
+            "errors": sum(e["outcome"] == "error" for e in group),
+            "p50_seconds": round(percentile(times, 50), 2) if times else None,
+            "p95_seconds": round(percentile(times, 95), 2) if times else None,
+            "avg_completion_tokens": round(sum(e["completion_tokens"] or 0 for e in ok) / len(ok)) if ok else None,
+            # Replies cut off at max_tokens: the limit is too low for the task
+            "truncated": sum(bool(e.get("truncated")) for e in ok),
+            "quality": round(sum(scores) / len(scores), 3) if scores else None,
+            "cost_usd": round(sum(e["cost_usd"] for e in group), 4),
+        })
+    return rows
+
+
+def prometheus_text():
+    """Render the in-process totals in the Prometheus text exposition format."""
+    lines = [
+        "# HELP leaf_calls_total LLM, TTS and ASR calls by outcome.",
+        "# TYPE leaf_calls_total counter",
+    ]
+    with _totals_lock:
+        totals = {key: dict(value, buckets=list(value["buckets"])) for key, value in _totals.items()}
+
+    def labels(kind, page, function, outcome=None):
+        text = f'kind="{kind}",page="{page}",function="{function}"'
+        return text + (f',outcome="{outcome}"' if outcome else "")
+
+    for (kind, page, function, outcome), t in sorted(totals.items()):
+        lines.append(f"leaf_calls_total{{{labels(kind, page, function, outcome)}}} {t['calls']}")
+    for name, field, help_text in (
+        ("leaf_prompt_tokens_total", "prompt_tokens", "Prompt tokens sent."),
+        ("leaf_completion_tokens_total", "completion_tokens", "Completion tokens received."),
+        ("leaf_cost_usd_total", "cost_usd", "Estimated spend in USD."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (kind, page, function, outcome), t in sorted(totals.items()):
+            if outcome == "ok":
+                lines.append(f"{name}{{{labels(kind, page, function)}}} {round(t[field], 6)}")
+    lines += ["# HELP leaf_call_seconds Wall time of successful calls.", "# TYPE leaf_call_seconds histogram"]
+    for (kind, page, function, outcome), t in sorted(totals.items()):
+        if outcome != "ok":
+            continue
+        base = labels(kind, page, function)
+        for bound, count in zip(BUCKETS, t["buckets"]):
+            lines.append(f'leaf_call_seconds_bucket{{{base},le="{bound}"}} {count}')
+        lines.append(f'leaf_call_seconds_bucket{{{base},le="+Inf"}} {t["calls"]}')
+        lines.append(f"leaf_call_seconds_sum{{{base}}} {round(t['seconds'], 4)}")
+        lines.append(f"leaf_call_seconds_count{{{base}}} {t['calls']}")
+    lines += ["# HELP leaf_task_quality Quality signals (0-1) recorded per routed task and model.",
+              "# TYPE leaf_task_quality summary"]
+    with _totals_lock:
+        quality = {key: dict(value) for key, value in _quality.items()}
+    for (task, model), q in sorted(quality.items()):
+        lines.append(f'leaf_task_quality_sum{{task="{task}",model="{model}"}} {round(q["sum"], 4)}')
+        lines.append(f'leaf_task_quality_count{{task="{task}",model="{model}"}} {q["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the Streamlit log
+        pass
@@ -0,0 +1,76 @@
+"""Latency-budgeted Whisper tier selection per language and clip duration."""
+import threading
+import time
+
+from leaf.config import get_section
+
+# Smoothed real-time factor per tier, measured on this machine, as (rtf, measured_at)
+_rtf = {}
+_rtf_lock = threading.Lock()
+RTF_SMOOTHING = 0.3
+
+
+def _rule_tier(lang, duration):
+    languages = get_section("asr")["languages"]
+    rules = languages.get(lang) or languages["default"]
+    for rule in rules:
+        if not rule.get("max_duration") or duration <= rule["max_duration"]:
+            return rule["tier"]
+    return rules[-1]["tier"]
+
+
+def select_tier(lang, duration):
+    """Pick the tier for a clip, stepping down while the measured RTF is over budget."""
+    asr = get_section("asr")
+    order = asr["fallback_order"]
+    preferred = _rule_tier(lang, duration)
+    name = preferred
+    if name in order:
+        for candidate in order[order.index(name):]:
+            name = candidate
+            rtf = measured_rtf(candidate)
+            if rtf is None or rtf <= asr["rtf_budget"]:
+                break
+
+    tier = dict(asr["tiers"][name])
+    tier["name"] = name
+    tier["preferred"] = preferred
+    return tier
+
+
+def record_rtf(tier_name, audio_seconds, elapsed_seconds):
+    """Fold one measurement into the tier's smoothed real-time factor."""
+    if audio_seconds <= 0:
+        return
+    rtf = elapsed_seconds / audio_seconds
+    with _rtf_lock:
+        previous = _rtf.get(tier_name)
+        if previous is not None:
+            rtf = (1 - RTF_SMOOTHING) * previous[0] + RTF_SMOOTHING * rtf
+        _rtf[tier_name] = (rtf, time.monotonic())
+
+
+def measured_rtf(tier_name):
+    """Return the smoothed real-time factor of a tier, or None if unmeasured or stale.
+
+    Measurements older than ``rtf_retry_seconds`` are ignored so a tier that was
+    skipped under load gets tried again once things calm down.
+    """
+    with _rtf_lock:
+        entry = _rtf.get(tier_name)
+    if entry is None:
+        return None
+    rtf, measured_at = entry
+    if time.monotonic() - measured_at > get_section("asr")["rtf_retry_seconds"]:
+        return None
+    return rtf
+
+
+def transcribe_options(tier):
+    """Return the transcription-service options for a tier."""
+    return {
+        "model_size": tier["model_size"],
+        "compute_type": tier["compute_type"],
+        "beam_size": tier["beam_size"],
+        "tier": tier["name"],
+    }
@@ -0,0 +1,164 @@
+"""Streamlit helpers shared by the pages."""
+import contextvars
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from leaf.llm import LLMError
+from leaf.mcq import format_score
+from leaf.providers import provider_name
+from leaf.scheduler import bind_session, queue_position
+from leaf.sentences import split_sentences
+from leaf.writing import format_writing_report, iter_sentence_grades, summarize_writing, writing_result
+
+# Seconds between queue-position updates while a call is waiting
+POLL_SECONDS = 0.25
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="leaf-ui")
+
+
+def _bind_session():
+    """Attribute this script run's LLM calls to the browser session, for fair queuing."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    bind_session(ctx.session_id if ctx is not None else None)
+
+
+def _queue_status(placeholder):
+    """Return a callback that shows this session's place in the LLM queue, if it is waiting."""
+    def show():
+        position = queue_position()
+        if position:
+            placeholder.caption(f"⏳ 排队中, 前面还有 {position} 个请求")
+        else:
+            placeholder.empty()
+    return show
+
+
+def _service_busy(error):
+    """Tell the student the LLM gave up (retries or deadline exhausted) and stop this run."""
+    print(f"LLM call failed: {error}")
+    st.error("服务繁忙，请稍后再试")
+    st.stop()
+
+
+def call_with_queue_status(func, *args, **kwargs):
+    """Run a blocking call (no Streamlit calls inside) while showing the queue position under the spinner."""
+    _bind_session()
+    future = _executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+    placeholder = st.empty()
+    show = _queue_status(placeholder)
+    try:
+        while True:
+            try:
+                return future.result(timeout=POLL_SECONDS)
+            except TimeoutError:
+                show()
+    except LLMError as e:
+        _service_busy(e)
+    finally:
+        placeholder.empty()
+
+
+def export_openai_key():
+    """Hand the key in Streamlit secrets to the LLM gateway; stop the page if the OpenAI provider has none."""
+    if provider_name() != "openai":
+        return
+    try:
+        os.environ["OPENAI_API_KEY"] = st.secrets["openai"]["token"]
+    except (FileNotFoundError, KeyError):
+        if not os.environ.get("OPENAI_API_KEY"):
+            st.error("未配置 OpenAI API key (.streamlit/secrets.toml). 离线运行请设置 LEAF_PROVIDER=local.")
+            st.stop()
+
+
+def stream_feedback(chunks, label="查看分析"):
+    """Render streamed feedback in the toggle area as it arrives and return the full text."""
+    # Wait for the first words (the request may be queued) before opening the expander
+    chunks = iter(chunks)
+    with st.spinner("分析中..."):
+        first = call_with_queue_status(next, chunks, None)
+    rest = chunks if first is None else itertools.chain([first], chunks)
+    with st.expander(label, expanded=True):
+        try:
+            text = st.write_stream(rest)
+        except LLMError as e:
+            _service_busy(e)
+    return (text if isinstance(text, str) else ''.join(map(str, text))).strip()
+
+
+def show_mcq_result(scoring, explanation, label="查看解析"):
+    """Show the locally computed score at once, then stream explanations of the wrong answers.
+
+    Returns the text to save: the per-question results and, if any, the explanations.
+    """
+    st.metric("得分", f"{scoring['score']}/100", f"{scoring['correct']}/{scoring['total']}")
+    st.table([
+        {"#": i, "答案": result["answer"] or "-", "正确答案": result["correct_answer"],
+         "结果": "✅" if result["correct"] else "❌"}
+        for i, result in enumerate(scoring["results"], 1)
+    ])
+    summary = format_score(scoring)
+    if explanation is None:
+        st.success("全部正确！")
+        return summary
+    return summary + "\n\n" + stream_feedback(explanation, label)
+
+
+def _writing_row(i, sentence, grade):
+    if grade is None:
+        return {"#": i, "原句": sentence, "修改建议": "", "得分": "未批改", "说明": ""}
+    return {"#": i, "原句": sentence, "修改建议": "" if grade["improved"] == sentence else grade["improved"],
+            "得分": f"{grade['score']}/10", "说明": grade["comment"]}
+
+
+def show_writing_grading(lang, text, prompt):
+    """Grade an essay sentence by sentence, showing each row as its batch completes, then stream the summary.
+
+    Returns the report text to save.
+    """
+    sentences = split_sentences(text, lang)
+    grades = [None] * len(sentences)
+    rows = [{"#": i, "原句": sentence, "修改建议": "", "得分": "…", "说明": ""}
+            for i, sentence in enumerate(sentences, 1)]
+    table = st.empty()
+    table.table(rows)
+    pending = iter_sentence_grades(lang, sentences)
+    with st.spinner("逐句批改中..."):
+        while True:
+            item = call_with_queue_status(next, pending, None)
+            if item is None:
+                break
+            i, grade = item
+            grades[i] = grade
+            rows[i] = _writing_row(i + 1, sentences[i], grade)
+            table.table(rows)
+    reused = sum(1 for grade in grades if grade and grade["reused"])
+    if reused:
+        st.caption(f"本次批改 {len(sentences) - reused} 句，{reused} 句未改动，沿用上次的批改")
+    summary = stream_feedback(summarize_writing(lang, text, prompt, grades, stream=True), "总评与建议")
+    result = writing_result(sentences, grades, summary)
+    delta = None if result["task_score"] is None else f"语言 {result['language_score']} · 切题 {result['task_score']}"
+    st.metric("得分", f"{result['score']}/100", delta, delta_color="off")
+    return format_writing_report(result)
+
+
+def run_pipeline(pipeline, inputs, targets=None, on_stage=None):
+    """Run a pipeline with its stage outputs memoized in this session."""
+    _bind_session()
+    memo = st.session_state.setdefault(f"_pipeline_{pipeline.name}", {})
+    placeholder = st.empty()
+    try:
+        return pipeline.run(inputs, memo, targets, on_stage, on_tick=_queue_status(placeholder))
+    except LLMError as e:
+        _service_busy(e)
+    finally:
+        placeholder.empty()
+
+
+def reset_pipeline(name):
+    """Forget a pipeline's memoized outputs, e.g. for "🔄 新的测试"."""
+    st.session_state.pop(f"_pipeline_{name}", None)
@@ -0,0 +1,272 @@
+"""Writing prompt generation and grading shared by the Writing page, the exercise pool and the load test.
+
+Essays are graded one sentence at a time: the text is split locally, the
+sentences are graded in parallel batches, and each sentence's grade is
+cached by its text, so a revised essay only pays for the sentences that
+changed. Grades are handed out as each batch completes, so the page can show
+them row by row. A short summary call, which can be streamed, then assesses
+the essay as a whole.
+"""
+import contextvars
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from leaf.cache import TieredCache, hash_key
+from leaf.config import get_section
+from leaf.llm import LLMError, chat, chat_json
+from leaf.providers import get_provider
+from leaf.routing import record_quality, route
+from leaf.sentences import split_sentences
+
+# Bump when the sentence prompt or schema changes, so old grades are not reused
+SENTENCE_GRADING_VERSION = 1
+
+SENTENCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sentences": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "score": {"type": "integer", "minimum": 0, "maximum": 10},
+                    "improved": {"type": "string"},
+                    "comment": {"type": "string"},
+                },
+                "required": ["index", "score", "improved", "comment"],
+            },
+        },
+    },
+    "required": ["sentences"],
+}
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="leaf-writing")
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def generate_writing_prompt(lang, keywords=None):
+    """Generate a writing prompt based on the language and optional keywords."""
+    if keywords:
+        messages = [
+            {
+                "role": "system",
+                "content": f"Please generate a {lang} writing prompt (prompt must be in {lang}) based on the following keywords:\n\nKeywords:\n{keywords}\n\n"
+            }
+        ]
+    else:
+        messages = [
+            {
+                "role": "system",
+                "content": f"Please generate a random {lang} writing prompt (prompt must be in {lang}) for a student to practice."
+            }
+        ]
+    return chat(
+        messages,
+        call_site="writing.generate_writing_prompt",
+        task="prompt",
+        # "随机生成" should give a new text every time
+        cache=bool(keywords),
+    ).strip()
+
+
+def get_sentence_cache():
+    """Return the process-wide cache of sentence grades."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = get_section("writing")
+                _cache = TieredCache(settings["cache_dir"], settings["cache_entries"],
+                                     ttl_seconds=settings["cache_ttl_seconds"])
+    return _cache
+
+
+def _sentence_key(lang, sentence, provider, model):
+    # Keyed on the provider too: local stand-in grades must never be served to real sessions
+    return hash_key(SENTENCE_GRADING_VERSION, provider, lang, model, sentence)
+
+
+def _validate_grade(item, batch):
+    # Returns (position in batch, grade) or None
+    if not isinstance(item, dict):
+        return None
+    index, score = item.get("index"), item.get("score")
+    if not isinstance(index, int) or not 1 <= index <= len(batch) or not isinstance(score, (int, float)):
+        return None
+    improved, comment = item.get("improved"), item.get("comment")
+    if not isinstance(improved, str) or not isinstance(comment, str):
+        return None
+    return index - 1, {"score": max(0, min(10, round(score))), "improved": improved.strip() or batch[index - 1],
+                       "comment": comment.strip()}
+
+
+def _grade_batch(lang, batch):
+    """Grade a few sentences in one call; returns {position: grade} for the ones that came back valid."""
+    numbered = "\n".join(f"{i}. {sentence}" for i, sentence in enumerate(batch, 1))
+    content = (
+        f"Grade the {len(batch)} numbered {lang} sentences below, written by a student, for precision, "
+        "clarity and grammatical correctness. For each sentence give a score from 0 to 10 (10 = correct "
+        f"and natural), an improved version in {lang} (the original if nothing needs changing) and a "
+        "brief comment in Chinese on where points were deducted.\n\n"
+        f"{numbered}"
+    )
+    try:
+        reply = chat_json(
+            [{"role": "user", "content": content}],
+            "writing.grade_sentences",
+            SENTENCE_SCHEMA,
+            name="submit_grades",
+            description="Submit the grade of every sentence.",
+            task="grading",
+            max_tokens=80 + 120 * len(batch),
+        )
+    except (LLMError, ValueError) as e:
+        # The sentences stay ungraded; the next submission tries them again
+        print(f"writing.grade_sentences: batch failed: {e}")
+        return {}
+    items = reply.get("sentences", []) if isinstance(reply, dict) else []
+    grades = {}
+    for item in items:
+        graded = _validate_grade(item, batch)
+        if graded is not None:
+            grades[graded[0]] = graded[1]
+    return grades
+
+
+def iter_sentence_grades(lang, sentences):
+    """Yield ``(index, grade)`` for every sentence as soon as its grade is known.
+
+    Cached grades come first, then each batch as it completes. A grade is
+    ``{"score": 0-10, "improved": str, "comment": str, "reused": bool}``, or None
+    if the sentence could not be graded (it is not cached, so the next
+    submission tries it again).
+    """
+    settings = get_section("writing")
+    cache = get_sentence_cache()
+    provider = get_provider().name
+    model = route("grading")["model"]
+    todo = {}
+    for i, sentence in enumerate(sentences):
+        cached = cache.get(_sentence_key(lang, sentence, provider, model))
+        if cached is not None:
+            yield i, dict(cached, reused=True)
+        else:
+            # A sentence repeated in the essay is graded once
+            todo.setdefault(sentence, []).append(i)
+    pending = list(todo)
+    batches = [pending[i:i + settings["batch_size"]] for i in range(0, len(pending), settings["batch_size"])]
+    # Copies of the caller's context keep the session and priority for the scheduler
+    futures = {_executor.submit(contextvars.copy_context().run, _grade_batch, lang, batch): batch
+               for batch in batches}
+    valid = 0
+    for future in as_completed(futures):
+        batch = futures[future]
+        graded = future.result()
+        for position, sentence in enumerate(batch):
+            grade = graded.get(position)
+            if grade is not None:
+                cache.put(_sentence_key(lang, sentence, provider, model), grade)
+                valid += 1
+            for i in todo[sentence]:
+                yield i, None if grade is None else dict(grade, reused=False)
+    if pending:
+        record_quality("grading", "writing.grade_sentences", valid / len(pending))
+
+
+def grade_sentences(lang, sentences):
+    """Grade sentences, reusing cached grades; returns one grade (or None) per sentence, in order."""
+    grades = [None] * len(sentences)
+    for i, grade in iter_sentence_grades(lang, sentences):
+        grades[i] = grade
+    return grades
+
+
+def summarize_writing(lang, text, prompt, grades, stream=False):
+    """Assess the essay as a whole, in Chinese, ending with "总分: N/100" for the prompt (or organization).
+
+    With ``stream=True`` a generator of text deltas is returned.
+    """
+    lines = [
+        f"{i}. ({grade['score']}/10) {grade['comment']}" if grade else f"{i}. (not graded)"
+        for i, grade in enumerate(grades, 1)
+    ]
+    task = f"how well it addresses the prompt:\n{prompt}\n" if prompt else "its organization and coherence. "
+    content = (
+        f"A student wrote the {lang} text below. Each sentence has already been graded; the per-sentence "
+        f"notes follow. Assess the text as a whole on a 100-point scale for {task}"
+        "Write a short overview and concrete suggestions for improvement, both in Chinese, and end with "
+        "the line \"总分: N/100\".\n\n"
+        f"Text:\n{text}\n\nSentence notes:\n" + "\n".join(lines)
+    )
+    reply = chat(
+        [{"role": "user", "content": content}],
+        "writing.summarize",
+        task="grading",
+        max_tokens=800,
+        stream=stream,
+    )
+    return reply if stream else reply.strip()
+
+
+def _task_score(summary):
+    # The last "N/100" in the summary
+    matches = [int(match) for match in re.findall(r"(\d{1,3})\s*/\s*100", summary or "") if int(match) <= 100]
+    return matches[-1] if matches else None
+
+
+def writing_result(sentences, grades, summary):
+    """Assemble the result from the sentence grades and the summary text.
+
+    The total combines the average sentence score (language) with the
+    summary's score, weighted by [writing] language_weight.
+    """
+    scores = [grade["score"] for grade in grades if grade]
+    language_score = round(10 * sum(scores) / len(scores)) if scores else 0
+    task_score = _task_score(summary)
+    weight = get_section("writing")["language_weight"]
+    if task_score is not None:
+        score = round(weight * language_score + (1 - weight) * task_score)
+    else:
+        score = language_score
+    return {
+        "sentences": [dict(grade or {}, sentence=sentence) for sentence, grade in zip(sentences, grades)],
+        "language_score": language_score,
+        "task_score": task_score,
+        "score": score,
+        "summary": summary or "",
+        "reused": sum(1 for grade in grades if grade and grade["reused"]),
+        "graded": sum(1 for grade in grades if grade and not grade["reused"]),
+    }
+
+
+def grade_writing(lang, text, prompt=None):
+    """Grade an essay sentence by sentence and assemble the overall result (no streaming)."""
+    sentences = split_sentences(text, lang)
+    grades = grade_sentences(lang, sentences)
+    try:
+        summary = summarize_writing(lang, text, prompt, grades)
+    except LLMError as e:
+        print(f"writing.summarize: {e}")
+        summary = ""
+    return writing_result(sentences, grades, summary)
+
+
+def format_writing_report(result):
+    """The grading as plain text, for the saved analysis."""
+    lines = [f"总分: {result['score']}/100 (语言 {result['language_score']}/100"
+             + (f", 切题 {result['task_score']}/100)" if result["task_score"] is not None else ")"), "", "逐句分析:"]
+    for i, item in enumerate(result["sentences"], 1):
+        if "score" not in item:
+            lines.append(f"{i}. [未批改] {item['sentence']}")
+            continue
+        lines.append(f"{i}. [{item['score']}/10] {item['sentence']}")
+        if item["improved"] != item["sentence"]:
+            lines.append(f"   → {item['improved']}")
+        if item["comment"]:
+            lines.append(f"   {item['comment']}")
+    if result["summary"]:
+        lines += ["", "总评与建议:", result["summary"]]
+    return "\n".join(lines)
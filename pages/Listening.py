@@ -1,18 +1,21 @@
+from leaf.startup import install_import_profiler, PageTimer
+install_import_profiler()
+page_timer = PageTimer("Listening")
+
 import streamlit as st
-from streamlit_extras.stoggle import stoggle
-import re
+from leaf.ui import call_with_queue_status, export_openai_key, reset_pipeline, run_pipeline, show_mcq_result, stream_feedback
+from leaf.pipeline import Pipeline, Stage
 import os
-import io
-import openai
+from leaf.llm import chat
+from leaf.listening import generate_listening_text, generate_questions, synthesize_wav
+from leaf.mcq import explain_mistakes, score_answers
+from leaf.memory import count_message_tokens, new_conversation_memory
+from leaf.exercise_pool import prefill, random_exercise
 from datetime import datetime
 from io import StringIO
-import numpy as np
-import wave
-#import pyaudio
-from faster_whisper import WhisperModel
 
-# Set OpenAI API key
-openai.api_key = st.secrets["openai"]["token"]
+# Pass the OpenAI API key to the shared LLM gateway (not needed with the local provider)
+export_openai_key()
 
 # Create the "listening" directory if it doesn't exist
 if not os.path.exists('listening'):
@@ -22,63 +25,8 @@ if not os.path.exists('listening'):
 st.set_page_config(page_title="Listening", page_icon="👂")
 
 # Define functions
-def speak(text, filename):
-    """Generate and save audio using your provided method."""
-    try:
-        # Initialize PyAudio for later use (if needed)
-#        player_stream = pyaudio.PyAudio().open(format=pyaudio.paInt16, channels=1, rate=24000, output=True)
-        stream_start = False
-        # Placeholder to collect PCM audio chunks
-        audio_chunks = []
-
-        # Generate audio using OpenAI TTS API
-        with openai.audio.speech.with_streaming_response.create(
-            model='tts-1',
-            voice='alloy',
-            response_format='pcm',  
-            input=text,
-        ) as response:
-            silence_threshold = 0.01
-            for chunk in response.iter_bytes(chunk_size=1024):
-                if stream_start:
-                    audio_chunks.append(chunk)
-                else:
-                    if max(chunk) > silence_threshold:
-                        audio_chunks.append(chunk)
-                        stream_start = True
-        # Concatenate all chunks into a single byte stream
-        audio_data = b''.join(audio_chunks)
-
-        # Convert byte stream to a numpy array
-        audio_array = np.frombuffer(audio_data, dtype=np.int16)
-
-        # Write audio data to .wav file
-#        with wave.open(filename, 'wb') as wf:
-                 # Convert the byte stream to an in-memory WAV file
-        wav_io = io.BytesIO()
-        with wave.open(wav_io, 'wb') as wf:
-            wf.setnchannels(1)  # Mono audio
-            wf.setsampwidth(2)   # Sample width in bytes (2 bytes for 16-bit PCM)
-            wf.setframerate(24000)  # Sample rate
-            wf.writeframes(audio_data)  # Write the PCM data
-
-        # Move the pointer to the beginning of the in-memory file
-        wav_io.seek(0)
-
-        # Play the audio using st.audio
-        st.audio(wav_io.read(), format='audio/wav')
-#            wf.setnchannels(1)  # Mono audio
-#            wf.setsampwidth(pyaudio.PyAudio().get_sample_size(pyaudio.paInt16))  # Sample width for 16-bit audio
-
-#wf.setframerate(24000)  # Sample rate
-#            wf.writeframes(audio_data)  # Write the PCM data to the .wav file
-
-#        st.write(f"Audio saved as {filename}")
-    except Exception as e:
-        st.error(f"An error occurred while generating the audio file: {e}")
-
 def save_text(text, text_type, original_filename=None):
-    """Save the text to a file in the 'listening' directory."""
+    """Save the text to a file in the 'listening' directory and return the confirmation to show."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     if original_filename:
         filename = f"listening/{text_type}_{timestamp}_{original_filename}"
@@ -86,7 +34,7 @@ def save_text(text, text_type, original_filename=None):
         filename = f"listening/{text_type}_{timestamp}.txt"
     with open(filename, "w", encoding="utf-8") as file:
         file.write(text)
-    st.write(f"{text_type.capitalize()} saved as {filename}")
+    return f"{text_type.capitalize()} saved as {filename}"
 
 def save_user_input(user_input):
     """Save the user's input to a file in the 'listening' directory."""
@@ -113,112 +61,7 @@ def save_analysis(analysis):
         file.write(analysis)
     st.write(f"Analysis saved as {filename}")
 
-def generate_listening_text(lang, keywords=None):
-    """Generate listening text based on the language and optional keywords."""
-    if keywords:
-        messages = [
-            {
-                "role": "system",
-                "content": f"Please generate a {lang} paragraph based on the following keywords for students to practice listening:\n\nKeywords:\n{keywords}\n\n"
-            }
-        ]
-    else:
-        messages = [
-            {
-                "role": "system",
-                "content": f"Please generate a random {lang} paragraph for students to practice listening."
-            }
-        ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=1500,
-        temperature=0.7,
-    )
-    return response.choices[0].message.content.strip()
-
-def generate_questions(lang, reference_text):
-    """Generate multiple-choice questions based on the reference text."""
-    messages = [
-        {"role": "user", "content": (
-            f"Based on the following {lang} text, please create five multiple-choice questions with four options each. "
-            f"Ensure that the correct answers are indicated. Please format the questions and options clearly with each component on a new line:\n\n"
-            f"Text:\n{reference_text}\n\n"
-            "Format:\n"
-            "Question 1:question text(only question text is in {lang})\n"
-            "a) Option A\n"
-            "b) Option B\n"
-            "c) Option C\n"
-            "d) Option D\n"
-            "Answer: <Correct Option Letter>\n\n"
-            "Question 2:question text (only question text is in {lang})\n"
-            "a) Option A\n"
-            "b) Option B\n"
-            "c) Option C\n"
-            "d) Option D\n"
-            "Answer: <Correct Option Letter>\n\n"
-            "Question 3:question text (only question text is in {lang})\n"
-            "a) Option A\n"
-            "b) Option B\n"
-            "c) Option C\n"
-            "d) Option D\n"
-            "Answer: <Correct Option Letter>\n\n"
-            "Question 4:question text (only question text is in {lang})\n"
-            "a) Option A\n"
-            "b) Option B\n"
-            "c) Option C\n"
-            "d) Option D\n"
-            "Answer: <Correct Option Letter>\n\n"
-            "Question 5:question text(only question text is in {lang})\n"
-            "a) Option A\n"
-            "b) Option B\n"
-            "c) Option C\n"
-            "d) Option D\n"
-            "Answer: <Correct Option Letter>\n\n"
-            "Please make sure to include the 'Answer: X' line for each question."
-        )}
-    ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=2000,  # Increased to accommodate more content
-        temperature=0.7,
-    )
-    return response.choices[0].message.content
-
-def parse_mcqs_new(mcqs_text, lang):
-    """Parse the generated multiple-choice questions into a structured format."""
-    import re
-    questions = []
-
-    # Define language-specific labels and patterns
-    if lang.lower() == "chinese":
-        # Implement Chinese parsing if needed
-        # For simplicity, we'll focus on English here
-        pass
-    else:
-        # Default to English patterns
-        # Regex pattern to capture each question and its components
-        pattern = r'Question\s*(\d+):\s*(.*?)\s*a\)\s*(.*?)\s*b\)\s*(.*?)\s*c\)\s*(.*?)\s*d\)\s*(.*?)\s*Answer:\s*([A-Da-d])'
-
-        matches = re.findall(pattern, mcqs_text, re.DOTALL)
-
-        for match in matches:
-            q_num, q_text, a_opt, b_opt, c_opt, d_opt, answer = match
-            questions.append({
-                'question': q_text.strip(),
-                'options': {
-                    'A': a_opt.strip(),
-                    'B': b_opt.strip(),
-                    'C': c_opt.strip(),
-                    'D': d_opt.strip()
-                },
-                'answer': answer.upper()
-            })
-
-    return questions
-
-def analyze_transcription(lang, student_text=None, reference_text=None):
+def analyze_transcription(lang, student_text=None, reference_text=None, stream=False):
     """Analyze the student's transcription."""
     if student_text and reference_text:
         messages = [
@@ -239,36 +82,92 @@ def analyze_transcription(lang, student_text=None, reference_text=None):
                 f"You are a helpful assistant who can generate an {lang} paragraph for students to practice listening."
             )},
         ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=2000,
-        temperature=0.5,
+    reply = chat(
+        messages,
+        call_site="listening.analyze_transcription",
+        task="grading",
+        stream=stream,
     )
-    return response.choices[0].message.content.strip()
-
-def analyze_answers(mcqs, user_answers, lang):
-    """Analyze the user's answers to the multiple-choice questions."""
-    prompt = f"Please analyze the student's answers to the following {lang} multiple-choice questions.\n\n"
-    total_score = 0
-    for idx, mcq in enumerate(mcqs, 1):
-        correct_option = mcq['answer']
-        user_ans = user_answers.get(str(idx), "No Answer").upper()
-        correct = "Correct" if user_ans == correct_option else "Incorrect"
-        if correct == "Correct":
-            total_score += 20
-        prompt += f"Question {idx}:\nCorrect Answer: {correct_option}\nStudent's Answer: {user_ans}\nResult: {correct}\n\n"
-    prompt += f"Total Score: {total_score}/100\nPlease provide detailed feedback in Chinese."
-    messages = [
-        {"role": "user", "content": prompt}
-    ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=1500,
-        temperature=0.7,
+    # Streamed replies are stripped by the page once complete
+    return reply if stream else reply.strip()
+
+def analyze_answers(mcqs, user_answers, lang, stream=False):
+    """Score the answers locally and ask for explanations of the wrong ones only.
+
+    Returns (scoring, explanation); explanation is None when every answer is correct.
+    """
+    scoring = score_answers(mcqs, [user_answers.get(str(idx)) for idx in range(1, len(mcqs) + 1)])
+    explanation = explain_mistakes(
+        lang,
+        mcqs,
+        scoring,
+        call_site="listening.analyze_answers",
+        task="explanation",
+        stream=stream,
     )
-    return response.choices[0].message.content.strip()
+    # Streamed replies are stripped by the page once complete
+    if explanation is not None and not stream:
+        explanation = explanation.strip()
+    return scoring, explanation
+
+def passage_source(option):
+    """Return (source text, original filename) for the chosen generation method.
+
+    The source is the keywords or the uploaded text; it is empty for "随机生成"
+    and while the student has not entered anything yet.
+    """
+    if option == "输入关键词":
+        st.session_state.keyds = st.text_area(
+            "输入关键词",
+            value=st.session_state.keyds
+        )
+        if not st.session_state.keyds:
+            st.warning("输入关键词")
+        return st.session_state.keyds, None
+    if option == "上传文件":
+        uploaded_file = st.file_uploader("上传文件")
+        if uploaded_file is None:
+            st.warning("上传文件")
+            return "", None
+        st.session_state.uploaded_text = StringIO(uploaded_file.getvalue().decode("utf-8")).read()
+        return st.session_state.uploaded_text, uploaded_file.name
+    return "", None
+
+def listening_exercise(lang, kind, option, source):
+    """The passage to practise on; "随机生成" takes a ready exercise (with audio) from the pool."""
+    if option == "随机生成":
+        return random_exercise(kind, lang)
+    if option == "输入关键词":
+        return {"text": generate_listening_text(lang, source)}
+    return {"text": source}
+
+def exercise_audio(exercise):
+    """WAV audio for the passage, or None if speech synthesis failed."""
+    if exercise.get("audio"):
+        return exercise["audio"]
+    try:
+        return synthesize_wav(exercise["text"])
+    except Exception as e:
+        print(f"An error occurred while generating the audio file: {e}")
+        return None
+
+def exercise_questions(lang, exercise):
+    """Multiple-choice questions for the passage, unless the pool already made them."""
+    return exercise.get("questions") or generate_questions(lang, exercise["text"])
+
+# Exercise flows as stage DAGs: audio and questions only need the passage, so
+# they run side by side, and outputs are memoized per session across reruns
+DICTATION = Pipeline("listening_dictation", [
+    Stage("exercise", listening_exercise, deps=["lang", "kind", "option", "source"]),
+    # Memoized, so the file is written once per passage; the page shows the confirmation on every rerun
+    Stage("saved", lambda exercise, filename: save_text(exercise["text"], 'listening_text', filename),
+          deps=["exercise", "filename"]),
+    Stage("audio", exercise_audio, deps=["exercise"]),
+])
+LISTENING_MCQ = Pipeline("listening_mcq", [
+    *DICTATION.stages.values(),
+    Stage("questions", exercise_questions, deps=["lang", "exercise"]),
+])
 
 # Ensure the selected language is available
 if 'ke_y' not in st.session_state:
@@ -298,8 +197,6 @@ if 'clicked' not in st.session_state:
     st.session_state.clicked = False
 if 'analysis' not in st.session_state:
     st.session_state.analysis = None
-if 'qe' not in st.session_state:
-    st.session_state.qe = None
 if 'qeq' not in st.session_state:
     st.session_state.qeq = None
 if 'user_answers' not in st.session_state:
@@ -314,8 +211,8 @@ if 'keyds' not in st.session_state:
     st.session_state.keyds = ''
 if 'uploaded_text' not in st.session_state:
     st.session_state.uploaded_text = ''
-if 'audio_filename' not in st.session_state:
-    st.session_state.audio_filename = None
+if 'audio_bytes' not in st.session_state:
+    st.session_state.audio_bytes = None
 
 # Page Title and Introduction
 st.title("👂 听力练习")
@@ -340,13 +237,20 @@ with col1:
 if genre != st.session_state.genre:
     st.session_state.genre = genre
     st.session_state.analysis = None
-    st.session_state.qe = None
     st.session_state.qeq = None
     st.session_state.user_answers = {}
     st.session_state.txt = ''
     st.session_state.keyds = ''
     st.session_state.uploaded_text = ''
-    st.session_state.audio_filename = None
+    st.session_state.audio_bytes = None
+    reset_pipeline(DICTATION.name)
+    reset_pipeline(LISTENING_MCQ.name)
+
+# Keep random exercises for this format ready in the background
+if genre == "📝听写":
+    prefill("listening", lang)
+elif genre == "📝 选择题":
+    prefill("listening_mcq", lang)
 
 if genre == "📝听写":
     with col2:
@@ -365,26 +269,27 @@ if genre == "📝听写":
         st.session_state.txt = ''
         st.session_state.keyds = ''
         st.session_state.uploaded_text = ''
-        st.session_state.audio_filename = None
-
-    if option == "随机生成":
-        st.write("Please proceed to listen...")
-
-        if st.session_state.analysis is None:
-            with st.spinner("音频生成中..."):
-                st.session_state.analysis = generate_listening_text(lang)
-                filename = f"listening/{datetime.now().strftime('%Y%m%d_%H%M%S')}_listening.wav"
-                speak(st.session_state.analysis, filename)
-                st.session_state.audio_filename = filename
-                save_text(st.session_state.analysis, 'listening_text')
-
-        if os.path.exists(st.session_state.audio_filename):
-            st.audio(st.session_state.audio_filename, format="audio/wav", start_time=0)
+        st.session_state.audio_bytes = None
+        reset_pipeline(DICTATION.name)
+
+    st.write("Please proceed to listen...")
+    source, filename = passage_source(option)
+
+    if option == "随机生成" or source:
+        with st.spinner("音频生成中..."):
+            run = run_pipeline(DICTATION, {"lang": lang, "kind": "listening", "option": option,
+                                           "source": source, "filename": filename})
+        st.write(run["saved"])
+        st.session_state.analysis = run["exercise"]["text"]
+        st.session_state.audio_bytes = run["audio"]
+
+        if st.session_state.audio_bytes:
+            st.audio(st.session_state.audio_bytes, format="audio/wav", start_time=0)
         else:
             st.error("Audio file not found. Please try again.")
 
         st.session_state.txt = st.text_area(
-            "请输入听到的内容",
+            "请输入听到的内容:",
             value=st.session_state.txt
         )
 
@@ -392,99 +297,14 @@ if genre == "📝听写":
 
         if st.button("分析 📝"):
             if st.session_state.txt:
-                with st.spinner("分析中..."):
-                    analy = analyze_transcription(lang, st.session_state.txt, st.session_state.analysis)
-                    save_user_input(st.session_state.txt)
-                    save_analysis(analy)
                 st.markdown("### 📊 分析")
-                stoggle("查看分析", analy)
+                # Stream the feedback as it is generated, then save the full text
+                analy = stream_feedback(analyze_transcription(lang, st.session_state.txt, st.session_state.analysis, stream=True))
+                save_user_input(st.session_state.txt)
+                save_analysis(analy)
             else:
                 st.warning("Please enter the transcription text before analyzing.")
 
-    elif option == "输入关键词":
-        st.write("Please proceed to listen...")
-
-        st.session_state.keyds = st.text_area(
-            "输入关键词",
-            value=st.session_state.keyds
-        )
-
-        if st.session_state.keyds:
-            if st.session_state.analysis is None:
-                with st.spinner("音频生成中..."):
-                    st.session_state.analysis = generate_listening_text(lang, st.session_state.keyds)
-                    filename = f"listening/{datetime.now().strftime('%Y%m%d_%H%M%S')}_listening.wav"
-                    speak(st.session_state.analysis, filename)
-                    st.session_state.audio_filename = filename
-                    save_text(st.session_state.analysis, 'listening_text')
-
-            if os.path.exists(st.session_state.audio_filename):
-                st.audio(st.session_state.audio_filename, format="audio/wav", start_time=0)
-            else:
-                st.error("Audio file not found. Please try again.")
-
-            st.session_state.txt = st.text_area(
-                "请输入听到的内容:",
-                value=st.session_state.txt
-            )
-
-            st.write(f"已输入 {len(st.session_state.txt)} 字")
-
-            if st.button("分析 📝"):
-                if st.session_state.txt:
-                    with st.spinner("分析中..."):
-                        analy = analyze_transcription(lang, st.session_state.txt, st.session_state.analysis)
-                        save_user_input(st.session_state.txt)
-                        save_analysis(analy)
-                    st.markdown("### 📊 分析")
-                    stoggle("查看分析", analy)
-                else:
-                    st.warning("Please enter the transcription text before analyzing.")
-        else:
-            st.warning("输入关键词")
-
-    else:  # Upload Text
-        st.write("Please proceed to listen...")
-
-        uploaded_file = st.file_uploader("上传文件")
-
-        if uploaded_file is not None:
-            string_data = StringIO(uploaded_file.getvalue().decode("utf-8")).read()
-            st.session_state.uploaded_text = string_data
-
-            if st.session_state.analysis is None:
-                with st.spinner("音频生成中..."):
-                    st.session_state.analysis = st.session_state.uploaded_text
-                    filename = f"listening/{datetime.now().strftime('%Y%m%d_%H%M%S')}_listening.wav"
-                    speak(st.session_state.analysis, filename)
-                    st.session_state.audio_filename = filename
-                    save_text(st.session_state.analysis, 'listening_text', uploaded_file.name)
-
-            if os.path.exists(st.session_state.audio_filename):
-                st.audio(st.session_state.audio_filename, format="audio/wav", start_time=0)
-            else:
-                st.error("Audio file not found. Please try again.")
-
-            st.session_state.txt = st.text_area(
-                "请输入听到的内容:",
-                value=st.session_state.txt
-            )
-
-            st.write(f"已输入 {len(st.session_state.txt)} 字.")
-
-            if st.button("分析 📝"):
-                if st.session_state.txt:
-                    with st.spinner("分析中..."):
-                        analy = analyze_transcription(lang, st.session_state.txt, st.session_state.analysis)
-                        save_user_input(st.session_state.txt)
-                        save_analysis(analy)
-                    st.markdown("### 📊 分析")
-                    stoggle("查看分析", analy)
-                else:
-                    st.warning("Please enter the transcription text before analyzing.")
-        else:
-            st.warning("上传文件")
-
     # Navigation buttons
     st.markdown("---")
     col1_nav, col2_nav = st.columns(2)
@@ -495,7 +315,8 @@ if genre == "📝听写":
             st.session_state.txt = ''
             st.session_state.keyds = ''
             st.session_state.uploaded_text = ''
-            st.session_state.audio_filename = None
+            st.session_state.audio_bytes = None
+            reset_pipeline(DICTATION.name)
             st.experimental_rerun()
     with col2_nav:
         st.markdown("[🏠 返回主页](/)")
@@ -514,58 +335,34 @@ elif genre == "📝 选择题":
     if option != st.session_state.option:
         st.session_state.option = option
         st.session_state.analysis = None
-        st.session_state.qe = None
         st.session_state.qeq = None
         st.session_state.user_answers = {}
-        st.session_state.audio_filename = None
-
-    if st.session_state.analysis is None:
-        with st.spinner("正在生成音频和问题..."):
-            if option == "随机生成":
-                st.session_state.analysis = generate_listening_text(lang)
-            elif option == "输入关键词":
-                st.session_state.keyds = st.text_area(
-                    "输入关键词",
-                    value=st.session_state.keyds
-                )
-                if st.session_state.keyds:
-                    st.session_state.analysis = generate_listening_text(lang, st.session_state.keyds)
-                else:
-                    st.warning("输入关键词")
-                    st.stop()
-            else:  # Upload Text
-                uploaded_file = st.file_uploader("上传文件")
-                if uploaded_file is not None:
-                    string_data = StringIO(uploaded_file.getvalue().decode("utf-8")).read()
-                    st.session_state.analysis = string_data
-                else:
-                    st.warning("上传文件")
-                    st.stop()
-
-            # Generate audio
-            filename = f"listening/{datetime.now().strftime('%Y%m%d_%H%M%S')}_listening.wav"
-            speak(st.session_state.analysis, filename)
-            st.session_state.audio_filename = filename
-            save_text(st.session_state.analysis, 'listening_text')
-
-            # Generate questions
-            st.session_state.qe = generate_questions(lang, st.session_state.analysis)
-
-            # Debugging: Show the generated questions
-#            st.write("### 📝 Generated Questions:")
-#st.write(st.session_state.qe)
-
-            # Parse the generated questions
-            st.session_state.qeq = parse_mcqs_new(st.session_state.qe, lang)
-
-            # Debugging: Show the parsed questions
-#            st.write("### 🔍 Parsed Questions:")
-#            st.write(st.session_state.qeq)
-
-    if os.path.exists(st.session_state.audio_filename):
-        st.audio(st.session_state.audio_filename, format="audio/wav", start_time=0)
-    else:
-        st.error("Audio file not found. Please try again.")
+        st.session_state.audio_bytes = None
+        reset_pipeline(LISTENING_MCQ.name)
+
+    source, filename = passage_source(option)
+    if option != "随机生成" and not source:
+        st.stop()
+
+    # The player is placed above the spinner so it can appear before the questions are ready
+    audio_slot = st.empty()
+
+    def show_audio(stage, output):
+        # TTS and question generation run side by side; let the student start listening early
+        if stage == "audio" and output:
+            audio_slot.audio(output, format="audio/wav", start_time=0)
+
+    with st.spinner("正在生成音频和问题..."):
+        run = run_pipeline(LISTENING_MCQ, {"lang": lang, "kind": "listening_mcq", "option": option,
+                                           "source": source, "filename": filename},
+                           on_stage=show_audio)
+    st.write(run["saved"])
+    st.session_state.analysis = run["exercise"]["text"]
+    st.session_state.audio_bytes = run["audio"]
+    st.session_state.qeq = run["questions"]
+
+    if not st.session_state.audio_bytes:
+        audio_slot.error("Audio file not found. Please try again.")
 
     # Display the questions in a form
     if st.session_state.qeq and len(st.session_state.qeq) > 0:
@@ -586,15 +383,16 @@ elif genre == "📝 选择题":
                 st.session_state.user_answers[str(idx)] = selected_option
             submit_button = st.form_submit_button("提交 📝")
     else:
-        st.error("No questions were parsed. Please check the format of the generated questions.")
+        submit_button = False
+        st.error("No questions could be generated. Please try again.")
 
     if submit_button:
-        with st.spinner("正在分析中..."):
-            feedback = analyze_answers(st.session_state.qeq, st.session_state.user_answers, lang)
-            save_user_answers(st.session_state.user_answers)
-            save_analysis(feedback)
         st.markdown("### 📊 分析")
-        stoggle("查看分析", feedback)
+        # The score is computed locally and shown at once; only wrong answers go to the LLM
+        scoring, explanation = analyze_answers(st.session_state.qeq, st.session_state.user_answers, lang, stream=True)
+        feedback = show_mcq_result(scoring, explanation)
+        save_user_answers(st.session_state.user_answers)
+        save_analysis(feedback)
 
     # Navigation buttons
     st.markdown("---")
@@ -603,40 +401,42 @@ elif genre == "📝 选择题":
         if st.button("🔄 新的测试"):
             # Reset session state variables for next test
             st.session_state.analysis = None
-            st.session_state.qe = None
             st.session_state.qeq = None
             st.session_state.user_answers = {}
-            st.session_state.audio_filename = None
+            st.session_state.audio_bytes = None
+            reset_pipeline(LISTENING_MCQ.name)
             st.experimental_rerun()
     with col2_nav:
         st.markdown("[🏠 返回主页](/)")
 
 else:  # 🗣️ Conversation
     st.write("Your assistant is online.")
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    for message in st.session_state.messages:
+    if "memory" not in st.session_state:
+        st.session_state.memory = new_conversation_memory()
+    memory = st.session_state.memory
+    for message in memory.turns:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
     if prompt := st.chat_input("Say something..."):
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        memory.add("user", prompt)
         with st.chat_message("user"):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
             with st.spinner("Assistant is typing..."):
-                response = openai.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": m["role"], "content": m["content"]}
-                        for m in st.session_state.messages
-                    ],
-                    max_tokens=1500,
-                    temperature=0.7,
+                # Older turns are folded into a summary so the request stays within the token budget
+                messages = call_with_queue_status(memory.compact)
+                reply = call_with_queue_status(
+                    chat,
+                    messages,
+                    call_site="listening.chat",
+                    task="chat",
+                    cache=False,
                 )
-                reply = response.choices[0].message.content
                 st.markdown(reply)
-                st.session_state.messages.append({"role": "assistant", "content": reply})
+                memory.add("assistant", reply)
+        st.caption(f"{count_message_tokens(messages, memory.model)} tokens sent · "
+                   f"{memory.summarized} turns summarized")
 
     # Navigation buttons
     st.markdown("---")
@@ -653,3 +453,5 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Record this run of the page for the startup report
+page_timer.finish(st.session_state)
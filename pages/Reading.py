@@ -1,13 +1,20 @@
+from leaf.startup import install_import_profiler, PageTimer
+install_import_profiler()
+page_timer = PageTimer("Reading")
+
 import streamlit as st
-import pandas as pd
-import openai
+from leaf.llm import chat
+from leaf.mcq import explain_mistakes, score_answers
+from leaf.reading import generate_questions, generate_reading_text_w
+from leaf.exercise_pool import prefill, random_exercise
 import os
 from datetime import datetime
 from io import StringIO
-from streamlit_extras.stoggle import stoggle
+from leaf.ui import export_openai_key, reset_pipeline, run_pipeline, show_mcq_result, stream_feedback
+from leaf.pipeline import Pipeline, Stage
 
-# Set OpenAI API key
-openai.api_key = st.secrets["openai"]["token"]
+# Pass the OpenAI API key to the shared LLM gateway (not needed with the local provider)
+export_openai_key()
 
 # Set page configuration
 st.set_page_config(page_title="Reading", page_icon="📖")
@@ -15,20 +22,20 @@ st.set_page_config(page_title="Reading", page_icon="📖")
 # Define functions
 
 def save_generated_text(text):
-    """Save the generated text to a file in the 'reading' directory."""
+    """Save the generated text to a file in the 'reading' directory and return the confirmation to show."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"reading/generated_text_{timestamp}.txt"
     with open(filename, "w", encoding="utf-8") as file:
         file.write(text)
-    st.write(f"Generated text saved as {filename}")
+    return f"Generated text saved as {filename}"
 
 def save_uploaded_text(text, original_filename):
-    """Save the uploaded text to a file in the 'reading' directory."""
+    """Save the uploaded text to a file in the 'reading' directory and return the confirmation to show."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"reading/uploaded_text_{timestamp}_{original_filename}"
     with open(filename, "w", encoding="utf-8") as file:
         file.write(text)
-    st.write(f"Uploaded text saved as {filename}")
+    return f"Uploaded text saved as {filename}"
 
 def save_user_input(user_input):
     """Save the user's input to a file in the 'reading' directory."""
@@ -39,12 +46,12 @@ def save_user_input(user_input):
     st.write(f"Your input saved as {filename}")
 
 def save_generated_questions(questions):
-    """Save the generated questions to a file in the 'reading' directory."""
+    """Save the generated questions to a file in the 'reading' directory and return the confirmation to show."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"reading/generated_questions_{timestamp}.txt"
     with open(filename, "w", encoding="utf-8") as file:
         file.write(questions)
-    st.write(f"Generated questions saved as {filename}")
+    return f"Generated questions saved as {filename}"
 
 def save_user_answers(user_answers):
     """Save the user's answers to a file in the 'reading' directory."""
@@ -72,98 +79,30 @@ def generate_reading_text(lang, keywords=None):
         messages = [
             {"role": "system", "content": f"Please generate a random {lang} paragraph for students to practice reading. Please do not include questions or answers."}
         ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=1000,
-        n=1,
-        temperature=0.7,
+    return chat(
+        messages,
+        call_site="reading.generate_reading_text",
+        task="passage",
+        # "随机生成" should give a new text every time
+        cache=bool(keywords),
     )
-    return response.choices[0].message.content
 
-def generate_reading_text_w(lang, keywords=None):
-    if keywords:
-        messages = [
-            {"role": "system", "content": f"Please generate an {lang} paragraph based on the following keywords for students to practice reading:\n\nKeywords:\n{keywords}\n\nPlease also generate several questions based on the {lang} paragraph in {lang}."}
-        ]
-    else:
-        messages = [
-            {"role": "system", "content": f"Please generate a random {lang} paragraph for students to practice reading. Please also generate several questions based on the {lang} paragraph in {lang}."}
-        ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=1000,
-        n=1,
-        temperature=0.7,
-    )
-    return response.choices[0].message.content
-def generate_questions(lang, reference_text):
-    messages = [
-        {"role": "user", "content": (
-            f"Based on the following {lang} text, please create five multiple-choice questions with four options each. "
-            f"Ensure that the correct answers are indicated. Please format the questions and options clearly:\n\n"
-            f"Text:\n{reference_text}\n\n"
-            f"Format:\n1. Question text(only the question text is in {lang})\nA. Option A\nB. Option B\nC. Option C\nD. Option D\nAnswer: X\n"
-            "Please make sure to include the 'Answer: X' line for each question."
-        )}
-    ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=1500,
-        n=1,
-        temperature=0.7,
-    )
-    return response.choices[0].message.content
-
-def parse_questions(question_text):
-    # Parse the generated questions into a structured format
-    # This function assumes that the questions are formatted in a specific way
-    # Modify the parsing logic based on the actual format of the GPT output
-    import re
-    questions = []
-    question_blocks = re.split(r'\n(?=\d+\.)', question_text.strip())
-    for block in question_blocks:
-        lines = block.strip().split('\n')
-        if len(lines) >= 6:
-            question_line = lines[0]
-            options_lines = lines[1:5]
-            answer_line = lines[5]
-            question_match = re.match(r'^\d+\. (.+)', question_line)
-            if question_match:
-                question = question_match.group(1).strip()
-                options = {}
-                for opt_line in options_lines:
-                    opt_match = re.match(r'^([ABCD])\. (.+)', opt_line)
-                    if opt_match:
-                        options[opt_match.group(1)] = opt_match.group(2).strip()
-                answer_match = re.match(r'^Answer:\s*([ABCD])', answer_line)
-                correct_answer = answer_match.group(1) if answer_match else None
-                questions.append({'question': question, 'options': options, 'correct_answer': correct_answer})
-    return questions
-
-def analyze_user_answers(lang, questions, user_answers):
-    # Analyze the user's answers
-    # Prepare the message for GPT
-    messages = [
-        {"role": "user", "content": (
-            f"Please analyze the following {lang} multiple-choice questions and the student's answers.\n\n"
-            f"Questions and Options:\n"
-            f"{format_questions_for_gpt(questions)}\n\n"
-            f"Student's Answers:\n"
-            f"{format_answers_for_gpt(user_answers)}\n\n"
-            "Please provide detailed feedback in Chinese, including the correct answers, explanations for each question, and the student's total score out of 100."
-        )}
-    ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=2000,
-        n=1,
-        temperature=0.5,
+def analyze_user_answers(lang, questions, user_answers, stream=False):
+    """Score the answers locally and ask for explanations of the wrong ones only.
+
+    Returns (scoring, explanation); explanation is None when every answer is correct.
+    """
+    answers = [user_answers.get(f"Question {idx}") for idx in range(1, len(questions) + 1)]
+    scoring = score_answers(questions, answers)
+    explanation = explain_mistakes(
+        lang,
+        questions,
+        scoring,
+        call_site="reading.analyze_user_answers",
+        task="explanation",
+        stream=stream,
     )
-    return response.choices[0].message.content
+    return scoring, explanation
 
 def format_questions_for_gpt(questions):
     # Format questions and options for GPT input
@@ -172,17 +111,10 @@ def format_questions_for_gpt(questions):
         formatted += f"{idx}. {q['question']}\n"
         for option_key, option_text in q['options'].items():
             formatted += f"{option_key}. {option_text}\n"
-        formatted += f"Answer: {q['correct_answer']}\n\n"
+        formatted += f"Answer: {q['answer']}\n\n"
     return formatted
 
-def format_answers_for_gpt(user_answers):
-    # Format user's answers for GPT input
-    formatted = ""
-    for q_num, answer in user_answers.items():
-        formatted += f"{q_num}: {answer}\n"
-    return formatted
-
-def analyze_transcription(lang, student_text=None, reference_text=None):
+def analyze_transcription(lang, student_text=None, reference_text=None, stream=False):
     # Existing function code
     # Do not modify this function
     if student_text and reference_text:
@@ -203,15 +135,40 @@ def analyze_transcription(lang, student_text=None, reference_text=None):
             {"role": "system", "content": f"You are a helpful assistant who can generate an {lang} paragraph for students to practice reading. Please do not include questions or answers."},
         ]
 
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=1000,
-        n=1,
-        temperature=0.5,
+    return chat(
+        messages,
+        call_site="reading.analyze_transcription",
+        task="grading",
+        stream=stream,
     )
+def reading_exercise(lang, option, source, request):
+    """The passage (with open questions) for one "生成新文本" request; "随机生成" takes a ready one from the pool."""
+    if option == "随机生成":
+        # Served from the pre-generated pool, multiple-choice questions included, when one is ready
+        return random_exercise("reading", lang)
+    return {"text": generate_reading_text_w(lang, source)}
+
+def exercise_questions(lang, exercise):
+    """Multiple-choice questions for the passage, unless the pool already made them."""
+    return exercise.get("questions") or generate_questions(lang, exercise["text"])
+
+def save_passage(passage, source, filename):
+    """Save the uploaded text, or the generated passage."""
+    if filename:
+        return save_uploaded_text(source, filename)
+    return save_generated_text(passage)
+
+# The reading flow as a stage DAG; outputs are memoized per session across reruns
+READING = Pipeline("reading", [
+    Stage("exercise", reading_exercise, deps=["lang", "option", "source", "request"]),
+    Stage("passage", lambda exercise: exercise["text"], deps=["exercise"], inline=True),
+    # Save stages are memoized, so each file is written once; the page shows the confirmation on every rerun
+    Stage("saved", save_passage, deps=["passage", "source", "filename"]),
+    Stage("questions", exercise_questions, deps=["lang", "exercise"]),
+    Stage("saved_questions", lambda questions: save_generated_questions(format_questions_for_gpt(questions)),
+          deps=["questions"]),
+])
 
-    return response.choices[0].message.content
 # Ensure the selected language is available
 if 'ke_y' not in st.session_state:
     st.warning("Please select a language on the [main page](/).")
@@ -235,9 +192,6 @@ if 'txt' not in st.session_state:
 if 'option' not in st.session_state:
     st.session_state.option = ''
 
-if 'questions' not in st.session_state:
-    st.session_state.questions = None
-
 if 'user_answers' not in st.session_state:
     st.session_state.user_answers = {}
 
@@ -247,6 +201,10 @@ if 'parsed_questions' not in st.session_state:
 if 'genre' not in st.session_state:
     st.session_state.genre = ''
 
+# Inputs of the last "生成新文本" request, run through the READING pipeline
+if 'reading_inputs' not in st.session_state:
+    st.session_state.reading_inputs = None
+
 # Create the "reading" directory if it doesn't exist
 if not os.path.exists('reading'):
     os.makedirs('reading')
@@ -282,27 +240,32 @@ if option != st.session_state.option or genre != st.session_state.genre:
     st.session_state.keyds = ''
     st.session_state.uploaded_text = ''
     st.session_state.txt = ''
-    st.session_state.questions = None
     st.session_state.user_answers = {}
     st.session_state.parsed_questions = None
+    st.session_state.reading_inputs = None
+    reset_pipeline(READING.name)
 
 st.write("准备进行阅读训练...")
 
+def request_passage(source="", filename=None):
+    # Each click is a new request, so "随机生成" gives a new passage every time
+    previous = st.session_state.reading_inputs
+    st.session_state.reading_inputs = {
+        "lang": lang, "option": option, "source": source, "filename": filename,
+        "request": previous["request"] + 1 if previous else 1,
+    }
+
 # Text generation section
 if option == "随机生成":
+    # Keep random passages ready in the background
+    prefill("reading", lang)
     if st.button("生成新文本"):
-        with st.spinner("文本生成中..."):
-            st.session_state.analysis = generate_reading_text_w(lang)
-            # Save generated text to file
-            save_generated_text(st.session_state.analysis)
+        request_passage()
 elif option == "输入关键词":
     st.session_state.keyds = st.text_area("Please enter keywords:", value=st.session_state.keyds)
     if st.session_state.keyds:
         if st.button("生成新文本"):
-            with st.spinner("文本生成中..."):
-                st.session_state.analysis = generate_reading_text_w(lang, st.session_state.keyds)
-                # Save generated text to file
-                save_generated_text(st.session_state.analysis)
+            request_passage(st.session_state.keyds)
     else:
         st.warning("Please enter keywords to generate the text.")
 elif option == "上传文件":
@@ -311,15 +274,16 @@ elif option == "上传文件":
         string_data = StringIO(uploaded_file.getvalue().decode("utf-8")).read()
         st.session_state.uploaded_text = string_data
         if st.button("Use Uploaded Text"):
-#            st.session_state.analysis = st.session_state.uploaded_text
-
-            st.session_state.analysis = generate_reading_text_w(lang, st.session_state.uploaded_text)
-
-            # Save uploaded text to file
-            save_uploaded_text(st.session_state.uploaded_text, uploaded_file.name)
+            request_passage(st.session_state.uploaded_text, uploaded_file.name)
     else:
         st.warning("Please upload a file to proceed.")
 
+if st.session_state.reading_inputs:
+    with st.spinner("文本生成中..."):
+        run = run_pipeline(READING, st.session_state.reading_inputs, targets=["saved"])
+    st.write(run["saved"])
+    st.session_state.analysis = run["passage"]
+
 # Display the text
 if st.session_state.analysis:
     st.write(st.session_state.analysis)
@@ -338,27 +302,23 @@ if st.session_state.analysis:
 
         if analyze_button:
             if st.session_state.txt:
-                with st.spinner("分析中..."):
-                    # Perform the analysis
-                    analy = analyze_transcription(lang, st.session_state.txt, st.session_state.analysis)
-                    # Save user input to file
-                    save_user_input(st.session_state.txt)
-                    # Save analysis to file
-                    save_analysis(analy)
                 st.markdown("### 📊 分析")
-                stoggle("查看分析", analy)
+                # Perform the analysis, streaming the feedback as it is generated
+                analy = stream_feedback(analyze_transcription(lang, st.session_state.txt, st.session_state.analysis, stream=True))
+                # Save user input to file
+                save_user_input(st.session_state.txt)
+                # Save analysis to file
+                save_analysis(analy)
             else:
                 st.warning("Please enter the text you read before analyzing.")
 
     elif genre == "📝 选择题":
         # Generate questions based on the text
-        if st.session_state.questions is None:
-            with st.spinner("问题生成中..."):
-                st.session_state.questions = generate_questions(lang, st.session_state.analysis)
-                # Parse the generated questions into a structured format
-                st.session_state.parsed_questions = parse_questions(st.session_state.questions)
-                # Save generated questions to file
-                save_generated_questions(st.session_state.questions)
+        with st.spinner("问题生成中..."):
+            # The passage is memoized, so only the question stages run here
+            run = run_pipeline(READING, st.session_state.reading_inputs, targets=["saved_questions"])
+        st.write(run["saved_questions"])
+        st.session_state.parsed_questions = run["questions"]
 
         if st.session_state.parsed_questions:
             # Display the questions and collect user answers
@@ -380,15 +340,14 @@ if st.session_state.analysis:
                 analyze_button = st.form_submit_button("提交 📝")
 
             if analyze_button:
-                with st.spinner("分析中..."):
-                    # Analyze the user's answers
-                    analysis = analyze_user_answers(lang, st.session_state.parsed_questions, st.session_state.user_answers)
-                    # Save user answers to file
-                    save_user_answers(st.session_state.user_answers)
-                    # Save analysis to file
-                    save_analysis(analysis)
                 st.markdown("### 📊 分析")
-                stoggle("查看分析", analysis)
+                # The score is computed locally and shown at once; only wrong answers go to the LLM
+                scoring, explanation = analyze_user_answers(lang, st.session_state.parsed_questions, st.session_state.user_answers, stream=True)
+                analysis = show_mcq_result(scoring, explanation)
+                # Save user answers to file
+                save_user_answers(st.session_state.user_answers)
+                # Save analysis to file
+                save_analysis(analysis)
         else:
             st.warning("Failed to generate questions. Please try again.")
 
@@ -402,9 +361,10 @@ if st.session_state.analysis:
             st.session_state.txt = ''
             st.session_state.keyds = ''
             st.session_state.uploaded_text = ''
-            st.session_state.questions = None
             st.session_state.user_answers = {}
             st.session_state.parsed_questions = None
+            st.session_state.reading_inputs = None
+            reset_pipeline(READING.name)
             st.experimental_rerun()
     with col2:
         st.markdown("[🏠 返回主页](/)")
@@ -423,3 +383,5 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Record this run of the page for the startup report
+page_timer.finish(st.session_state)
@@ -1,22 +1,27 @@
-from faster_whisper import WhisperModel
-from streamlit_extras.stoggle import stoggle
-import openai
+from leaf.startup import install_import_profiler, PageTimer
+install_import_profiler()
+page_timer = PageTimer("Speaking")
+
+from leaf.ui import export_openai_key, stream_feedback
 import os
-import io
 import streamlit as st
-from pydub import AudioSegment
-import multiprocessing
 from audio_recorder_streamlit import audio_recorder
 from datetime import datetime
+import time
+import queue
+from leaf.speaking import analyze_transcription
+from leaf.asr import (SAMPLE_RATE, LANGUAGE_CODES, model_stats, current_rss_mb, decode_wav_bytes,
+                      encode_wav_bytes, archive_audio)
+from leaf.asr_pool import get_transcription_service, ServerBusy
+from leaf.streaming import StreamingTranscriber, frame_to_array
+from leaf.tiers import select_tier, transcribe_options, measured_rtf
+from leaf.fluency import fluency_metrics
 
 # Set environment variable to prevent OMP error
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
 
-# Set multiprocessing start method to 'fork' (for macOS)
-multiprocessing.set_start_method('fork', force=True)
-
-# Set OpenAI API key
-openai.api_key = st.secrets["openai"]["token"]
+# Pass the OpenAI API key to the shared LLM gateway (not needed with the local provider)
+export_openai_key()
 
 # Create the "speaking" directory if it doesn't exist
 if not os.path.exists('speaking'):
@@ -25,44 +30,6 @@ if not os.path.exists('speaking'):
 # Set page configuration
 st.set_page_config(page_title="Speaking", page_icon="🗣️")
 
-# Define functions
-def transcribe_audio(lang1, audio_file_path):
-    try:
-        print("Starting transcription...")
-        # Transcribe the audio file, specify language
-        segments, _ = whisper_model.transcribe(audio_file_path, language=lang1)
-        print("Transcription complete.")
-        # Extract and return the transcription text
-        transcription_text = ''.join(segment.text for segment in segments)
-        return transcription_text
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        return ""
-
-def analyze_transcription(lang, transcription):
-    messages = [
-        {
-            "role": "system",
-            "content": f"You are a helpful assistant who analyzes the quality of {lang} speech and gives grades to students. Make sure to reply directly without saying sure or yes."
-        },
-        {
-            "role": "user",
-            "content": (
-                f"Please analyze the following {lang} speech of a student for pronunciation, fluency, and grammatical aspects. "
-                f"Please do this one sentence at a time in Chinese:\n\n"
-                f"{transcription}\n\n"
-                "Note: please use a 100-point grading scale and show the grade at the end. Provide detailed feedback in Chinese and also list the original transcription, the potential improved transcription, and where you deducted points."
-            )
-        }
-    ]
-    response = openai.chat.completions.create(
-        model="gpt-4",  # or "gpt-3.5-turbo"
-        messages=messages,
-        max_tokens=2000,
-        temperature=0.5,
-    )
-    return response.choices[0].message.content
-
 # Ensure the selected language is available
 if 'ke_y' not in st.session_state:
     st.warning("Please select a language on the [main page](/).")
@@ -71,23 +38,33 @@ if 'ke_y' not in st.session_state:
 lang = st.session_state.ke_y
 
 # Map language to language code
-language_codes = {
-    "English": "en",
-    "Japanese": "ja",
-    "German": "de",
-    "French": "fr",
-    "Arabic": "ar",
-    "Chinese": "zh",
-    "Spanish": "es",
-    "Russian": "ru",
-    "Korean": "ko",  # Added Korean language code
-    "Greek": "el",
-    "Xhosa": "xh"# Added Korean language code
-}
-lang1 = language_codes.get(lang, "en")  # Default to English if not found
-
-# Initialize Whisper model
-whisper_model = WhisperModel("medium", device="cpu", compute_type="int8", cpu_threads=8, num_workers=8)
+lang1 = LANGUAGE_CODES.get(lang, "en")  # Default to English if not found
+
+# Shared transcription service (fixed worker pool, loaded once per server process)
+asr_service = get_transcription_service()
+
+# Warm the model this language normally uses, in the background so the page draws at once
+default_tier = select_tier(lang, 30)
+asr_service.warm(default_tier["model_size"], default_tier["compute_type"])
+
+# Show the loaded models, memory usage and queue
+with st.sidebar.expander("🧠 模型状态"):
+    queue_stats = asr_service.stats()
+    st.write(f"转写队列: {queue_stats['queue_depth']}/{queue_stats['max_queue']}, "
+             f"忙碌 {queue_stats['busy']}/{queue_stats['workers']}")
+    st.write(f"平均等待: {queue_stats['avg_wait_seconds']}s (p95 {queue_stats['p95_wait_seconds']}s)")
+    if asr_service.cache is not None:
+        cache_stats = asr_service.cache.stats()
+        st.write(f"转写缓存命中率: {cache_stats['hit_rate']:.0%} "
+                 f"({cache_stats['memory_hits'] + cache_stats['disk_hits']} 命中 / {cache_stats['misses']} 未命中)")
+    states = {"loading": "加载中...", "failed": "加载失败"}
+    for size, compute_type, state in asr_service.warm_status():
+        if state in states:
+            st.write(f"**{size}/{compute_type}**: {states[state]}")
+    for stats in model_stats():
+        st.write(f"**{stats['size']}/{stats['compute_type']}** ({stats['cpu_threads']} 线程): "
+                 f"加载 {stats['load_seconds']}s, +{stats['rss_delta_mb']} MB")
+    st.write(f"进程内存: {current_rss_mb():.0f} MB")
 
 # Display title and introduction
 st.title("🗣️ 口语训练")
@@ -97,62 +74,174 @@ st.markdown(f"""
 """)
 st.markdown("---")
 
-# Create the form
-with st.form(key='speaking_form'):
+mode = st.radio("请选择录音方式:", ["🎙️ 录音后分析", "⚡ 实时转写"], index=0, horizontal=True)
+
+if 'live_transcriber' not in st.session_state:
+    st.session_state.live_transcriber = None
+
+# Whether the live stream was playing on the last run, to tell a new recording apart
+if 'live_playing' not in st.session_state:
+    st.session_state.live_playing = False
+
+transcription = None
+
+if mode == "🎙️ 录音后分析":
+    # Create the form
+    with st.form(key='speaking_form'):
+        st.write("### 📢 开始录音")
+        audio_bytes = audio_recorder(
+            text="点击开始录音",
+            recording_color="#FF0000",
+            neutral_color="#00FF00"
+        )
+
+        # Input title
+        title = st.text_input(label="请输入音频文件名:")
+
+        # Submit button
+        submit_button = st.form_submit_button(label='分析 📝')
+
+    if submit_button:
+        if audio_bytes is None:
+            st.warning("Please record some audio before submitting.")
+        elif title.strip() == "":
+            st.warning("Please enter a title for your recording.")
+        else:
+            with st.spinner("转写中..."):
+                # Generate unique filenames
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                audio_filename = f"speaking/{title}_{timestamp}.wav"
+                analysis_filename = f"speaking/analysis_{title}_{timestamp}.txt"
+
+                # Archive the recording in the background; transcription works from memory
+                archive_audio(audio_bytes, audio_filename)
+                audio_array = decode_wav_bytes(audio_bytes)
+
+                # Pick the model tier for this language and clip length
+                tier = select_tier(lang, len(audio_array) / SAMPLE_RATE)
+
+                # Queue the transcription on the shared worker pool
+                try:
+                    job = asr_service.submit(lang1, audio_array, detailed=True, **transcribe_options(tier))
+                except ServerBusy:
+                    st.error("服务器繁忙，请稍后再试。")
+                    st.stop()
+
+                # Report queue position while waiting
+                queue_status = st.empty()
+                while not job.done():
+                    position = asr_service.position(job)
+                    if position:
+                        queue_status.info(f"排队中: 前面还有 {position} 个请求 (已等待 {job.wait_seconds:.0f}s)")
+                    else:
+                        queue_status.info("正在转写...")
+                    time.sleep(0.5)
+                queue_status.empty()
+                transcription = job.result()
+                tier_note = f"模型: {tier['name']} ({tier['model_size']}/{tier['compute_type']}, beam {tier['beam_size']})"
+                if tier["name"] != tier["preferred"]:
+                    tier_note += f", 因超出延迟预算由 {tier['preferred']} 降级"
+                rtf = measured_rtf(tier["name"])
+                if rtf is not None:
+                    tier_note += f", RTF {rtf:.2f}"
+                if job.cached:
+                    tier_note += ", 来自缓存"
+                st.caption(f"{tier_note}; 排队等待 {job.wait_seconds:.1f}s")
+
+else:  # Live transcription
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+
     st.write("### 📢 开始录音")
-    audio_bytes = audio_recorder(
-        text="点击开始录音",
-        recording_color="#FF0000",
-        neutral_color="#00FF00"
+    webrtc_ctx = webrtc_streamer(
+        key="speaking_live",
+        mode=WebRtcMode.SENDONLY,
+        audio_receiver_size=1024,
+        media_stream_constraints={"video": False, "audio": True},
     )
+    partial_area = st.empty()
+
+    if webrtc_ctx.state.playing:
+        # A new recording (stopped, then started again) starts from an empty transcript
+        if not st.session_state.live_playing or st.session_state.live_transcriber is None:
+            st.session_state.live_transcriber = StreamingTranscriber(lang1, asr_service, lang=lang)
+            st.session_state.live_playing = True
+        transcriber = st.session_state.live_transcriber
+
+        # Transcribe each utterance as soon as the speaker pauses
+        while webrtc_ctx.state.playing:
+            try:
+                frames = webrtc_ctx.audio_receiver.get_frames(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                for frame in frames:
+                    transcriber.feed(frame_to_array(frame))
+            except ServerBusy:
+                st.error("服务器繁忙，请稍后再试。")
+                st.stop()
+            partial_area.markdown(f"**实时转写:** {transcriber.partial_text()}")
+        # The stream stopped during this run
+        st.session_state.live_playing = False
+    else:
+        st.session_state.live_playing = False
+        if st.session_state.live_transcriber is not None:
+            partial_area.markdown(f"**实时转写:** {st.session_state.live_transcriber.partial_text()}")
 
-    # Input title
     title = st.text_input(label="请输入音频文件名:")
+    if st.button("分析 📝"):
+        if st.session_state.live_transcriber is None:
+            st.warning("Please record some audio before submitting.")
+        elif title.strip() == "":
+            st.warning("Please enter a title for your recording.")
+        else:
+            with st.spinner("转写中..."):
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                audio_filename = f"speaking/{title}_{timestamp}.wav"
+                analysis_filename = f"speaking/analysis_{title}_{timestamp}.txt"
 
-    # Submit button
-    submit_button = st.form_submit_button(label='分析 📝')
+                # Only the final utterance is still left to transcribe here
+                transcriber = st.session_state.live_transcriber
+                transcription = transcriber.finish()
+                archive_audio(encode_wav_bytes(transcriber.audio()), audio_filename)
+                st.session_state.live_transcriber = None
 
-if submit_button:
-    if audio_bytes is None:
-        st.warning("Please record some audio before submitting.")
-    elif title.strip() == "":
-        st.warning("Please enter a title for your recording.")
-    else:
-        with st.spinner("录音保存中..."):
-            # Generate unique filenames
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            audio_filename = f"speaking/{title}_{timestamp}.wav"
-            analysis_filename = f"speaking/analysis_{title}_{timestamp}.txt"
-
-            # Save the audio to a file in the "speaking" directory
-            audio_segment = AudioSegment.from_file(io.BytesIO(audio_bytes), format="wav")
-            audio_segment.export(audio_filename, format="wav")
-            st.write(f"Audio saved as {audio_filename}")
-
-            # Transcribe audio
-            transcription_text = transcribe_audio(lang1, audio_filename)
-            st.write("### 📝 Transcription")
-            st.write(transcription_text)
-
-            # Analyze transcription
-            analysis = analyze_transcription(lang, transcription_text)
-            st.write("### 📊 分析")
-            stoggle("查看分析", analysis)
-
-            # Save analysis to a file in the "speaking" directory
-            with open(analysis_filename, "w", encoding="utf-8") as txt_file:
-                txt_file.write(analysis)
-            st.write(f"Analysis saved as {analysis_filename}")
-
-        # Navigation buttons
-        st.markdown("---")
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("🔄 新的测试"):
-                # Reset the form or rerun
-                st.experimental_rerun()
-        with col2:
-            st.markdown("[🏠 返回主页](/)")
+if transcription is not None:
+    transcription_text = transcription["text"]
+    st.write("### 📝 Transcription")
+    st.write(transcription_text)
+
+    # Fluency metrics are computed locally and shown before the LLM replies
+    metrics = fluency_metrics(transcription["words"], transcription["duration"], lang1)
+    if metrics:
+        st.write("### ⏱️ 流利度")
+        col_rate, col_pause, col_filler, col_conf = st.columns(4)
+        col_rate.metric("语速", f"{metrics['speech_rate']:.0f}", help=metrics["rate_unit"])
+        col_pause.metric("停顿次数", metrics["pause_count"], help=f"最长 {metrics['max_pause']}s")
+        col_filler.metric("填充词比例", f"{metrics['filler_ratio']:.1%}")
+        col_conf.metric("识别置信度", f"{metrics['mean_confidence']:.2f}")
+        if metrics["low_confidence_words"]:
+            st.caption("发音可能不清晰: " + ", ".join(w["word"] for w in metrics["low_confidence_words"]))
+
+    # Analyze transcription, streaming the feedback as it is generated
+    st.write("### 📊 分析")
+    analysis = stream_feedback(analyze_transcription(lang, transcription_text, metrics, stream=True))
+
+    # Save analysis to a file in the "speaking" directory
+    with open(analysis_filename, "w", encoding="utf-8") as txt_file:
+        txt_file.write(analysis)
+    st.write(f"Analysis saved as {analysis_filename}")
+    st.write(f"Audio saved as {audio_filename}")
+
+    # Navigation buttons
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🔄 新的测试"):
+            # Reset the form or rerun
+            st.session_state.live_transcriber = None
+            st.experimental_rerun()
+    with col2:
+        st.markdown("[🏠 返回主页](/)")
 
 # Footer
 st.markdown("---")
@@ -165,3 +254,5 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Record this run of the page for the startup report
+page_timer.finish(st.session_state)
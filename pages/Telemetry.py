@@ -0,0 +1,67 @@
+from leaf.startup import install_import_profiler, PageTimer
+install_import_profiler()
+page_timer = PageTimer("Telemetry")
+
+import streamlit as st
+from collections import Counter, defaultdict
+from datetime import datetime
+from leaf.config import get_section
+from leaf.telemetry import read_events, summarize, summarize_tasks
+
+# Set page configuration
+st.set_page_config(page_title="Telemetry", page_icon="📈")
+
+st.title("📈 调用统计")
+settings = get_section("telemetry")
+st.markdown(f"""
+每一次 LLM、TTS 和 ASR 调用的耗时、token、结果和估算费用.
+记录保存在 `{settings["dir"]}/`; Prometheus 指标: `http://{settings["bind"]}:{settings["metrics_port"]}/metrics`
+""")
+st.markdown("---")
+
+hours = st.selectbox("时间范围", [1, 6, 24, 24 * 7], index=2, format_func=lambda h: f"最近 {h} 小时")
+events = read_events(hours)
+
+if not events:
+    st.info("该时间范围内还没有调用记录.")
+else:
+    rows = summarize(events)
+    calls = sum(row["calls"] for row in rows)
+    errors = sum(row["errors"] for row in rows)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("调用次数", calls)
+    col2.metric("失败率", f"{errors / calls:.1%}" if calls else "-")
+    col3.metric("Token", sum(row["prompt_tokens"] + row["completion_tokens"] for row in rows))
+    col4.metric("估算费用 (USD)", f"{sum(row['cost_usd'] for row in rows):.2f}")
+
+    st.subheader("按页面的费用")
+    cost_by_page = defaultdict(float)
+    for row in rows:
+        cost_by_page[row["page"]] += row["cost_usd"]
+    # One column keyed by page; a flat dict of scalars has no index for the chart
+    st.bar_chart({"cost_usd": dict(cost_by_page)})
+
+    st.subheader("按功能")
+    st.dataframe(rows, use_container_width=True)
+
+    st.subheader("按任务和模型")
+    st.caption("模型路由见 leaf.toml 的 [routing]; truncated = 回复被 max_tokens 截断的次数, quality = 任务质量信号 (0-1)")
+    st.dataframe(summarize_tasks(events), use_container_width=True)
+
+    st.subheader("每分钟调用次数")
+    # Quality signals are not calls
+    call_events = [event for event in events if event["kind"] != "quality"]
+    per_minute = Counter(datetime.fromtimestamp(event["ts"]).replace(second=0, microsecond=0)
+                         for event in call_events)
+    st.line_chart({"calls": dict(sorted(per_minute.items()))})
+
+    failed = [event for event in call_events if event["outcome"] == "error"]
+    if failed:
+        st.subheader("最近的失败")
+        st.dataframe([
+            {"time": datetime.fromtimestamp(event["ts"]).strftime("%m-%d %H:%M:%S"), "kind": event["kind"],
+             "page": event["page"], "function": event["function"], "seconds": event["seconds"]}
+            for event in reversed(failed[-20:])
+        ], use_container_width=True)
+
+page_timer.finish(st.session_state)
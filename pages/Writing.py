@@ -1,15 +1,18 @@
+from leaf.startup import install_import_profiler, PageTimer
+install_import_profiler()
+page_timer = PageTimer("Writing")
+
 import streamlit as st
-import pandas as pd
-import altair as alt
 import os
-import time
-import openai
+from leaf.writing import generate_writing_prompt
+from leaf.exercise_pool import prefill, random_exercise
 from datetime import datetime
 from io import StringIO
-from streamlit_extras.stoggle import stoggle
+from leaf.ui import export_openai_key, reset_pipeline, run_pipeline, show_writing_grading
+from leaf.pipeline import Pipeline, Stage
 
-# Set your OpenAI API key
-openai.api_key = st.secrets["openai"]["token"]
+# Pass the OpenAI API key to the shared LLM gateway (not needed with the local provider)
+export_openai_key()
 
 # Create the "writing" directory if it doesn't exist
 if not os.path.exists('writing'):
@@ -35,7 +38,7 @@ st.markdown("---")
 
 # Define functions
 def save_prompt(prompt, original_filename=None):
-    """Save the writing prompt to a file in the 'writing' directory."""
+    """Save the writing prompt to a file in the 'writing' directory and return the confirmation to show."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     if original_filename:
         filename = f"writing/prompt_{timestamp}_{original_filename}"
@@ -43,7 +46,7 @@ def save_prompt(prompt, original_filename=None):
         filename = f"writing/prompt_{timestamp}.txt"
     with open(filename, "w", encoding="utf-8") as file:
         file.write(prompt)
-    st.write(f"Prompt saved as {filename}")
+    return f"Prompt saved as {filename}"
 
 def save_user_input(user_input):
     """Save the user's input to a file in the 'writing' directory."""
@@ -61,79 +64,32 @@ def save_analysis(analysis):
         file.write(analysis)
     st.write(f"Analysis saved as {filename}")
 
-def generate_writing_prompt(lang, keywords=None):
-    """Generate a writing prompt based on the language and optional keywords."""
-    if keywords:
-        messages = [
-            {
-                "role": "system",
-                "content": f"Please generate a {lang} writing prompt (prompt must be in {lang}) based on the following keywords:\n\nKeywords:\n{keywords}\n\n"
-            }
-        ]
-    else:
-        messages = [
-            {
-                "role": "system",
-                "content": f"Please generate a random {lang} writing prompt (prompt must be in {lang}) for a student to practice."
-            }
-        ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=150,
-        temperature=0.7,
-    )
-    return response.choices[0].message.content.strip()
-
-def analyze_transcription(lang, transcription):
-    """Analyze the student's writing."""
-    messages = [
-        {
-            "role": "system",
-            "content": f"You are a helpful assistant who analyzes the quality of {lang} writing and gives grades to students in Chinese.",
-        },
-        {
-            "role": "user",
-            "content": (
-                f"Please analyze the following {lang} text for precision, clarity, and grammatical correctness in Chinese. "
-                f"Please do this one sentence at a time:\n\n"
-                f"{transcription}\n\n"
-                "Note: please use a 100-point grading scale and show the grade at the end. Provide detailed feedback and also list the original writing, the potential improved writing, and where you deducted points. Everything in this analysis must be in Chinese"
-            ),
-        },
-    ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=2000,
-        temperature=0.5,
-    )
-    return response.choices[0].message.content.strip()
-
-def analyze_transcription_with_prompt(lang, transcription, prompt):
-    """Analyze the student's writing based on the provided prompt."""
-    messages = [
-        {
-            "role": "system",
-            "content": f"You are a helpful assistant who analyzes the quality of {lang} writing and gives grades to students in Chinese.",
-        },
-        {
-            "role": "user",
-            "content": (
-                f"A student wrote the following {lang} text based on the given prompt. Please analyze the student's writing for precision, clarity, and grammatical correctness, and how well they addressed the prompt in Chinese.\n\n"
-                f"Prompt:\n{prompt}\n\n"
-                f"Student's Writing:\n{transcription}\n\n"
-                "Please do this one sentence at a time. Note: use a 100-point grading scale and show the grade at the end. Provide detailed feedback and also list the original writing, potential improvements, and where you deducted points. Everything here must be in Chinese"
-            ),
-        },
-    ]
-    response = openai.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        max_tokens=2000,
-        temperature=0.5,
-    )
-    return response.choices[0].message.content.strip()
+def writing_prompt(lang, option, source, request):
+    """The prompt for one "生成题目" request; an uploaded file is used as the prompt itself."""
+    if option == "随机生成":
+        # Served from the pre-generated pool when one is ready
+        return random_exercise("writing", lang)["text"]
+    if option == "输入关键词":
+        return generate_writing_prompt(lang, source)
+    return source
+
+# The prompt flow as a stage DAG; outputs are memoized per session across reruns
+WRITING = Pipeline("writing", [
+    Stage("prompt", writing_prompt, deps=["lang", "option", "source", "request"]),
+    # Memoized, so the file is written once per prompt; the page shows the confirmation on every rerun
+    Stage("saved", save_prompt, deps=["prompt", "filename"]),
+])
+
+def request_prompt(source="", filename=None):
+    """Run the prompt pipeline for a new request and keep the result in the session."""
+    st.session_state.prompt_requests = st.session_state.get("prompt_requests", 0) + 1
+    inputs = {"lang": lang, "option": option, "source": source, "filename": filename,
+              "request": st.session_state.prompt_requests}
+    with st.spinner("题目生成中..."):
+        run = run_pipeline(WRITING, inputs)
+    st.write(run["saved"])
+    st.session_state.prompt = run["prompt"]
+
 # Initialize session state variables
 if 'analysis' not in st.session_state:
     st.session_state.analysis = None
@@ -166,20 +122,19 @@ if option != st.session_state.option:
     st.session_state.uploaded_text = ''
     st.session_state.txt = ''
     st.session_state.prompt = ''
+    reset_pipeline(WRITING.name)
 
 # Writing Prompt Generation
 if option == "随机生成":
+    # Keep random prompts ready in the background
+    prefill("writing", lang)
     if st.button("生成题目"):
-        with st.spinner("题目生成中..."):
-            st.session_state.prompt = generate_writing_prompt(lang)
-            save_prompt(st.session_state.prompt)
+        request_prompt()
 elif option == "输入关键词":
     st.session_state.keyds = st.text_area("请输入关键词:", value=st.session_state.keyds)
     if st.session_state.keyds:
         if st.button("生成题目"):
-            with st.spinner("题目生成中..."):
-                st.session_state.prompt = generate_writing_prompt(lang, st.session_state.keyds)
-                save_prompt(st.session_state.prompt)
+            request_prompt(st.session_state.keyds)
     else:
         st.warning("Please enter keywords to generate the prompt.")
 elif option == "上传文件":
@@ -188,8 +143,7 @@ elif option == "上传文件":
         string_data = StringIO(uploaded_file.getvalue().decode("utf-8")).read()
         st.session_state.uploaded_text = string_data
         if st.button("上传文件"):
-            st.session_state.prompt = st.session_state.uploaded_text
-            save_prompt(st.session_state.prompt, uploaded_file.name)
+            request_prompt(st.session_state.uploaded_text, uploaded_file.name)
     else:
         st.warning("Please upload a file to proceed.")
 
@@ -208,22 +162,13 @@ if st.session_state.prompt:
         if txt.strip() == "":
             st.warning("Please enter some text to analyze.")
         else:
-            with st.spinner("分析中..."):
-                # Perform the analysis
-                if option == "随机生成" or option == "输入关键词":
-                    analysis = analyze_transcription_with_prompt(lang, txt, st.session_state.prompt)
-                elif option == "上传文件":
-                    analysis = analyze_transcription_with_prompt(lang, txt, st.session_state.prompt)
-                else:
-                    analysis = analyze_transcription(lang, txt)
-
-                # Save user input and analysis to files
-                save_user_input(txt)
-                save_analysis(analysis)
-
-            # Display the feedback
             st.markdown("### 📊 分析")
-            stoggle("查看分析", analysis)
+            # Rows appear as their batches are graded; unchanged sentences reuse earlier grades
+            analysis = show_writing_grading(lang, txt, st.session_state.prompt)
+
+            # Save user input and analysis to files
+            save_user_input(txt)
+            save_analysis(analysis)
 
             # Action Buttons
             st.markdown("---")
@@ -234,6 +179,7 @@ if st.session_state.prompt:
                     st.session_state.prompt = ''
                     st.session_state.analysis = None
                     st.session_state.txt = ''
+                    reset_pipeline(WRITING.name)
                     st.experimental_rerun()
             with col2:
                 st.markdown("[🏠 返回主页](/)")
@@ -249,4 +195,5 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
-
+# Record this run of the page for the startup report
+page_timer.finish(st.session_state)
@@ -0,0 +1,17 @@
+import pytest
+
+from leaf import llm
+from leaf.cache import TieredCache
+from leaf.providers import LocalProvider
+
+
+@pytest.fixture
+def local_llm(tmp_path, monkeypatch):
+    """The LLM gateway on a fast local provider, with its own response cache and no scheduler."""
+    # Telemetry and caches use relative directories
+    monkeypatch.chdir(tmp_path)
+    provider = LocalProvider(first_token_seconds=0.0, tokens_per_second=1e6, tts_seconds_per_audio_second=0.0)
+    monkeypatch.setattr(llm, "get_provider", lambda: provider)
+    monkeypatch.setattr(llm, "get_scheduler", lambda: None)
+    monkeypatch.setattr(llm, "_cache", TieredCache(str(tmp_path / "llm-cache")))
+    return provider
@@ -0,0 +1,50 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from leaf.asr import SAMPLE_RATE, decode_wav_bytes, encode_wav_bytes
+
+
+def wav_bytes(frames, sampwidth, channels=1, rate=SAMPLE_RATE):
+    wav_io = io.BytesIO()
+    with wave.open(wav_io, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sampwidth)
+        wf.setframerate(rate)
+        wf.writeframes(frames)
+    return wav_io.getvalue()
+
+
+def test_8_bit_is_unsigned():
+    audio = decode_wav_bytes(wav_bytes(bytes([128, 255, 0]), 1))
+    assert audio == pytest.approx([0.0, 127 / 128, -1.0])
+
+
+def test_16_bit():
+    audio = decode_wav_bytes(wav_bytes(np.array([0, 16384, -32768], dtype="<i2").tobytes(), 2))
+    assert audio == pytest.approx([0.0, 0.5, -1.0])
+
+
+def test_24_bit_is_sign_extended():
+    # 0x400000 = +0.5, 0x800000 = -1.0, little-endian
+    frames = bytes([0, 0, 0, 0, 0, 0x40, 0, 0, 0x80])
+    assert decode_wav_bytes(wav_bytes(frames, 3)) == pytest.approx([0.0, 0.5, -1.0])
+
+
+def test_32_bit():
+    audio = decode_wav_bytes(wav_bytes(np.array([0, 1 << 30, -(1 << 31)], dtype="<i4").tobytes(), 4))
+    assert audio == pytest.approx([0.0, 0.5, -1.0])
+
+
+def test_stereo_is_downmixed_and_resampled():
+    frames = np.array([16384, 0] * 8000, dtype="<i2").tobytes()
+    audio = decode_wav_bytes(wav_bytes(frames, 2, channels=2, rate=8000))
+    assert len(audio) == SAMPLE_RATE
+    assert audio == pytest.approx(np.full(SAMPLE_RATE, 0.25))
+
+
+def test_encode_round_trip():
+    audio = np.linspace(-0.5, 0.5, 100, dtype=np.float32)
+    assert decode_wav_bytes(encode_wav_bytes(audio)) == pytest.approx(audio, abs=1e-4)
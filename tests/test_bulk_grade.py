@@ -0,0 +1,40 @@
+import json
+
+from leaf import bulk_grade
+
+
+def test_extract_score_takes_the_last_grade():
+    assert bulk_grade.extract_score("第一句 8/10 ... 总分: 85/100") == 85
+    assert bulk_grade.extract_score("得分 72.5 分") == 72.5
+    assert bulk_grade.extract_score("score 150/100, then 90/100") == 90
+    assert bulk_grade.extract_score("no grade here") is None
+    assert bulk_grade.extract_score(None) is None
+
+
+def test_only_successful_results_count_as_graded(tmp_path):
+    bulk_grade.write_result(str(tmp_path), "alice", {"student": "alice", "status": "ok"})
+    bulk_grade.write_result(str(tmp_path), "bob", {"student": "bob", "status": "error: timeout"})
+    assert bulk_grade.is_graded(str(tmp_path), "alice")
+    assert not bulk_grade.is_graded(str(tmp_path), "bob")
+    assert not bulk_grade.is_graded(str(tmp_path), "carol")
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_find_recordings_and_summary(tmp_path):
+    recordings = tmp_path / "in"
+    recordings.mkdir()
+    for name in ("b.wav", "a.mp3", "notes.txt"):
+        (recordings / name).write_bytes(b"")
+    assert [student for student, _ in bulk_grade.find_recordings(str(recordings))] == ["a", "b"]
+
+    output = tmp_path / "out"
+    output.mkdir()
+    bulk_grade.write_result(str(output), "a", {"student": "a", "score": 80, "status": "ok",
+                                               "fluency": {"speech_rate": 120}})
+    summary = (output / "summary.csv")
+    bulk_grade.write_summary(str(output))
+    lines = summary.read_text(encoding="utf-8").splitlines()
+    assert lines[0].split(",") == bulk_grade.SUMMARY_COLUMNS
+    row = dict(zip(bulk_grade.SUMMARY_COLUMNS, lines[1].split(",")))
+    assert (row["student"], row["score"], row["speech_rate"]) == ("a", "80", "120")
+    assert json.loads((output / "a.json").read_text(encoding="utf-8"))["status"] == "ok"
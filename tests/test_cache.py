@@ -0,0 +1,69 @@
+import os
+
+from leaf import cache as cache_module
+from leaf.cache import TieredCache, hash_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+def test_hash_key_separates_parts():
+    assert hash_key("ab", "c") != hash_key("a", "bc")
+    assert hash_key({"b": 1, "a": 2}) == hash_key({"a": 2, "b": 1})
+    assert hash_key(b"audio") == hash_key(b"audio")
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    cache = TieredCache(str(tmp_path), max_entries=1)
+    cache.put("aa1", {"text": "one"})
+    cache.put("bb2", {"text": "two"})
+    # "aa1" left memory (one entry) but is still on disk
+    assert cache.get("aa1") == {"text": "one"}
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get("aa1") == {"text": "one"}
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.get("cc3") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_counts_from_the_write(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock.time)
+    cache = TieredCache(str(tmp_path), ttl_seconds=100)
+    cache.put("aa1", "reply")
+    clock.now += 60
+    cache.clear_memory()
+    assert cache.get("aa1") == "reply"
+    # Reading the entry did not extend its life
+    clock.now += 60
+    cache.clear_memory()
+    assert cache.get("aa1") is None
+    cache.put("bb2", "reply")
+    clock.now += 101
+    assert cache.get("bb2") is None
+
+
+def test_files_without_write_time_are_misses(tmp_path):
+    cache = TieredCache(str(tmp_path))
+    os.makedirs(tmp_path / "aa")
+    (tmp_path / "aa" / "aa1.json").write_text('"old format"', encoding="utf-8")
+    assert cache.get("aa1") is None
+
+
+def test_disk_cap_evicts_least_recently_used(tmp_path):
+    cache = TieredCache(str(tmp_path), max_disk_mb=0.01)
+    value = "x" * 3000
+    for i, key in enumerate(["aa1", "bb2", "cc3"]):
+        cache.put(key, value)
+        # Distinct mtimes, oldest first
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    cache.put("dd4", value)
+    assert cache.stats()["evictions"] >= 1
+    assert not os.path.exists(cache._path("aa1"))
+    assert os.path.exists(cache._path("dd4"))
+    assert cache.stats()["disk_mb"] <= 0.01
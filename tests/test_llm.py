@@ -0,0 +1,23 @@
+from leaf import llm
+
+MESSAGES = [{"role": "user", "content": "Write a short story about a river."}]
+
+
+def test_identical_requests_are_cached(local_llm):
+    first = llm.chat(MESSAGES, "test.chat", model="gpt-4o", max_tokens=500)
+    assert llm.chat(MESSAGES, "test.chat", model="gpt-4o", max_tokens=500) == first
+    assert llm.get_cache().stats()["memory_hits"] == 1
+
+
+def test_truncated_replies_are_not_cached(local_llm):
+    llm.chat(MESSAGES, "test.chat", model="gpt-4o", max_tokens=5)
+    llm.chat(MESSAGES, "test.chat", model="gpt-4o", max_tokens=5)
+    ''.join(llm.chat(MESSAGES, "test.chat", model="gpt-4o", max_tokens=5, stream=True))
+    stats = llm.get_cache().stats()
+    assert stats["memory_hits"] + stats["disk_hits"] == 0
+    assert stats["memory_entries"] == 0
+
+
+def test_complete_streams_are_cached(local_llm):
+    streamed = ''.join(llm.chat(MESSAGES, "test.chat", model="gpt-4o", max_tokens=500, stream=True))
+    assert llm.chat(MESSAGES, "test.chat", model="gpt-4o", max_tokens=500) == streamed
@@ -0,0 +1,25 @@
+from leaf.mcq import validate_question
+
+OPTIONS = {"A": "A cat", "B": "A bird", "C": "A dog", "D": "A fish"}
+
+
+def question(answer):
+    return {"question": "Which animal barks?", "options": dict(OPTIONS), "answer": answer}
+
+
+def test_answer_letter_before_option_text():
+    assert validate_question(question("C) A dog"))["answer"] == "C"
+
+
+def test_labelled_answer():
+    assert validate_question(question("Answer: B"))["answer"] == "B"
+    assert validate_question(question("The answer is d"))["answer"] == "D"
+
+
+def test_lower_case_and_decorated_letters():
+    assert validate_question(question("b) because"))["answer"] == "B"
+    assert validate_question(question("(a)"))["answer"] == "A"
+
+
+def test_answer_without_letter_is_rejected():
+    assert validate_question(question("the dog")) is None
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from leaf.pipeline import Pipeline, Stage
+
+
+def make_pipeline(calls):
+    def record(name, func):
+        def run(*args):
+            calls.append(name)
+            return func(*args)
+        return run
+
+    return Pipeline("test", [
+        Stage("text", record("text", lambda topic: f"text about {topic}"), deps=["topic"]),
+        Stage("audio", record("audio", lambda text: f"audio of {text}"), deps=["text"]),
+        Stage("questions", record("questions", lambda text, count: [text] * count), deps=["text", "count"]),
+        Stage("saved", record("saved", lambda text: f"saved {text}"), deps=["text"], inline=True),
+    ])
+
+
+def test_runs_every_stage_once():
+    calls = []
+    run = make_pipeline(calls).run({"topic": "rivers", "count": 2})
+    assert run["questions"] == ["text about rivers"] * 2
+    assert sorted(calls) == ["audio", "questions", "saved", "text"]
+
+
+def test_unchanged_stages_are_memoized():
+    calls, memo = [], {}
+    pipeline = make_pipeline(calls)
+    pipeline.run({"topic": "rivers", "count": 2}, memo)
+    calls.clear()
+    run = pipeline.run({"topic": "rivers", "count": 3}, memo)
+    # Only the stage whose input changed runs again
+    assert calls == ["questions"]
+    assert run.timings["text"]["memoized"] and not run.timings["questions"]["memoized"]
+    assert run["saved"] == "saved text about rivers"
+
+
+def test_targets_limit_the_stages_run():
+    calls = []
+    run = make_pipeline(calls).run({"topic": "rivers", "count": 1}, targets=["saved"])
+    assert sorted(calls) == ["saved", "text"]
+    assert run.get("audio") is None
+
+
+def test_independent_stages_overlap():
+    barrier = threading.Barrier(2, timeout=2)
+    pipeline = Pipeline("overlap", [
+        Stage("a", lambda: barrier.wait(), deps=[]),
+        Stage("b", lambda: barrier.wait(), deps=[]),
+    ])
+    # Would time out if the two stages ran one after the other
+    pipeline.run({})
+
+
+def test_on_stage_and_errors():
+    seen = []
+
+    def fail(value):
+        raise ValueError(value)
+
+    pipeline = Pipeline("errors", [
+        Stage("ok", lambda value: value, deps=["value"]),
+        Stage("bad", fail, deps=["ok"]),
+    ])
+    with pytest.raises(ValueError):
+        pipeline.run({"value": 1}, on_stage=lambda name, output: seen.append(name))
+    assert seen == ["ok"]
+
+
+def test_on_tick_is_called_while_waiting():
+    ticks = []
+    pipeline = Pipeline("ticks", [Stage("slow", lambda: time.sleep(0.6), deps=[])])
+    pipeline.run({}, on_tick=lambda: ticks.append(1))
+    assert len(ticks) >= 2
@@ -0,0 +1,126 @@
+import contextvars
+import threading
+import time
+
+import pytest
+
+from leaf.scheduler import (PRIORITY_GENERATION, PRIORITY_GRADING, PRIORITY_PREFETCH, Scheduler,
+                            SchedulerTimeout, bind_session, current_session, priority_context, priority_for)
+
+LIMITS = {"default": {"rpm": 600, "tpm": 100000}}
+
+
+def waiting(scheduler):
+    return sum(row["waiting"] for row in scheduler.stats()["classes"])
+
+
+def grant_order(scheduler, requests):
+    """Queue requests (label, priority, session) on an empty bucket, in order; return the labels as granted."""
+    rpm, _ = scheduler._model_buckets("m")
+    rpm.tokens = 0
+    granted = []
+    threads = []
+    for count, (label, priority, session) in enumerate(requests, 1):
+        def acquire(label=label, priority=priority, session=session):
+            scheduler.acquire("m", 10, priority, session)
+            granted.append(label)
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        threads.append(thread)
+        # Enqueue one at a time, so arrival order is known
+        while waiting(scheduler) + len(granted) < count:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(5)
+    return granted
+
+
+def test_higher_priority_is_served_first():
+    scheduler = Scheduler(LIMITS)
+    order = grant_order(scheduler, [("prefetch", PRIORITY_PREFETCH, "a"), ("generation", PRIORITY_GENERATION, "b"),
+                                     ("grading", PRIORITY_GRADING, "c")])
+    assert order == ["grading", "generation", "prefetch"]
+
+
+def test_sessions_take_turns():
+    scheduler = Scheduler(LIMITS)
+    requests = [(f"busy{i}", PRIORITY_GENERATION, "busy") for i in range(3)]
+    requests.append(("quiet", PRIORITY_GENERATION, "quiet"))
+    order = grant_order(scheduler, requests)
+    assert order.index("quiet") <= 1
+
+
+def test_position_of_a_waiting_session():
+    scheduler = Scheduler(LIMITS)
+    rpm, _ = scheduler._model_buckets("m")
+    rpm.tokens = 0
+    rpm.rate = 0.001
+    deadline = time.monotonic() + 0.5
+
+    def acquire(session):
+        with pytest.raises(SchedulerTimeout):
+            scheduler.acquire("m", 10, PRIORITY_GENERATION, session, deadline=deadline)
+
+    threads = [threading.Thread(target=acquire, args=(session,)) for session in ("a", "b")]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    assert (scheduler.position("a"), scheduler.position("b"), scheduler.position("c")) == (0, 1, None)
+    for thread in threads:
+        thread.join(2)
+
+
+def test_unused_tokens_are_refunded():
+    scheduler = Scheduler({"default": {"rpm": 600, "tpm": 2000}})
+    ticket = scheduler.acquire("m", 1000)
+    scheduler.settle(ticket, 100)
+    tokens_left = scheduler.stats()["buckets"][0]["tokens_left"]
+    assert 1890 <= tokens_left <= 2000
+
+
+def test_deadline_ends_the_wait():
+    scheduler = Scheduler(LIMITS, max_wait_seconds=60)
+    rpm, _ = scheduler._model_buckets("m")
+    rpm.tokens = 0
+    rpm.rate = 0.001
+    start = time.monotonic()
+    with pytest.raises(SchedulerTimeout):
+        scheduler.acquire("m", 10, deadline=start + 0.2)
+    assert time.monotonic() - start < 1
+    assert scheduler.stats()["timeouts"] == 1
+    assert waiting(scheduler) == 0
+
+
+def test_priority_and_session_context():
+    assert priority_for("grading") == PRIORITY_GRADING
+    assert priority_for("passage") == PRIORITY_GENERATION
+    with priority_context(PRIORITY_PREFETCH):
+        assert priority_for("grading") == PRIORITY_PREFETCH
+
+    def bound():
+        bind_session("student-1")
+        return current_session()
+
+    assert contextvars.copy_context().run(bound) == "student-1"
+    assert current_session() is None
+
+
+def test_failed_attempts_are_refunded(local_llm, monkeypatch):
+    from leaf import llm
+    from leaf.providers import LocalProviderError
+
+    scheduler = Scheduler({"default": {"rpm": 600, "tpm": 20000}})
+    monkeypatch.setattr(llm, "get_scheduler", lambda: scheduler)
+    failures = iter([True, True])
+    chat = local_llm.chat
+
+    def flaky(timeout, **request):
+        if next(failures, False):
+            raise LocalProviderError("synthetic 429")
+        return chat(timeout, **request)
+
+    monkeypatch.setattr(local_llm, "chat", flaky)
+    monkeypatch.setitem(llm.get_section("llm"), "backoff_base", 0.001)
+    llm.chat([{"role": "user", "content": "hi"}], "test.chat", model="m", max_tokens=3000, cache=False)
+    # Only the successful attempt's actual usage stays charged, not three 3000-token estimates
+    assert scheduler.stats()["buckets"][0]["tokens_left"] > 19000
@@ -0,0 +1,35 @@
+from leaf.sentences import split_sentences
+
+
+def test_latin_sentences():
+    assert split_sentences("I like tea. Do you? Yes!") == ["I like tea.", "Do you?", "Yes!"]
+
+
+def test_closing_quotes_and_ellipsis_stay_with_the_sentence():
+    assert split_sentences('He said "Stop!" Then he left... We waited.') == \
+        ['He said "Stop!"', "Then he left...", "We waited."]
+
+
+def test_title_abbreviations_do_not_end_a_sentence():
+    assert split_sentences("Dr. Smith went home. Mrs. Brown stayed.") == \
+        ["Dr. Smith went home.", "Mrs. Brown stayed."]
+    assert split_sentences("Mr. Li likes fruit, e.g. apples. He eats them daily.") == \
+        ["Mr. Li likes fruit, e.g. apples.", "He eats them daily."]
+
+
+def test_language_specific_abbreviations():
+    assert split_sentences("Das ist z.B. Herr Müller. Er kommt.", "German") == \
+        ["Das ist z.B. Herr Müller.", "Er kommt."]
+    assert split_sentences("Sra. García llegó. Luego salió.", "Spanish") == ["Sra. García llegó.", "Luego salió."]
+
+
+def test_cjk_punctuation_needs_no_space():
+    assert split_sentences("我喜欢茶。你呢？好！") == ["我喜欢茶。", "你呢？", "好！"]
+
+
+def test_arabic_question_mark():
+    assert split_sentences("هل أنت بخير؟ نعم. شكرا!", "Arabic") == ["هل أنت بخير؟", "نعم.", "شكرا!"]
+
+
+def test_line_breaks_end_a_sentence():
+    assert split_sentences("First line\n\nSecond line.") == ["First line", "Second line."]
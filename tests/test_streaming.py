@@ -0,0 +1,53 @@
+import numpy as np
+
+from leaf.asr import SAMPLE_RATE
+from leaf.streaming import UtteranceSegmenter
+
+
+def tone(seconds, level=0.3):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (level * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_pause_ends_an_utterance():
+    segmenter = UtteranceSegmenter()
+    utterances = segmenter.feed(np.concatenate([silence(0.3), tone(1.0), silence(1.0)]))
+    assert len(utterances) == 1
+    start, samples = utterances[0]
+    assert abs(start - 0.3) < 0.05
+    assert 1.0 <= len(samples) / SAMPLE_RATE <= 1.8
+
+
+def test_utterances_across_chunks():
+    segmenter = UtteranceSegmenter()
+    audio = np.concatenate([tone(0.8), silence(1.0), tone(0.8), silence(1.0)])
+    utterances = []
+    for chunk in np.array_split(audio, 37):
+        utterances += segmenter.feed(chunk)
+    assert len(utterances) == 2
+    assert utterances[1][0] > utterances[0][0]
+
+
+def test_short_clicks_are_dropped():
+    segmenter = UtteranceSegmenter()
+    assert segmenter.feed(np.concatenate([tone(0.06), silence(1.0)])) == []
+
+
+def test_long_speech_is_cut_at_max_length():
+    segmenter = UtteranceSegmenter(max_utterance_s=2.0)
+    utterances = segmenter.feed(tone(5.0))
+    assert len(utterances) == 2
+    assert all(len(samples) / SAMPLE_RATE <= 2.0 for _, samples in utterances)
+
+
+def test_flush_returns_the_rest():
+    segmenter = UtteranceSegmenter()
+    assert segmenter.feed(tone(1.0)) == []
+    start, samples = segmenter.flush()
+    assert start == 0.0
+    assert len(samples) == SAMPLE_RATE
+    assert segmenter.flush() is None
@@ -0,0 +1,19 @@
+from leaf.telemetry import percentile, split_call_site
+
+
+def test_percentile_is_monotonic_for_few_samples():
+    assert percentile([2.0, 1.0], 50) == 1.0
+    assert percentile([2.0, 1.0], 95) == 2.0
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) is None
+
+
+def test_split_call_site():
+    assert split_call_site("reading.generate_questions") == ("reading", "generate_questions")
+    assert split_call_site("loadtest") == ("loadtest", "loadtest")
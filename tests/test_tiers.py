@@ -0,0 +1,61 @@
+import pytest
+
+from leaf import tiers
+
+ASR = {
+    "rtf_budget": 0.5,
+    "rtf_retry_seconds": 300,
+    "fallback_order": ["medium", "small", "base"],
+    "tiers": {
+        "medium": {"model_size": "medium", "compute_type": "int8", "beam_size": 5},
+        "small": {"model_size": "small", "compute_type": "int8", "beam_size": 5},
+        "base": {"model_size": "base", "compute_type": "int8", "beam_size": 1},
+    },
+    "languages": {
+        "default": [{"max_duration": 0, "tier": "medium"}],
+        "English": [{"max_duration": 60, "tier": "base"}, {"max_duration": 0, "tier": "small"}],
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def asr_config(monkeypatch):
+    monkeypatch.setattr(tiers, "get_section", lambda name: ASR)
+    monkeypatch.setattr(tiers, "_rtf", {})
+
+
+def test_rules_by_language_and_duration():
+    assert tiers.select_tier("English", 30)["name"] == "base"
+    assert tiers.select_tier("English", 120)["name"] == "small"
+    assert tiers.select_tier("Greek", 30)["name"] == "medium"
+
+
+def test_steps_down_while_over_budget():
+    tiers.record_rtf("medium", 10, 9)
+    tier = tiers.select_tier("Greek", 30)
+    assert (tier["name"], tier["preferred"]) == ("small", "medium")
+    tiers.record_rtf("small", 10, 8)
+    assert tiers.select_tier("Greek", 30)["name"] == "base"
+
+
+def test_within_budget_keeps_the_preferred_tier():
+    tiers.record_rtf("medium", 10, 2)
+    assert tiers.select_tier("Greek", 30)["name"] == "medium"
+
+
+def test_stale_measurements_are_retried(monkeypatch):
+    tiers.record_rtf("medium", 10, 9)
+    now = tiers.time.monotonic()
+    monkeypatch.setattr(tiers.time, "monotonic", lambda: now + 301)
+    assert tiers.select_tier("Greek", 30)["name"] == "medium"
+
+
+def test_rtf_is_smoothed():
+    tiers.record_rtf("small", 10, 10)
+    tiers.record_rtf("small", 10, 0)
+    assert tiers.measured_rtf("small") == pytest.approx(0.7)
+
+
+def test_transcribe_options():
+    options = tiers.transcribe_options(tiers.select_tier("English", 30))
+    assert options == {"model_size": "base", "compute_type": "int8", "beam_size": 1, "tier": "base"}
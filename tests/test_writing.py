@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+from leaf import writing
+from leaf.cache import TieredCache
+
+SENTENCES = ["I like tea.", "It are good."]
+
+
+def grade_all(lang, batch):
+    return {i: {"score": 7, "improved": sentence, "comment": "stand-in"} for i, sentence in enumerate(batch)}
+
+
+def use_provider(monkeypatch, name, grade_batch):
+    monkeypatch.setattr(writing, "get_provider", lambda: SimpleNamespace(name=name))
+    monkeypatch.setattr(writing, "_grade_batch", grade_batch)
+
+
+def test_sentence_grades_are_reused(monkeypatch, tmp_path):
+    monkeypatch.setattr(writing, "_cache", TieredCache(str(tmp_path)))
+    monkeypatch.setattr(writing, "record_quality", lambda *args: None)
+    use_provider(monkeypatch, "local", grade_all)
+    writing.grade_sentences("English", SENTENCES)
+    use_provider(monkeypatch, "local", lambda lang, batch: {})
+    grades = writing.grade_sentences("English", SENTENCES)
+    assert all(grade["reused"] for grade in grades)
+
+
+def test_local_grades_are_not_served_to_openai(monkeypatch, tmp_path):
+    monkeypatch.setattr(writing, "_cache", TieredCache(str(tmp_path)))
+    monkeypatch.setattr(writing, "record_quality", lambda *args: None)
+    use_provider(monkeypatch, "local", grade_all)
+    writing.grade_sentences("English", SENTENCES)
+    # The real provider must grade the sentences itself
+    use_provider(monkeypatch, "openai", lambda lang, batch: {})
+    assert writing.grade_sentences("English", SENTENCES) == [None, None]